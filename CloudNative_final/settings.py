@@ -11,8 +11,10 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+import copy
 import os 
-from decouple import config
+import sys
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -39,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.humanize',
+    'django.contrib.postgres',  # 全文檢索 / pg_trgm（menu/search.py）
     'users',
     'staff',
     'menu',
@@ -79,15 +82,27 @@ CACHES = {
         'KEY_PREFIX': 'cloudnative_final',
         'VERSION': 1,
 
-    }
+    },
+    # {% cache %} 模板片段（菜單卡片）：每個 worker 行程內各一份，key 帶菜單目錄版本，改菜單後自然換新
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template_fragments',
+        'TIMEOUT': 60 * 15,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
 }
 
+# 訂單事件佇列（orders/events.py）：Redis Stream，測試可改用 orders.events.LocalQueueBackend
+ORDER_EVENTS_BACKEND = config('ORDER_EVENTS_BACKEND', default='orders.events.RedisStreamBackend')
+
+# 購物車（menu/cart.py）：Redis hash，測試可改用 menu.cart.LocalCartBackend
+CART_BACKEND = config('CART_BACKEND', default='menu.cart.RedisCartBackend')
+
 # Session 設定 - 使用 Redis 儲存
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'
 
 MIDDLEWARE = [
-    'django.middleware.cache.UpdateCacheMiddleware',  # 加在最前面（全站快取）
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # 靜態檔案服務
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -96,14 +111,12 @@ MIDDLEWARE = [
     'django.middleware.locale.LocaleMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'common.db_router.replica_pinning_middleware',  # 寫入後暫時讀主庫（read-your-writes）
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'django.middleware.cache.FetchFromCacheMiddleware',  # 加在最後面（全站快取）
 ]
 
-# 全站快取設定（可選，比較激進）
-CACHE_MIDDLEWARE_ALIAS = 'default'
-CACHE_MIDDLEWARE_SECONDS = 300  # 快取 5 分鐘
-CACHE_MIDDLEWARE_KEY_PREFIX = 'site_cache'
+# 不使用全站快取 middleware：它依 Cookie 分版本，登入使用者與帶 CSRF cookie 的請求幾乎都不會命中。
+# 匿名整頁快取見 common/page_cache.py，菜單卡片以 {% cache %} 片段快取（template_fragments）
 
 ROOT_URLCONF = 'CloudNative_final.urls'
 
@@ -124,6 +137,7 @@ TEMPLATES = [
                 'django.template.context_processors.i18n',
                 'django.template.context_processors.media',
                 'django.template.context_processors.static',
+                'menu.context_processors.cart',
             ],
         },
     },
@@ -134,6 +148,20 @@ WSGI_APPLICATION = 'CloudNative_final.wsgi.application'
 # Database - PostgreSQL 設定
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# 資料庫連線管理
+# - SERVER_MODE=wsgi：持續連線 DB_CONN_MAX_AGE 秒，每個請求開始前先檢查連線是否仍可用（CONN_HEALTH_CHECKS）
+# - SERVER_MODE=asgi（預設）且沒有開啟 DB_POOL / DB_PGBOUNCER：每個 sync_to_async 執行緒各自握一條連線，
+#   持續連線只會越積越多，因此強制 CONN_MAX_AGE=0（每個請求結束即關閉）
+# - DB_POOL：psycopg 行程內連線池；ASGI 模式下每個請求的 ORM 在不同執行緒執行，持續連線無法重用，
+#   正式環境以 ASGI 執行時由部署設定開啟（k8s/configmap.yaml）；預設關閉，本機與測試不需要 psycopg_pool
+# - DB_PGBOUNCER：經由 pgbouncer transaction pooling 連線，同一 session 不保證落在同一條後端連線，
+#   因此停用 server-side cursor 與 psycopg 自動 prepared statement（匯出改以 keyset 分批讀取，見 common/export.py）
+SERVER_MODE = config('SERVER_MODE', default='asgi')
+DB_PGBOUNCER = config('DB_PGBOUNCER', default=False, cast=bool)
+DB_POOL = config('DB_POOL', default=False, cast=bool) and not DB_PGBOUNCER
+# 連線池由池管理連線壽命，Django 規定 CONN_MAX_AGE 必須為 0
+DB_PERSISTENT = not DB_POOL and (SERVER_MODE != 'asgi' or DB_PGBOUNCER)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -142,11 +170,50 @@ DATABASES = {
         'PASSWORD': config('DB_PASSWORD', default='password'),
         'HOST': config('DB_HOST', default='localhost'),
         'PORT': config('DB_PORT', default='5432'),
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int) if DB_PERSISTENT else 0,
+        'CONN_HEALTH_CHECKS': True,
+        'DISABLE_SERVER_SIDE_CURSORS': DB_PGBOUNCER,
         'OPTIONS': {
             'connect_timeout': 10,
         },
     }
 }
+if DB_POOL:
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+        'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+        'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+    }
+if DB_PGBOUNCER:
+    DATABASES['default']['OPTIONS']['prepare_threshold'] = None
+
+# 讀取副本（common/db_router.py）：DB_REPLICA_HOSTS 以逗號分隔，每台副本一個 alias（replica_1、replica_2…），
+# 其餘連線設定沿用主庫。
+DATABASE_REPLICAS = []
+for index, host in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv()), start=1):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'OPTIONS': copy.deepcopy(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+# manage.py test：多一個指向同一個測試資料庫的 alias（TEST MIRROR）當作副本，
+# 路由測試以 override_settings(DATABASE_REPLICAS=['replica']) 啟用，確認讀取真的走另一條連線
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+if TESTING:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'OPTIONS': copy.deepcopy(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['common.db_router.ReplicaRouter']
+DATABASE_REPLICA_APPS = ('menu', 'orders', 'reviews')
+REPLICA_MAX_LAG = config('DB_REPLICA_MAX_LAG', default=5, cast=float)  # 秒，超過就改讀主庫
+REPLICA_STICKY_SECONDS = config('DB_REPLICA_STICKY_SECONDS', default=10, cast=int)  # 寫入後固定讀主庫的秒數
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
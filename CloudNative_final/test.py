@@ -13,6 +13,7 @@ class HealthCheckTests(TestCase):
         self.assertEqual(response.json(), {
             'status': 'healthy',
             'database': 'connected',
+            'cache': 'connected',
             'message': 'All systems operational'
         })
 
@@ -26,3 +27,14 @@ class HealthCheckTests(TestCase):
         self.assertEqual(response.json()['status'], 'unhealthy')
         self.assertEqual(response.json()['database'], 'disconnected')
         self.assertIn('error', response.json())
+
+
+    @patch('CloudNative_final.views.async_cache')
+    def test_health_check_cache_failure(self, mock_async_cache):
+        """模擬 Redis 連線失敗，回傳 503 並標示快取斷線"""
+        mock_async_cache.return_value.ping.side_effect = ConnectionError("Redis is down")
+
+        response = self.client.get('/health/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['database'], 'connected')
+        self.assertEqual(response.json()['cache'], 'disconnected')
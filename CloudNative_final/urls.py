@@ -28,6 +28,8 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('users/', include('users.urls')),
     path('menu/', include(('menu.urls', 'menu'), namespace='menu')),
+    # 行動 App 用唯讀菜單 JSON（menu/api.py）
+    path('api/menu/', include('menu.api_urls', namespace='menu_api')),
     path('', RedirectView.as_view(pattern_name='menu:dish_list'), name='home'),
     path('orders/', include('orders.urls')),
     path('reviews/', include('reviews.urls', namespace='reviews')),
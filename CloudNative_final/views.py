@@ -1,30 +1,52 @@
 # CloudNative_final/views.py
+from asgiref.sync import sync_to_async
 from django.http import JsonResponse
 from django.db import connection
 import logging
 
+from common.cache import async_cache
+
 logger = logging.getLogger(__name__)
 
-def health_check(request):
+
+@sync_to_async
+def _check_database():
+    # Django 尚未提供非同步的 cursor，在執行緒中執行
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+
+
+async def health_check(request):
     """
     系統健康檢查端點
-    檢查資料庫連線狀態
+    檢查資料庫與 Redis（快取 / session）連線狀態；async view，探針請求不佔用 worker
     """
     try:
         # 檢查 PostgreSQL 資料庫連線
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT 1")
-        
-        return JsonResponse({
-            'status': 'healthy',
-            'database': 'connected',
-            'message': 'All systems operational'
-        })
-    
+        await _check_database()
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         return JsonResponse({
             'status': 'unhealthy',
             'database': 'disconnected',
             'error': str(e)
-        }, status=503)
\ No newline at end of file
+        }, status=503)
+
+    try:
+        # 檢查 Redis 連線（非同步 client）
+        await async_cache().ping()
+    except Exception as e:
+        logger.error(f"Health check failed: {e}")
+        return JsonResponse({
+            'status': 'unhealthy',
+            'database': 'connected',
+            'cache': 'disconnected',
+            'error': str(e)
+        }, status=503)
+
+    return JsonResponse({
+        'status': 'healthy',
+        'database': 'connected',
+        'cache': 'connected',
+        'message': 'All systems operational'
+    })
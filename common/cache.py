@@ -0,0 +1,480 @@
+# common/cache.py
+"""
+以「標籤版本」管理快取失效
+
+每個快取值都掛在一或多個標籤（tag）底下，例如 ``menu``、``dish:3``、
+``user_orders:7``。實際的 Redis key 會帶上各標籤目前的版本號，
+失效時只需把標籤版本 +1（一次 INCR），舊的 key 就再也不會被讀到，
+等 TTL 到期自然淘汰，不再需要 KEYS / SCAN / delete_pattern。
+
+菜單目錄這類「所有人相同、一天只改幾次」的資料可加上 local=True，
+在每個 worker 行程內再放一層 LRU（L1），Redis 為 L2。
+L1 以帶版本的 key 存放，標籤版本本身在行程內最多沿用 L1_VERSION_TTL 秒，
+因此穩定狀態下讀取完全不需連線 Redis；其他 worker 改動菜單後，最多延遲這麼久就會看到新版本。
+
+非同步 view（ASGI）使用 a 開頭的版本（aget_tag_versions / aget_or_compute），
+Redis 改走 redis.asyncio 連線，key 組法與序列化沿用 django_redis，與同步版本讀寫同一份資料。
+"""
+import asyncio
+import math
+import random
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+
+from common.db_router import use_primary
+
+# 快取時間（秒）
+MENU_TIMEOUT = 60 * 15
+SEARCH_TIMEOUT = 60 * 5
+REVIEWS_TIMEOUT = 60 * 10
+ORDER_TIMEOUT = 60 * 5
+DISH_SNAPSHOT_TIMEOUT = 60 * 30
+
+# 行程內 L1
+L1_MAX_ENTRIES = 2048
+L1_TIMEOUT = 60 * 5
+L1_VERSION_TTL = 2
+
+# get_or_compute：邏輯過期後仍保留舊值的時間、重算鎖的存活 / 等待時間、提前重算係數
+STALE_TIMEOUT = 60 * 5
+
+# 標籤版本 key 的存活時間：任何 pk 都可能產生版本 key（例如不存在菜品的 ETag），不能永久保留。
+# 長於所有快取值的存活時間（最長 DISH_SNAPSHOT_TIMEOUT + STALE_TIMEOUT）；
+# 過期後以 _new_version 重新初始化，舊版本的快取值只是讀不到，不會讀到過期資料
+VERSION_TIMEOUT = 60 * 60
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 2
+EARLY_REFRESH_BETA = 1.0
+
+MENU_TAG = 'menu'
+
+_MISSING = object()
+
+
+def dish_tag(dish_id):
+    return f'dish:{dish_id}'
+
+
+def order_tag(order_id):
+    return f'order:{order_id}'
+
+
+def user_orders_tag(user_id):
+    return f'user_orders:{user_id}'
+
+
+class LocalLRU:
+    """執行緒安全的行程內 LRU，每筆資料各自帶到期時間"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# 值存放於 _local，標籤版本存放於 _local_versions
+_local = LocalLRU(L1_MAX_ENTRIES)
+_local_versions = LocalLRU(L1_MAX_ENTRIES)
+
+
+def clear():
+    """清除 Redis 與本行程 L1（測試用）"""
+    cache.clear()
+    _local.clear()
+    _local_versions.clear()
+
+
+def _version_key(tag):
+    return f'tag_version:{tag}'
+
+
+def _new_version():
+    # 以時間當初始版本，即使版本 key 被淘汰也不會與舊版本號重複
+    return int(time.time() * 1000)
+
+
+def get_tag_versions(tags, local=False):
+    """
+    一次 get_many 取回所有標籤版本，缺少的標籤即時初始化
+    local=True 時先看行程內剛取得的版本，全部命中就不連線 Redis
+    """
+    result = {}
+    if local:
+        for tag in tags:
+            version = _local_versions.get(tag)
+            if version is not None:
+                result[tag] = version
+        tags = [tag for tag in tags if tag not in result]
+        if not tags:
+            return result
+        result.update(get_tag_versions(tags))
+        for tag in tags:
+            _local_versions.set(tag, result[tag], L1_VERSION_TTL)
+        return result
+
+    keys = {_version_key(tag): tag for tag in tags}
+    versions = cache.get_many(list(keys))
+    for key, tag in keys.items():
+        version = versions.get(key)
+        if version is None:
+            version = _new_version()
+            if not cache.add(key, version, VERSION_TIMEOUT):
+                version = cache.get(key, version)
+        result[tag] = version
+    return result
+
+
+def tagged_key(key, tags, versions=None):
+    """組出帶有標籤版本的實際快取 key"""
+    if versions is None:
+        versions = get_tag_versions(tags)
+    suffix = ':'.join(f'{tag}={versions[tag]}' for tag in tags)
+    return f'{key}|{suffix}'
+
+
+def get(key, tags, default=None, local=False):
+    if not local:
+        return cache.get(tagged_key(key, tags), default)
+
+    real_key = tagged_key(key, tags, get_tag_versions(tags, local=True))
+    value = _local.get(real_key, _MISSING)
+    if value is _MISSING:
+        value = cache.get(real_key, _MISSING)
+        if value is _MISSING:
+            return default
+        _local.set(real_key, value, L1_TIMEOUT)
+    return value
+
+
+def set(key, value, tags, timeout, local=False):
+    real_key = tagged_key(key, tags, get_tag_versions(tags, local=local))
+    cache.set(real_key, value, timeout)
+    if local:
+        _local.set(real_key, value, min(timeout, L1_TIMEOUT))
+
+
+def get_many(entries, local=False):
+    """
+    entries 為 {key: tags}；標籤版本與快取值各一次 get_many（local=True 時 L1 命中的不連線）
+    回傳 {key: value}，只包含命中的 key
+    """
+    versions = get_tag_versions({tag for tags in entries.values() for tag in tags}, local=local)
+    real_keys = {tagged_key(key, tags, versions): key for key, tags in entries.items()}
+    result = {}
+    if local:
+        for real_key, key in real_keys.items():
+            value = _local.get(real_key, _MISSING)
+            if value is not _MISSING:
+                result[key] = value
+    remaining = [real_key for real_key, key in real_keys.items() if key not in result]
+    if remaining:
+        for real_key, value in cache.get_many(remaining).items():
+            result[real_keys[real_key]] = value
+            if local:
+                _local.set(real_key, value, L1_TIMEOUT)
+    return result
+
+
+def set_many(entries, timeout, local=False):
+    """entries 為 {key: (value, tags)}"""
+    versions = get_tag_versions({tag for _, tags in entries.values() for tag in tags}, local=local)
+    values = {tagged_key(key, tags, versions): value for key, (value, tags) in entries.items()}
+    cache.set_many(values, timeout)
+    if local:
+        for real_key, value in values.items():
+            _local.set(real_key, value, min(timeout, L1_TIMEOUT))
+
+
+def _should_refresh(envelope):
+    """
+    機率式提前重算（XFetch）：越接近過期、重算越久，越可能由某個請求提前重算，
+    讓各 pod 不會在同一瞬間一起過期
+    """
+    jitter = -envelope['delta'] * EARLY_REFRESH_BETA * math.log(1 - random.random())
+    return time.time() + jitter >= envelope['expires_at']
+
+
+def _recompute(real_key, compute, timeout, local):
+    started = time.monotonic()
+    # 重算結果會以新版本快取整個 TTL，不能讀到落後的副本（見 common/db_router.py）
+    with use_primary():
+        value = compute()
+    envelope = {'value': value, 'expires_at': time.time() + timeout, 'delta': time.monotonic() - started}
+    cache.set(real_key, envelope, timeout + STALE_TIMEOUT)
+    if local:
+        _local.set(real_key, envelope, min(timeout, L1_TIMEOUT))
+    return value
+
+
+def get_or_compute(key, tags, compute, timeout, local=False):
+    """
+    取快取，沒有就呼叫 compute() 重算並寫回；熱門 key 過期時不會讓所有 worker 同時打資料庫：
+
+    - single-flight：以 cache.add（Redis SET NX）搶重算鎖，同一個 key 同時只有一個請求重算
+    - stale-while-revalidate：值在 timeout 後邏輯過期，但再保留 STALE_TIMEOUT 秒；
+      重算期間其他請求直接拿舊值
+    - 機率式提前重算：過期前就可能由單一請求先重算（_should_refresh）
+    標籤失效後沒有舊值可用，其他請求最多等待 LOCK_WAIT 秒讓搶到鎖的請求算完
+    """
+    real_key = tagged_key(key, tags, get_tag_versions(tags, local=local))
+    envelope = _local.get(real_key) if local else None
+    if envelope is None or _should_refresh(envelope):
+        fresh = cache.get(real_key)
+        if fresh is not None:
+            envelope = fresh
+            if local:
+                _local.set(real_key, envelope, min(timeout, L1_TIMEOUT))
+    if envelope is not None and not _should_refresh(envelope):
+        return envelope['value']
+
+    lock_key = f'{real_key}|lock'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            return _recompute(real_key, compute, timeout, local)
+        finally:
+            cache.delete(lock_key)
+
+    if envelope is not None:
+        return envelope['value']
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        envelope = cache.get(real_key)
+        if envelope is not None:
+            return envelope['value']
+    # 搶到鎖的請求太慢（或已失敗），自行重算，避免請求一直卡住
+    return _recompute(real_key, compute, timeout, local)
+
+
+class AsyncRedisCache:
+    """
+    django_redis 的非同步讀寫：以 django_redis client 組 key、編碼 / 解碼，實際 I/O 走 redis.asyncio
+    redis.asyncio 的連線綁定建立它的 event loop，因此每個 loop 各自一個 client
+    """
+    _clients = weakref.WeakKeyDictionary()
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @property
+    def redis(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            import redis.asyncio
+            options = settings.CACHES['default'].get('OPTIONS', {})
+            client = self._clients[loop] = redis.asyncio.from_url(
+                settings.CACHES['default']['LOCATION'], **options.get('CONNECTION_POOL_KWARGS', {})
+            )
+        return client
+
+    def _key(self, key):
+        return self.backend.client.make_key(key)
+
+    def _decode(self, raw, default=None):
+        return default if raw is None else self.backend.client.decode(raw)
+
+    async def get(self, key, default=None):
+        return self._decode(await self.redis.get(self._key(key)), default)
+
+    async def get_many(self, keys):
+        raws = await self.redis.mget([self._key(key) for key in keys]) if keys else []
+        return {key: self._decode(raw) for key, raw in zip(keys, raws) if raw is not None}
+
+    async def set(self, key, value, timeout):
+        await self.redis.set(self._key(key), self.backend.client.encode(value), ex=timeout)
+
+    async def add(self, key, value, timeout):
+        return bool(await self.redis.set(self._key(key), self.backend.client.encode(value), ex=timeout, nx=True))
+
+    async def delete(self, key):
+        await self.redis.delete(self._key(key))
+
+    async def ping(self):
+        return await self.redis.ping()
+
+
+class AsyncCache:
+    """其他快取後端（測試用的 LocMemCache 等）：使用 Django 內建的 a* 方法"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def get(self, key, default=None):
+        return await self.backend.aget(key, default)
+
+    async def get_many(self, keys):
+        return await self.backend.aget_many(keys)
+
+    async def set(self, key, value, timeout):
+        await self.backend.aset(key, value, timeout)
+
+    async def add(self, key, value, timeout):
+        return await self.backend.aadd(key, value, timeout)
+
+    async def delete(self, key):
+        await self.backend.adelete(key)
+
+    async def ping(self):
+        await self.backend.aget('ping')
+        return True
+
+
+def async_cache():
+    backend = caches['default']
+    if _is_django_redis(backend):
+        return AsyncRedisCache(backend)
+    return AsyncCache(backend)
+
+
+async def aget_tag_versions(tags, local=False):
+    """get_tag_versions 的非同步版本"""
+    result = {}
+    if local:
+        for tag in tags:
+            version = _local_versions.get(tag)
+            if version is not None:
+                result[tag] = version
+        tags = [tag for tag in tags if tag not in result]
+        if not tags:
+            return result
+        result.update(await aget_tag_versions(tags))
+        for tag in tags:
+            _local_versions.set(tag, result[tag], L1_VERSION_TTL)
+        return result
+
+    l2 = async_cache()
+    keys = {_version_key(tag): tag for tag in tags}
+    versions = await l2.get_many(list(keys))
+    for key, tag in keys.items():
+        version = versions.get(key)
+        if version is None:
+            version = _new_version()
+            if not await l2.add(key, version, VERSION_TIMEOUT):
+                version = await l2.get(key, version)
+        result[tag] = version
+    return result
+
+
+async def _arecompute(l2, real_key, compute, timeout, local):
+    started = time.monotonic()
+    with use_primary():
+        value = await compute()
+    envelope = {'value': value, 'expires_at': time.time() + timeout, 'delta': time.monotonic() - started}
+    await l2.set(real_key, envelope, timeout + STALE_TIMEOUT)
+    if local:
+        _local.set(real_key, envelope, min(timeout, L1_TIMEOUT))
+    return value
+
+
+async def aget_or_compute(key, tags, compute, timeout, local=False):
+    """get_or_compute 的非同步版本；compute 為 async 函式"""
+    l2 = async_cache()
+    real_key = tagged_key(key, tags, await aget_tag_versions(tags, local=local))
+    envelope = _local.get(real_key) if local else None
+    if envelope is None or _should_refresh(envelope):
+        fresh = await l2.get(real_key)
+        if fresh is not None:
+            envelope = fresh
+            if local:
+                _local.set(real_key, envelope, min(timeout, L1_TIMEOUT))
+    if envelope is not None and not _should_refresh(envelope):
+        return envelope['value']
+
+    lock_key = f'{real_key}|lock'
+    if await l2.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            return await _arecompute(l2, real_key, compute, timeout, local)
+        finally:
+            await l2.delete(lock_key)
+
+    if envelope is not None:
+        return envelope['value']
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        envelope = await l2.get(real_key)
+        if envelope is not None:
+            return envelope['value']
+    return await _arecompute(l2, real_key, compute, timeout, local)
+
+
+def _is_django_redis(backend):
+    return type(backend).__module__.startswith('django_redis')
+
+
+def _incr_versions(keys):
+    """
+    一次把多個標籤版本 +1，回傳新版本
+    django_redis：所有 INCR 放進同一個 pipeline，一次網路往返；版本 key 已被淘汰時 INCR 會從 1 開始，
+    改寫成以時間為準的新版本（_new_version），避免與被淘汰前的舊版本號重複
+    """
+    backend = caches['default']
+    if _is_django_redis(backend):
+        pipeline = backend.client.get_client(write=True).pipeline(transaction=False)
+        for key in keys:
+            pipeline.incr(backend.client.make_key(key))
+        versions = pipeline.execute()
+        recreated = {key: _new_version() for key, version in zip(keys, versions) if version == 1}
+        if recreated:
+            backend.set_many(recreated, VERSION_TIMEOUT)
+        return [recreated.get(key, version) for key, version in zip(keys, versions)]
+
+    versions = []
+    for key in keys:
+        try:
+            version = backend.incr(key)
+        except ValueError:
+            version = _new_version()
+            backend.set(key, version, VERSION_TIMEOUT)
+        versions.append(version)
+    return versions
+
+
+def _bump(tags):
+    versions = _incr_versions([_version_key(tag) for tag in tags])
+    for tag, version in zip(tags, versions):
+        # 本行程立即改用新版本；其他 worker 的 L1 版本最多 L1_VERSION_TTL 秒後過期
+        _local_versions.set(tag, version, L1_VERSION_TTL)
+
+
+def invalidate_tags(*tags):
+    """
+    讓標籤底下所有快取失效（每個標籤 O(1)，一次呼叫的所有標籤共用一次 Redis 往返）
+    交易中呼叫時，commit 後會再 bump 一次，避免 commit 前被其他請求以舊資料回填
+    """
+    _bump(tags)
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _bump(tags))
@@ -0,0 +1,101 @@
+# common/compression.py
+"""
+預先壓縮的回應內容
+
+快取填入時就把內容壓好（gzip，安裝 brotli 時另加 br），與快取值存在一起；
+命中時只依 Accept-Encoding 挑一份現成的 bytes，壓縮成本是每次填快取一次，而不是每個回應一次。
+
+HTML 頁面內含每個請求各自的 CSRF token（common/page_cache.py 的佔位字串），整份無法共用。
+這類內容以佔位字串切段，各段先壓成 raw deflate 並做 Z_FULL_FLUSH（之後的資料不會回頭參照前段），
+回應時只壓縮 token 本身，再把各段接成一個合法的 gzip 串流。
+token 不與頁面其他內容（例如搜尋字串）共用壓縮字典，也順帶避免 BREACH 類攻擊。
+"""
+import gzip
+import struct
+import zlib
+
+try:
+    import brotli
+except ImportError:  # 可選套件；沒有安裝時只提供 gzip
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 11  # 每次填快取才壓縮一次，可用最高壓縮率
+MIN_SIZE = 200  # 太小的內容壓縮後反而變大
+
+# mtime=0、XFL=0、OS=255（unknown），與 gzip.compress(mtime=0) 相同格式
+_GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+
+def _raw_deflate(data, mode):
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(mode)
+
+
+_FINAL_BLOCK = _raw_deflate(b'', zlib.Z_FINISH)
+
+
+def precompress(body, placeholder=None):
+    """
+    回傳可存入快取的 dict：
+    {'parts': 以 placeholder 切開的原文, 'gzip' / 'br': 完整壓縮內容（無 placeholder 時）,
+     'deflated': 各段的 raw deflate（有 placeholder 時）}
+    """
+    parts = body.split(placeholder) if placeholder else [body]
+    entry = {'parts': parts}
+    if len(body) < MIN_SIZE:
+        return entry
+    if len(parts) == 1:
+        entry['gzip'] = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        if brotli is not None:
+            entry['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        entry['deflated'] = [_raw_deflate(part, zlib.Z_FULL_FLUSH) for part in parts]
+    return entry
+
+
+def accepted_encodings(request):
+    """Accept-Encoding 中 q > 0 的編碼"""
+    accepted = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, param = item.partition(';')
+        name, _, value = param.strip().partition('=')
+        try:
+            quality = float(value) if name == 'q' else 1.0
+        except ValueError:
+            quality = 1.0
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def pick_encoding(request, entry):
+    """br > gzip > 不壓縮"""
+    accepted = accepted_encodings(request)
+    if 'br' in entry and 'br' in accepted:
+        return 'br'
+    if ('gzip' in entry or 'deflated' in entry) and 'gzip' in accepted:
+        return 'gzip'
+    return 'identity'
+
+
+def _join_gzip(entry, filler):
+    filler_block = _raw_deflate(filler, zlib.Z_FULL_FLUSH)
+    blocks = [_GZIP_HEADER]
+    for index, block in enumerate(entry['deflated']):
+        if index:
+            blocks.append(filler_block)
+        blocks.append(block)
+    blocks.append(_FINAL_BLOCK)
+    body = filler.join(entry['parts'])
+    blocks.append(struct.pack('<II', zlib.crc32(body), len(body) & 0xffffffff))
+    return b''.join(blocks)
+
+
+def encode(entry, coding, filler=b''):
+    """依選定的編碼組出回應內容；filler 為取代 placeholder 的 bytes"""
+    if coding == 'identity':
+        return filler.join(entry['parts'])
+    if coding in entry:
+        return entry[coding]
+    return _join_gzip(entry, filler)
@@ -0,0 +1,95 @@
+# common/conditional.py
+"""
+條件式 GET（ETag / Last-Modified）
+
+ETag 由快取標籤版本（common/cache.py）組成，標籤在資料變動時就會 bump，
+因此判斷 304 只需讀標籤版本（L1 / Redis），不必渲染模板也不必查資料庫。
+頁面內容還會因語言、登入者與 CSRF secret 而不同，這些也一併納入 ETag。
+
+這些 view 是 async view（ASGI），Django 內建的 condition 只接受同步的 etag_func，
+因此以 acondition 包裝：etag / last_modified 函式都是 async，回傳 None 時該請求不做條件判斷。
+"""
+import datetime
+import hashlib
+from functools import wraps
+
+from django.middleware.csrf import get_token
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.cache import cache_control
+
+from common import cache as tagged_cache
+from common.compression import accepted_encodings
+
+# 允許瀏覽器保存，但每次使用前都要帶 If-None-Match 回來驗證（取代 never_cache 的 no-store）
+revalidate = cache_control(private=True, no_cache=True, max_age=0)
+
+
+def _has_pending_messages(request):
+    return 'messages' in request.COOKIES
+
+
+def _csrf_secret(request):
+    # 頁面上的 CSRF token 由 secret 產生；第一次造訪時先產生 secret（回應會帶上 cookie），
+    # 下一次請求帶回同一個 secret，ETag 才會一致
+    get_token(request)
+    return request.META.get('CSRF_COOKIE', '')
+
+
+async def amake_etag(request, tags, *parts, local=False, csrf=True):
+    """
+    tags 為頁面依賴的快取標籤；parts 為其他會影響輸出的值（例如查詢字串、購物車數量）
+    含表單的 HTML 頁面保留 csrf=True；JSON API 不含 CSRF token 可設為 False
+    有待顯示的 flash 訊息時回傳 None，讓頁面照常渲染
+    """
+    if _has_pending_messages(request):
+        return None
+    versions = await tagged_cache.aget_tag_versions(tags, local=local)
+    user = await request.auser()
+    raw = '|'.join(str(part) for part in (
+        *(f'{tag}={versions[tag]}' for tag in tags),
+        getattr(request, 'LANGUAGE_CODE', ''),
+        user.pk if user.is_authenticated else 'anonymous',
+        _csrf_secret(request) if csrf else '',
+        # 快取頁面依 Accept-Encoding 回傳不同編碼（common/compression.py），strong ETag 也要分開
+        ','.join(sorted(accepted_encodings(request) & {'br', 'gzip'})),
+        *parts,
+    ))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+async def acached_last_modified(key, tags, compute, local=False):
+    """
+    以標籤快取最後修改時間，compute()（async）只在標籤失效後執行一次查詢
+    ETag 優先於 If-Modified-Since，因此 Last-Modified 只需涵蓋欄位上有時間戳記的變動
+    """
+    return await tagged_cache.aget_or_compute(key, tags, compute, tagged_cache.MENU_TIMEOUT, local=local)
+
+
+def acondition(etag_func=None, last_modified_func=None):
+    """django.views.decorators.http.condition 的 async 版本（etag / last_modified 函式皆為 async）"""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            res_last_modified = None
+            if last_modified_func:
+                if dt := await last_modified_func(request, *args, **kwargs):
+                    if not timezone.is_aware(dt):
+                        dt = timezone.make_aware(dt, datetime.timezone.utc)
+                    res_last_modified = int(dt.timestamp())
+            res_etag = await etag_func(request, *args, **kwargs) if etag_func else None
+            res_etag = quote_etag(res_etag) if res_etag is not None else None
+
+            response = get_conditional_response(request, etag=res_etag, last_modified=res_last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+
+            if request.method in ('GET', 'HEAD'):
+                if res_last_modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(res_last_modified)
+                if res_etag:
+                    response.headers.setdefault('ETag', res_etag)
+            return response
+        return wrapper
+    return decorator
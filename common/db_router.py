@@ -0,0 +1,175 @@
+# common/db_router.py
+"""
+讀取副本（read replica）路由
+
+settings.DATABASE_REPLICAS 列出副本的 DATABASES alias；沒有設定副本時所有查詢照常走主庫（default）。
+只有以 read_from_replica 包裝的 view 會把讀取送往副本，而且：
+
+- 寫入一律走主庫；只有 DATABASE_REPLICA_APPS 內的 model 會讀副本（登入者、session 等仍讀主庫）
+- read-your-writes：replica_pinning_middleware 在非 GET/HEAD 請求後，讓該 session 在
+  REPLICA_STICKY_SECONDS 秒內都讀主庫（例如結帳、送出評論後立刻看到自己的訂單 / 評論）
+- 副本複寫延遲超過 REPLICA_MAX_LAG 秒或連不上時改讀主庫；延遲檢查結果在行程內保留 LAG_CHECK_INTERVAL 秒
+- 快取重算（common.cache.get_or_compute）固定讀主庫：落後的資料一旦寫進新版本的快取，
+  會一直留到 TTL 到期；同理，帶 ETag 的頁面（菜單、菜品詳情、訂單狀態）不讀副本，
+  以免落後的內容配上新的 ETag 被瀏覽器保存
+"""
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
+
+LAG_CHECK_INTERVAL = 5
+SESSION_KEY = '_db_primary_until'
+
+# 副本在複寫時才有 WAL 延遲；已追上（receive == replay）時回 0，不在 recovery 中（其實是主庫）時為 NULL
+LAG_SQL = """
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+"""
+
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+_replica_checks = {}  # alias -> (檢查時間, 是否可用)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias and model._meta.app_label in settings.DATABASE_REPLICA_APPS:
+            return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # 由副本讀出的 instance 存檔時也要寫回主庫
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 副本與主庫是同一份資料
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def use_database(alias):
+    """區塊內的讀取改走 alias；alias 為 None 時讀主庫"""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def use_primary():
+    return use_database(None)
+
+
+def replica_lag(alias):
+    """副本落後主庫的秒數；SQLite 等本機替身沒有複寫，視為 0"""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        lag = cursor.fetchone()[0]
+    return float(lag or 0)
+
+
+def _check_is_fresh(alias):
+    checked = _replica_checks.get(alias)
+    return checked is not None and time.monotonic() - checked[0] < LAG_CHECK_INTERVAL
+
+
+def _is_usable(alias):
+    if _check_is_fresh(alias):
+        return _replica_checks[alias][1]
+    try:
+        lag = replica_lag(alias)
+        usable = lag <= settings.REPLICA_MAX_LAG
+        if not usable:
+            logger.warning(f"Replica {alias} lagging {lag:.1f}s, reading from primary")
+    except Exception as e:
+        logger.warning(f"Replica {alias} unavailable: {e}")
+        usable = False
+    _replica_checks[alias] = (time.monotonic(), usable)
+    return usable
+
+
+def choose_replica():
+    """隨機挑一台可用的副本；全部落後或連不上時回傳 None（讀主庫）"""
+    usable = [alias for alias in replicas() if _is_usable(alias)]
+    return random.choice(usable) if usable else None
+
+
+async def achoose_replica():
+    # 延遲檢查要查資料庫；行程內的檢查結果還沒過期時不必切換執行緒
+    if all(_check_is_fresh(alias) for alias in replicas()):
+        return choose_replica()
+    return await sync_to_async(choose_replica)()
+
+
+def _is_pinned(until):
+    return until is not None and until > time.time()
+
+
+def pin_primary(request):
+    """此 session 接下來 REPLICA_STICKY_SECONDS 秒內都讀主庫"""
+    request.session[SESSION_KEY] = time.time() + settings.REPLICA_STICKY_SECONDS
+
+
+def read_from_replica(view):
+    """view 內 DATABASE_REPLICA_APPS 的讀取走副本（同步與 async view 皆可使用）"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            alias = None
+            if replicas() and not _is_pinned(await request.session.aget(SESSION_KEY)):
+                alias = await achoose_replica()
+            with use_database(alias):
+                return await view(request, *args, **kwargs)
+        return wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        alias = None
+        if replicas() and not _is_pinned(request.session.get(SESSION_KEY)):
+            alias = choose_replica()
+        with use_database(alias):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+@sync_and_async_middleware
+def replica_pinning_middleware(get_response):
+    """非 GET/HEAD 請求（可能寫入）之後固定讀主庫一小段時間，確保看得到自己剛寫入的資料"""
+    def should_pin(request):
+        return request.method not in ('GET', 'HEAD', 'OPTIONS') and replicas()
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            response = await get_response(request)
+            if should_pin(request):
+                await request.session.aset(SESSION_KEY, time.time() + settings.REPLICA_STICKY_SECONDS)
+            return response
+        return middleware
+
+    def middleware(request):
+        response = get_response(request)
+        if should_pin(request):
+            pin_primary(request)
+        return response
+    return middleware
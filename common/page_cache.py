@@ -0,0 +1,134 @@
+# common/page_cache.py
+"""
+匿名使用者的整頁快取
+
+取代全站 UpdateCacheMiddleware / FetchFromCacheMiddleware：那組 middleware 依 session cookie
+與 CSRF token 分版本，幾乎每個變體都用不到。這裡只快取匿名、無待顯示訊息的 GET 請求，
+以「路徑 + 查詢字串 + 語言」為 key、掛在標籤（例如菜單目錄版本）底下，
+CSRF token 以佔位字串寫入快取，回應時才換成該請求自己的 token。
+填入快取時一併預先壓縮（common/compression.py），命中時依 Accept-Encoding 回傳壓好的內容。
+同步與 async view 皆可使用。
+"""
+import hashlib
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_vary_headers
+
+from common import cache as tagged_cache
+from common.compression import encode, pick_encoding, precompress
+
+PAGE_TIMEOUT = 60 * 5
+CSRF_PLACEHOLDER = '__csrf_token_placeholder__'
+
+
+def _is_cacheable(request, user):
+    return (
+        request.method in ('GET', 'HEAD')
+        and not user.is_authenticated
+        # 有待顯示的 flash 訊息時頁面內容因人而異
+        and 'messages' not in request.COOKIES
+    )
+
+
+def _inject_csrf(request, content):
+    placeholder = CSRF_PLACEHOLDER.encode()
+    if placeholder not in content:
+        return content
+    return content.replace(placeholder, get_token(request).encode())
+
+
+def _prepare(response):
+    if getattr(response, 'context_data', None) is not None:
+        # view 的 context 優先於 context processor，模板輸出的是佔位字串
+        response.context_data['csrf_token'] = CSRF_PLACEHOLDER
+
+
+def _to_entry(response):
+    if response.status_code != 200 or response.streaming:
+        return None
+    return {
+        'content_type': response['Content-Type'],
+        **precompress(response.content, CSRF_PLACEHOLDER.encode()),
+    }
+
+
+def _uncached_response(request, response):
+    # 尚未渲染的 TemplateResponse 沒有放佔位字串，交給 Django 照常渲染即可
+    if not response.streaming and getattr(response, 'is_rendered', True):
+        response.content = _inject_csrf(request, response.content)
+    return response
+
+
+def _cached_response(request, page):
+    coding = pick_encoding(request, page)
+    token = get_token(request).encode() if len(page['parts']) > 1 else b''
+    response = HttpResponse(encode(page, coding, token), content_type=page['content_type'])
+    if coding != 'identity':
+        response['Content-Encoding'] = coding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def page_cache_key(request):
+    raw = f'{request.get_full_path()}|{request.LANGUAGE_CODE}'
+    return f'page_{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def cache_anonymous_page(tags, timeout=PAGE_TIMEOUT):
+    """
+    view 需回傳 TemplateResponse（或一般 HttpResponse）；只快取 200 回應。
+    使用行程內 L1 + Redis，穩定狀態下匿名流量不需查資料庫也不需連線 Redis。
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if not _is_cacheable(request, await request.auser()):
+                    return await view(request, *args, **kwargs)
+
+                rendered = {}
+
+                async def render_page():
+                    response = rendered['response'] = await view(request, *args, **kwargs)
+                    _prepare(response)
+                    if hasattr(response, 'render'):
+                        # 模板渲染（含 context processor）是同步程式碼
+                        await sync_to_async(response.render)()
+                    return _to_entry(response)
+
+                page = await tagged_cache.aget_or_compute(
+                    page_cache_key(request), tags, render_page, timeout, local=True
+                )
+                if page is None:
+                    response = rendered.get('response') or await view(request, *args, **kwargs)
+                    return _uncached_response(request, response)
+                return _cached_response(request, page)
+            return wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _is_cacheable(request, request.user):
+                return view(request, *args, **kwargs)
+
+            rendered = {}
+
+            def render_page():
+                response = rendered['response'] = view(request, *args, **kwargs)
+                _prepare(response)
+                if hasattr(response, 'render'):
+                    response.render()
+                return _to_entry(response)
+
+            page = tagged_cache.get_or_compute(
+                page_cache_key(request), tags, render_page, timeout, local=True
+            )
+            if page is None:
+                response = rendered.get('response') or view(request, *args, **kwargs)
+                return _uncached_response(request, response)
+            return _cached_response(request, page)
+        return wrapper
+    return decorator
@@ -0,0 +1,94 @@
+# common/pagination.py
+"""
+Keyset（cursor）分頁
+
+以上一頁最後一筆的排序鍵作為游標，下一頁用 WHERE (created, id) < (...) 搭配複合索引直接定位，
+不使用 OFFSET，翻到第幾頁查詢成本都相同。排序鍵最後一欄必須是唯一欄位（通常為主鍵）。
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """游標格式錯誤時回傳 None（視為第一頁）"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def get_page_size(request, default=DEFAULT_PAGE_SIZE):
+    try:
+        return max(1, min(int(request.GET.get('page_size', default)), MAX_PAGE_SIZE))
+    except ValueError:
+        return default
+
+
+def _after(keys, values, descending):
+    """字典序的 (k1, k2, ...) < (v1, v2, ...)；展開成 OR 以相容所有資料庫"""
+    op = 'lt' if descending else 'gt'
+    condition = Q()
+    for i, key in enumerate(keys):
+        equal = {k: v for k, v in zip(keys[:i], values[:i])}
+        condition |= Q(**equal, **{f'{key}__{op}': values[i]})
+    return condition
+
+
+def _keyset_queryset(queryset, keys, cursor, descending):
+    values = decode_cursor(cursor, len(keys)) if cursor else None
+    if values is not None:
+        queryset = queryset.filter(_after(keys, values, descending))
+    return queryset.order_by(*(f'-{key}' if descending else key for key in keys))
+
+
+def _keyset_page(rows, keys, page_size):
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor([
+            last[key] if isinstance(last, dict) else getattr(last, key) for key in keys
+        ])
+    return KeysetPage(rows, next_cursor)
+
+
+def paginate_keyset(queryset, keys, cursor=None, page_size=DEFAULT_PAGE_SIZE, descending=True):
+    """依 keys 排序並取出游標之後的一頁，多取一筆判斷是否有下一頁"""
+    queryset = _keyset_queryset(queryset, keys, cursor, descending)
+    return _keyset_page(list(queryset[:page_size + 1]), keys, page_size)
+
+
+async def apaginate_keyset(queryset, keys, cursor=None, page_size=DEFAULT_PAGE_SIZE, descending=True):
+    """paginate_keyset 的非同步版本（async ORM）"""
+    queryset = _keyset_queryset(queryset, keys, cursor, descending)
+    return _keyset_page([row async for row in queryset[:page_size + 1]], keys, page_size)
@@ -44,14 +44,14 @@ if kubectl get pod -l app=postgres -n cloudnative-final >/dev/null 2>&1; then
     echo "嘗試從 Django Pod 連接到 PostgreSQL..."
     kubectl exec deployment/django -n cloudnative-final -- python -c "
 import os
-import psycopg2
+import psycopg
 try:
-    conn = psycopg2.connect(
+    conn = psycopg.connect(
         host=os.getenv('DB_HOST', 'postgres'),
         port=os.getenv('DB_PORT', '5432'),
         user=os.getenv('DB_USER', 'postgres'),
         password=os.getenv('DB_PASSWORD'),
-        database=os.getenv('DB_NAME', 'cloudnative_final')
+        dbname=os.getenv('DB_NAME', 'cloudnative_final')
     )
     print('✅ 資料庫連線成功')
     conn.close()
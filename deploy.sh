@@ -186,6 +186,7 @@ if [ "$REDEPLOY_APP" = true ]; then
     echo "🐍 部署 Django 應用..."
     kubectl apply -f k8s/django-deployment.yaml
     kubectl apply -f k8s/django-service.yaml
+    kubectl apply -f k8s/kitchen-worker-deployment.yaml
     
     # 等待 Django 啟動 - 使用更穩定的方法
     echo "⏳ 等待 Django 啟動..."
@@ -0,0 +1,23 @@
+# gunicorn.conf.py
+"""
+Gunicorn 設定（Dockerfile 以 `gunicorn -c gunicorn.conf.py` 啟動）
+
+SERVER_MODE=asgi（預設）：uvicorn worker 執行 CloudNative_final/asgi.py，
+async view（菜單、訂單歷史 / 狀態 API、健康檢查、SSE 推播）等待 Redis / PostgreSQL 時不佔用 worker，
+每個 pod 可同時處理的連線數不再等於 worker 數。
+SERVER_MODE=wsgi：傳統同步 worker（SSE 推播無法使用）。
+"""
+import os
+
+SERVER_MODE = os.environ.get('SERVER_MODE', 'asgi')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 3))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'CloudNative_final.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'CloudNative_final.wsgi:application'
+    worker_class = 'sync'
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Dish
+from .models import Dish, DishRatingStats
 
-admin.site.register(Dish)
\ No newline at end of file
+admin.site.register(Dish)
+admin.site.register(DishRatingStats)
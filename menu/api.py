@@ -0,0 +1,110 @@
+# menu/api.py
+"""
+唯讀菜單 JSON API（行動 App 用）
+
+/api/menu/ 與 /api/menu/<id>/ 的回應內容在菜單變動前都相同，
+因此整份 JSON 只在標籤版本改變後序列化一次，連同 gzip / brotli 壓縮結果（common/compression.py）一起存進快取
+（行程內 L1 + Redis），之後的請求只是依 Accept-Encoding 挑一份現成的 bytes 回傳。
+菜單或評分變動時由 menu.signals / reviews.signals bump 標籤，下一個請求才重建。
+"""
+import hashlib
+import json
+import logging
+
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition, require_GET
+
+from common import cache as tagged_cache
+from common.cache import MENU_TAG, dish_tag
+from common.compression import encode, pick_encoding, precompress
+from .models import Dish
+
+logger = logging.getLogger(__name__)
+
+
+def serialize_dish(dish):
+    """精簡欄位；價格以字串輸出避免浮點誤差，評分取自預先彙總的 DishRatingStats"""
+    stats = getattr(dish, 'rating_stats', None)
+    return {
+        'id': dish.dish_id,
+        'name': {'zh': dish.name_zh, 'en': dish.name_en},
+        'description': {'zh': dish.description_zh, 'en': dish.description_en},
+        'price': str(dish.price),
+        'image_url': dish.image_url,
+        'is_available': dish.is_available,
+        'rating': {
+            'average': stats.average if stats else None,
+            'count': stats.rating_count if stats else 0,
+        },
+        'updated_at': dish.updated_at.isoformat(),
+    }
+
+
+def encode_payload(data):
+    """序列化並預先壓縮；回傳 {'etag', 'encoded': precompress 的結果}"""
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+    return {'etag': hashlib.md5(body).hexdigest(), 'encoded': precompress(body)}
+
+
+def _dish_queryset():
+    return Dish.objects.select_related('rating_stats').order_by('dish_id')
+
+
+def menu_payload():
+    def build():
+        logger.debug("Cache MISS: 菜單 API")
+        return encode_payload({'dishes': [serialize_dish(dish) for dish in _dish_queryset()]})
+
+    return tagged_cache.get_or_compute('menu_api', [MENU_TAG], build, tagged_cache.MENU_TIMEOUT, local=True)
+
+
+def dish_payload(pk):
+    """菜品不存在時回傳 None（同樣會被快取，新增該菜品時標籤自然失效）"""
+    def build():
+        logger.debug(f"Cache MISS: 菜品 API {pk}")
+        dish = _dish_queryset().filter(pk=pk).first()
+        return encode_payload(serialize_dish(dish)) if dish else None
+
+    return tagged_cache.get_or_compute(
+        f'menu_api_dish_{pk}', [dish_tag(pk)], build, tagged_cache.MENU_TIMEOUT, local=True
+    )
+
+
+def _payload_etag(request, payload):
+    # 不同 Content-Encoding 的內容不同，strong ETag 也要不同
+    return f"{payload['etag']}-{pick_encoding(request, payload['encoded'])}"
+
+
+def payload_response(request, payload):
+    """依 Accept-Encoding 回傳預先壓縮好的內容"""
+    coding = pick_encoding(request, payload['encoded'])
+    response = HttpResponse(encode(payload['encoded'], coding), content_type='application/json')
+    if coding != 'identity':
+        response['Content-Encoding'] = coding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def _menu_etag(request):
+    return _payload_etag(request, menu_payload())
+
+
+def _dish_etag(request, pk):
+    payload = dish_payload(pk)
+    return _payload_etag(request, payload) if payload else None
+
+
+@require_GET
+@condition(etag_func=_menu_etag)
+def menu_list(request):
+    return payload_response(request, menu_payload())
+
+
+@require_GET
+@condition(etag_func=_dish_etag)
+def menu_detail(request, pk):
+    payload = dish_payload(pk)
+    if payload is None:
+        raise Http404
+    return payload_response(request, payload)
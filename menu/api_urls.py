@@ -0,0 +1,10 @@
+# menu/api_urls.py
+from django.urls import path
+from . import api
+
+app_name = 'menu_api'
+
+urlpatterns = [
+    path('', api.menu_list, name='menu_list'),
+    path('<int:pk>/', api.menu_detail, name='menu_detail'),
+]
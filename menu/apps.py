@@ -5,4 +5,5 @@ class MenuConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'menu'
 
-
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,136 @@
+# menu/cart.py
+"""
+購物車儲存
+
+每位使用者一個 Redis hash（field = dish_id, value = 數量），加減一次只送一個 HINCRBY，
+不必像 session 購物車那樣每次點擊都把整個 session 重新序列化寫回。
+測試與單機開發可改用 LocalCartBackend（settings.CART_BACKEND）。
+"""
+import logging
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# 與 SESSION_COOKIE_AGE 相同，每次異動都會延長
+CART_TIMEOUT = 60 * 60 * 24
+
+
+class RedisCartBackend:
+    prefix = 'cloudnative_final:cart'
+
+    # 加減數量與「歸零即刪除」在同一個 script 內完成，避免併發點擊留下 0 或負數
+    _ADD_SCRIPT = """
+local qty = redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+if qty <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    qty = 0
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return qty
+"""
+
+    def __init__(self):
+        from django_redis import get_redis_connection
+        self.redis = get_redis_connection('default')
+        self._add = self.redis.register_script(self._ADD_SCRIPT)
+
+    def _key(self, user_id):
+        return f'{self.prefix}:{user_id}'
+
+    def add(self, user_id, dish_id, delta):
+        return int(self._add(keys=[self._key(user_id)], args=[dish_id, delta, CART_TIMEOUT]))
+
+    def items(self, user_id):
+        return {int(dish_id): int(qty) for dish_id, qty in self.redis.hgetall(self._key(user_id)).items()}
+
+    def count(self, user_id):
+        return self.redis.hlen(self._key(user_id))
+
+    def discard(self, user_id, dish_ids):
+        if dish_ids:
+            self.redis.hdel(self._key(user_id), *dish_ids)
+
+    def clear(self, user_id):
+        self.redis.delete(self._key(user_id))
+
+
+class LocalCartBackend:
+    """行程內字典，給測試與單機開發使用"""
+    carts = {}
+
+    def add(self, user_id, dish_id, delta):
+        cart = self.carts.setdefault(user_id, {})
+        qty = cart.get(dish_id, 0) + delta
+        if qty <= 0:
+            cart.pop(dish_id, None)
+            return 0
+        cart[dish_id] = qty
+        return qty
+
+    def items(self, user_id):
+        return dict(self.carts.get(user_id, {}))
+
+    def count(self, user_id):
+        return len(self.carts.get(user_id, {}))
+
+    def discard(self, user_id, dish_ids):
+        cart = self.carts.get(user_id, {})
+        for dish_id in dish_ids:
+            cart.pop(dish_id, None)
+
+    def clear(self, user_id):
+        self.carts.pop(user_id, None)
+
+
+def get_cart_backend():
+    return import_string(settings.CART_BACKEND)()
+
+
+class Cart:
+    """綁定單一使用者的購物車操作介面"""
+
+    def __init__(self, user, backend=None):
+        self.user_id = user.pk
+        self.backend = backend or get_cart_backend()
+
+    def add(self, dish_id, quantity=1):
+        """回傳異動後的數量（0 表示已移除）"""
+        return self.backend.add(self.user_id, int(dish_id), quantity)
+
+    def remove(self, dish_id, quantity=1):
+        return self.backend.add(self.user_id, int(dish_id), -quantity)
+
+    def items(self):
+        """{dish_id(int): 數量}，可直接交給 orders.services.create_order"""
+        return self.backend.items(self.user_id)
+
+    def count(self):
+        return self.backend.count(self.user_id)
+
+    def discard(self, dish_ids):
+        """移除已不存在的菜品"""
+        self.backend.discard(self.user_id, [int(dish_id) for dish_id in dish_ids])
+
+    def clear(self):
+        self.backend.clear(self.user_id)
+
+    def summary(self):
+        items = self.items()
+        return {
+            'items': {str(dish_id): qty for dish_id, qty in items.items()},
+            'count': len(items),
+            'total_quantity': sum(items.values()),
+        }
+
+
+def cart_count(user):
+    """導覽列徽章用；購物車服務故障時顯示 0，不影響頁面"""
+    if not user.is_authenticated:
+        return 0
+    try:
+        return Cart(user).count()
+    except Exception as e:
+        logger.error(f"Cart count failed: {e}")
+        return 0
@@ -0,0 +1,9 @@
+# menu/context_processors.py
+from django.utils.functional import SimpleLazyObject
+
+from .cart import cart_count
+
+
+def cart(request):
+    """導覽列購物車徽章；只有模板真的用到時才查詢購物車"""
+    return {'cart_count': SimpleLazyObject(lambda: cart_count(request.user))}
@@ -0,0 +1,37 @@
+# menu/management/commands/rebuild_rating_stats.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from menu.models import DishRatingStats
+from reviews.models import DishReview
+
+
+class Command(BaseCommand):
+    help = '從 DishReview 重新計算所有菜品的評分彙總 (DishRatingStats)'
+
+    def handle(self, *args, **options):
+        star_counts = {
+            f'stars_{star}': Count('review_id', filter=Q(rating=star))
+            for star in DishRatingStats.STARS
+        }
+        rows = (
+            DishReview.objects
+            .order_by()
+            .values('order_item__dish_id')
+            .annotate(
+                rating_count=Count('review_id'),
+                rating_sum=Sum('rating'),
+                **star_counts,
+            )
+        )
+        stats = [
+            DishRatingStats(dish_id=row.pop('order_item__dish_id'), **row)
+            for row in rows
+        ]
+
+        with transaction.atomic():
+            DishRatingStats.objects.all().delete()
+            DishRatingStats.objects.bulk_create(stats)
+
+        self.stdout.write(self.style.SUCCESS(f'已重建 {len(stats)} 道菜品的評分彙總'))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 08:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DishRatingStats',
+            fields=[
+                ('dish', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_stats', serialize=False, to='menu.dish')),
+                ('rating_count', models.PositiveIntegerField(default=0, verbose_name='評論數')),
+                ('rating_sum', models.PositiveIntegerField(default=0, verbose_name='評分總和')),
+                ('stars_0', models.PositiveIntegerField(default=0, verbose_name='0 星數量')),
+                ('stars_1', models.PositiveIntegerField(default=0, verbose_name='1 星數量')),
+                ('stars_2', models.PositiveIntegerField(default=0, verbose_name='2 星數量')),
+                ('stars_3', models.PositiveIntegerField(default=0, verbose_name='3 星數量')),
+                ('stars_4', models.PositiveIntegerField(default=0, verbose_name='4 星數量')),
+                ('stars_5', models.PositiveIntegerField(default=0, verbose_name='5 星數量')),
+            ],
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2 on 2026-10-18 08:28
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+from menu.utils import build_search_document
+
+SEARCH_FIELDS = ('name_zh', 'name_en', 'description_zh', 'description_en')
+
+# 只在 PostgreSQL 建立；SQLite 改用 menu/search.py 的倒排索引
+POSTGRES_INDEXES = [
+    (
+        'menu_dish_search_document_fts',
+        "CREATE INDEX IF NOT EXISTS menu_dish_search_document_fts ON menu_dish "
+        "USING gin (to_tsvector('simple'::regconfig, COALESCE(search_document, '')))",
+    ),
+    (
+        'menu_dish_name_zh_trgm',
+        "CREATE INDEX IF NOT EXISTS menu_dish_name_zh_trgm ON menu_dish "
+        "USING gin (name_zh gin_trgm_ops)",
+    ),
+    (
+        'menu_dish_name_en_trgm',
+        "CREATE INDEX IF NOT EXISTS menu_dish_name_en_trgm ON menu_dish "
+        "USING gin (name_en gin_trgm_ops)",
+    ),
+]
+
+
+def fill_search_document(apps, schema_editor):
+    Dish = apps.get_model('menu', 'Dish')
+    dishes = list(Dish.objects.all())
+    for dish in dishes:
+        dish.search_document = build_search_document(
+            *(getattr(dish, field) for field in SEARCH_FIELDS)
+        )
+    Dish.objects.bulk_update(dishes, ['search_document'], batch_size=500)
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for _, sql in POSTGRES_INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in POSTGRES_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_dishratingstats'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='dish',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False, verbose_name='搜尋索引文件'),
+        ),
+        migrations.RunPython(fill_search_document, migrations.RunPython.noop),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
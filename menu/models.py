@@ -1,5 +1,7 @@
 # menu/models.py
 from django.db import models
+from django.db.models import F
+from .utils import build_search_document
 from django.core.validators import MinValueValidator
 
 
@@ -16,16 +18,81 @@ class Dish(models.Model):
                       )
     image_url       = models.URLField('圖片 URL', max_length=255, blank=True)
     is_available    = models.BooleanField('是否上架中', default=True)
+    # 斷詞後的全文檢索文件（中文 bigram），由 save() 自動維護，見 menu/search.py
+    search_document = models.TextField('搜尋索引文件', blank=True, editable=False)
+    # 條件式 GET 的 Last-Modified 來源（見 common/conditional.py）
+    updated_at      = models.DateTimeField('最後更新時間', auto_now=True)
+
+    SEARCH_FIELDS = ('name_zh', 'name_en', 'description_zh', 'description_en')
 
     class Meta:
         ordering = ['dish_id']
 
     def __str__(self):
         return f"{self.name_zh} (#{self.dish_id})"
+
+    def save(self, *args, **kwargs):
+        self.search_document = build_search_document(
+            *(getattr(self, field) for field in self.SEARCH_FIELDS)
+        )
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'search_document', 'updated_at'}
+        super().save(*args, **kwargs)
     def average_rating(self):
-        from reviews.models import DishReview 
-        reviews = DishReview.objects.filter(order_item__dish=self)
-        if reviews.exists():
-            avg = sum(r.rating for r in reviews) / reviews.count()
-            return round(avg, 1)
-        return None
+        """讀取預先彙總的評分（搭配 select_related('rating_stats') 不需額外查詢）"""
+        try:
+            stats = self.rating_stats
+        except DishRatingStats.DoesNotExist:
+            return None
+        return stats.average
+
+
+class DishRatingStats(models.Model):
+    """菜品評分彙總：由 reviews.signals 隨 DishReview 增刪改即時維護"""
+    STARS = range(0, 6)
+
+    dish         = models.OneToOneField(
+                       Dish,
+                       primary_key=True,
+                       on_delete=models.CASCADE,
+                       related_name='rating_stats'
+                   )
+    rating_count = models.PositiveIntegerField('評論數', default=0)
+    rating_sum   = models.PositiveIntegerField('評分總和', default=0)
+    stars_0      = models.PositiveIntegerField('0 星數量', default=0)
+    stars_1      = models.PositiveIntegerField('1 星數量', default=0)
+    stars_2      = models.PositiveIntegerField('2 星數量', default=0)
+    stars_3      = models.PositiveIntegerField('3 星數量', default=0)
+    stars_4      = models.PositiveIntegerField('4 星數量', default=0)
+    stars_5      = models.PositiveIntegerField('5 星數量', default=0)
+
+    def __str__(self):
+        return f"{self.dish_id} 的評分彙總 ({self.rating_count} 則)"
+
+    @property
+    def average(self):
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 1)
+
+    @property
+    def histogram(self):
+        """{星等: 數量}"""
+        return {star: getattr(self, f'stars_{star}') for star in self.STARS}
+
+    @classmethod
+    def apply_delta(cls, dish_id, rating, sign):
+        """
+        以單一 UPDATE（F 運算式）加減一筆評分，sign 為 +1 或 -1
+        由 reviews.signals 併入 DishReview / OrderItem 寫入的交易呼叫，確保一起 commit / rollback
+        """
+        values = {
+            'rating_count': F('rating_count') + sign,
+            'rating_sum': F('rating_sum') + sign * rating,
+            f'stars_{rating}': F(f'stars_{rating}') + sign,
+        }
+        if cls.objects.filter(dish_id=dish_id).update(**values) or sign < 0:
+            return
+        cls.objects.get_or_create(dish_id=dish_id)
+        cls.objects.filter(dish_id=dish_id).update(**values)
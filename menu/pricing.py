@@ -0,0 +1,79 @@
+# menu/pricing.py
+"""
+購物車計價
+
+購物車頁面與兩個結帳入口（menu.views.checkout、orders.views.CheckoutView → orders.services.create_order）
+都透過 price_cart 計價，確保顯示金額與成立訂單的金額一致。
+
+菜品資料來自「菜品快照」快取（行程內 L1 + Redis）：一次 get_many 取回整車菜品，
+未命中的再以一次查詢補齊，與購物車品項數無關。快照掛在 dish:<id> 標籤下，菜品改價或下架時由 menu.signals 失效。
+"""
+import logging
+from decimal import Decimal
+
+from common import cache as tagged_cache
+from common.cache import dish_tag
+from .models import Dish
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FIELDS = ('dish_id', 'name_zh', 'name_en', 'price', 'image_url', 'is_available')
+
+
+def _snapshot_key(dish_id):
+    return f'dish_snapshot_{dish_id}'
+
+
+def get_dish_snapshots(dish_ids, local=True):
+    """
+    回傳 {dish_id: 快照 dict}；已刪除的菜品不會出現在結果中
+    local=False 時略過行程內 L1，直接以 Redis 的最新標籤版本為準（結帳用）
+    """
+    entries = {_snapshot_key(dish_id): [dish_tag(dish_id)] for dish_id in dish_ids}
+    cached = tagged_cache.get_many(entries, local=local) if entries else {}
+    snapshots = {snapshot['dish_id']: snapshot for snapshot in cached.values()}
+
+    missing = [dish_id for dish_id in dish_ids if dish_id not in snapshots]
+    if missing:
+        logger.debug(f"Cache MISS: 菜品快照 {missing}")
+        fresh = {row['dish_id']: row for row in Dish.objects.filter(dish_id__in=missing).values(*SNAPSHOT_FIELDS)}
+        if fresh:
+            tagged_cache.set_many(
+                {_snapshot_key(dish_id): (row, [dish_tag(dish_id)]) for dish_id, row in fresh.items()},
+                tagged_cache.DISH_SNAPSHOT_TIMEOUT, local=local,
+            )
+        snapshots.update(fresh)
+    return snapshots
+
+
+class PricedCart:
+    """
+    lines：可結帳的品項 [{'dish': 快照, 'quantity', 'subtotal'}]
+    unavailable：已下架的菜品快照（不計價）；missing：已刪除的 dish_id
+    """
+
+    def __init__(self, lines, unavailable, missing):
+        self.lines = lines
+        self.unavailable = unavailable
+        self.missing = missing
+        self.total = sum((line['subtotal'] for line in lines), Decimal('0.00'))
+
+    def __bool__(self):
+        return bool(self.lines)
+
+
+def price_cart(quantities, local=True):
+    """quantities 為 {dish_id: 數量}（key 可為字串）"""
+    quantities = {int(dish_id): qty for dish_id, qty in quantities.items() if qty > 0}
+    snapshots = get_dish_snapshots(list(quantities), local=local)
+
+    lines, unavailable, missing = [], [], []
+    for dish_id, quantity in quantities.items():
+        dish = snapshots.get(dish_id)
+        if dish is None:
+            missing.append(dish_id)
+        elif not dish['is_available']:
+            unavailable.append(dish)
+        else:
+            lines.append({'dish': dish, 'quantity': quantity, 'subtotal': dish['price'] * quantity})
+    return PricedCart(lines, unavailable, missing)
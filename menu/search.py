@@ -0,0 +1,114 @@
+# menu/search.py
+"""
+菜單搜尋
+
+PostgreSQL：Dish.search_document 上的 to_tsvector('simple') GIN 索引（中文已預先切成 bigram），
+加上名稱欄位的 pg_trgm GIN 索引容錯比對，依 SearchRank + 相似度排序。
+其他資料庫（例如 SQLite 測試）：使用同一套斷詞建立的倒排索引，快取在 menu 標籤底下。
+"""
+from bisect import bisect_left
+
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity,
+)
+from django.db import connections
+from django.db.models import Q
+from django.db.models.functions import Greatest
+
+from common import cache as tagged_cache
+from common.cache import MENU_TAG
+from .models import Dish
+from .utils import tokenize
+
+NAME_WEIGHT = 2
+DESCRIPTION_WEIGHT = 1
+
+
+def search_dish_ids(q, queryset=None):
+    """回傳符合關鍵字的 dish_id，依相關度由高到低排序"""
+    tokens = tokenize(q, for_query=True)
+    if not tokens:
+        return []
+    if queryset is None:
+        queryset = Dish.objects.all()
+
+    if connections[queryset.db].vendor == 'postgresql':
+        return _postgres_search(q, tokens, queryset)
+    return _inverted_index_search(tokens, queryset)
+
+
+def _postgres_search(q, tokens, queryset):
+    # token 只含文字字元，可直接組成 raw tsquery；每個 token 皆做前綴比對
+    query = SearchQuery(
+        ' & '.join(f'{token}:*' for token in tokens),
+        search_type='raw', config='simple',
+    )
+    vector = SearchVector('search_document', config='simple')
+    similarity = Greatest(
+        TrigramWordSimilarity(q, 'name_zh'),
+        TrigramWordSimilarity(q, 'name_en'),
+    )
+    return list(
+        queryset
+        .annotate(document=vector)
+        .filter(
+            Q(document=query)
+            | Q(name_zh__trigram_word_similar=q)
+            | Q(name_en__trigram_word_similar=q)
+        )
+        .annotate(rank=SearchRank(vector, query) + similarity)
+        .order_by('-rank', 'dish_id')
+        .values_list('dish_id', flat=True)
+    )
+
+
+def get_inverted_index():
+    """
+    {'terms': 排序後的詞彙, 'postings': {token: {dish_id: 權重}}}
+    菜單異動時隨 menu 標籤一起失效
+    """
+    index = tagged_cache.get('dish_search_index', [MENU_TAG], local=True)
+    if index is not None:
+        return index
+
+    postings = {}
+    rows = Dish.objects.values_list('dish_id', *Dish.SEARCH_FIELDS)
+    for dish_id, *texts in rows.iterator():
+        for field, text in zip(Dish.SEARCH_FIELDS, texts):
+            weight = NAME_WEIGHT if field.startswith('name') else DESCRIPTION_WEIGHT
+            for token in tokenize(text):
+                scores = postings.setdefault(token, {})
+                scores[dish_id] = scores.get(dish_id, 0) + weight
+
+    index = {'terms': sorted(postings), 'postings': postings}
+    tagged_cache.set('dish_search_index', index, [MENU_TAG], tagged_cache.MENU_TIMEOUT, local=True)
+    return index
+
+
+def _prefix_matches(index, token):
+    terms = index['terms']
+    i = bisect_left(terms, token)
+    while i < len(terms) and terms[i].startswith(token):
+        yield index['postings'][terms[i]]
+        i += 1
+
+
+def _inverted_index_search(tokens, queryset):
+    index = get_inverted_index()
+    scores = None
+    for token in tokens:
+        matched = {}
+        for postings in _prefix_matches(index, token):
+            for dish_id, weight in postings.items():
+                matched[dish_id] = matched.get(dish_id, 0) + weight
+        # 所有 token 都要命中（AND）
+        if scores is None:
+            scores = matched
+        else:
+            scores = {dish_id: score + matched[dish_id]
+                      for dish_id, score in scores.items() if dish_id in matched}
+        if not scores:
+            return []
+
+    allowed = queryset.filter(dish_id__in=scores).values_list('dish_id', flat=True)
+    return sorted(allowed, key=lambda dish_id: (-scores[dish_id], dish_id))
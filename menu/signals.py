@@ -0,0 +1,11 @@
+# menu/signals.py
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from common.cache import MENU_TAG, dish_tag, invalidate_tags
+from .models import Dish
+
+
+@receiver([post_save, post_delete], sender=Dish)
+def invalidate_dish_cache(sender, instance, **kwargs):
+    invalidate_tags(MENU_TAG, dish_tag(instance.dish_id))
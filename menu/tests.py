@@ -1,16 +1,24 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
 from menu.models import Dish
 from orders.models import Order, OrderItem
 from django.core.cache import cache
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from io import StringIO
+import time
+from menu.models import DishRatingStats
+from common import cache as tagged_cache
+from common.cache import MENU_TAG, dish_tag
+from menu.cart import Cart, LocalCartBackend
 
 User = get_user_model()
 
 class DishViewsTest(TestCase):
     def setUp(self):
-        cache.clear()
+        tagged_cache.clear()
         self.client = Client()
         self.dish = Dish.objects.create(
             name_zh="滷肉飯",
@@ -42,73 +50,97 @@ class DishViewsTest(TestCase):
         self.assertContains(response, "Salad")
 
 
+@override_settings(CART_BACKEND='menu.cart.LocalCartBackend')
 class CartFunctionTest(TestCase):
     def setUp(self):
+        LocalCartBackend.carts.clear()
         self.client = Client()
         self.user = User.objects.create_user(username="testuser", password="password")
         self.client.force_login(self.user)
         self.dish = Dish.objects.create(name_zh="雞腿飯", name_en="Chicken Rice", price=80, is_available=True)
+        self.cart = Cart(self.user)
         
     def test_add_to_cart(self):
         response = self.client.get(reverse('menu:add_to_cart', args=[self.dish.pk]))
         self.assertEqual(response.status_code, 302)
-        session = self.client.session
-        cart = session.get('cart', {})
-        self.assertIn(str(self.dish.pk), cart)
+        self.assertIn(self.dish.pk, self.cart.items())
 
     def test_add_to_cart_twice(self):
         self.client.get(reverse('menu:add_to_cart', args=[self.dish.pk]))
         self.client.get(reverse('menu:add_to_cart', args=[self.dish.pk]))
-        session = self.client.session
-        cart = session.get('cart', {})
-        self.assertEqual(cart[str(self.dish.pk)], 2)
+        self.assertEqual(self.cart.items()[self.dish.pk], 2)
 
     def test_remove_from_cart(self):
-        session = self.client.session
-        session['cart'] = {str(self.dish.pk): 1}
-        session.save()
+        self.cart.add(self.dish.pk)
         response = self.client.get(reverse('menu:remove_from_cart', args=[self.dish.pk]))
         self.assertEqual(response.status_code, 302)
-        self.assertNotIn(str(self.dish.pk), self.client.session.get('cart', {}))
+        self.assertNotIn(self.dish.pk, self.cart.items())
    
     def test_remove_nonexistent_dish_from_cart(self):
         response = self.client.get(reverse('menu:remove_from_cart', args=[9999]))
         self.assertEqual(response.status_code, 404)
     
     def test_remove_unavailable_dish_from_cart(self):
-        session = self.client.session
-        session['cart'] = {'999': 1}  # 不存在的 dish_id
-        session.save()
+        self.cart.add(999)  # 不存在的 dish_id
         response = self.client.get(reverse('menu:remove_from_cart', args=[999]))
         self.assertEqual(response.status_code, 404)
 
     def test_cart_view(self):
-        session = self.client.session
-        session['cart'] = {str(self.dish.pk): 2}
-        session.save()
+        self.cart.add(self.dish.pk, 2)
         response = self.client.get(reverse('menu:cart'))
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, "雞腿飯")
 
     def test_cart_view_includes_pickup_times(self):
-        session = self.client.session
-        session['cart'] = {str(self.dish.pk): 1}
-        session.save()
+        self.cart.add(self.dish.pk)
         response = self.client.get(reverse('menu:cart'))
         self.assertIn('pickup_times', response.context)
 
+    def test_cart_view_discards_deleted_dishes(self):
+        self.cart.add(self.dish.pk)
+        self.cart.add(999)
+        self.client.get(reverse('menu:cart'))
+        self.assertEqual(self.cart.items(), {self.dish.pk: 1})
+
+    def test_cart_api_returns_summary(self):
+        response = self.client.post(reverse('menu:cart_add_api', args=[self.dish.pk]))
+        self.client.post(reverse('menu:cart_add_api', args=[self.dish.pk]))
+        self.assertEqual(response.json(), {
+            'dish_id': self.dish.pk,
+            'quantity': 1,
+            'cart': {'items': {str(self.dish.pk): 1}, 'count': 1, 'total_quantity': 1},
+        })
+
+        response = self.client.post(reverse('menu:cart_remove_api', args=[self.dish.pk]))
+        self.assertEqual(response.json()['quantity'], 1)
+        response = self.client.post(reverse('menu:cart_remove_api', args=[self.dish.pk]))
+        self.assertEqual(response.json()['cart'], {'items': {}, 'count': 0, 'total_quantity': 0})
+
+        # 多減一次不會出現負數
+        response = self.client.post(reverse('menu:cart_remove_api', args=[self.dish.pk]))
+        self.assertEqual(response.json()['quantity'], 0)
+
+    def test_cart_api_rejects_get_and_unknown_dish(self):
+        self.assertEqual(self.client.get(reverse('menu:cart_add_api', args=[self.dish.pk])).status_code, 405)
+        self.assertEqual(self.client.post(reverse('menu:cart_add_api', args=[9999])).status_code, 404)
+
+    def test_navbar_badge_shows_cart_count(self):
+        self.cart.add(self.dish.pk, 3)
+        response = self.client.get(reverse('menu:dish_list'))
+        self.assertContains(response, '<span id="cart-count" class="badge bg-danger">1</span>', html=True)
+
 
+@override_settings(CART_BACKEND='menu.cart.LocalCartBackend')
 class CheckoutTest(TestCase):
     def setUp(self):
+        LocalCartBackend.carts.clear()
         self.client = Client()
         self.user = User.objects.create_user(username="checkoutuser", password="testpass")
         self.client.force_login(self.user)
         self.dish = Dish.objects.create(
             name_zh="牛肉麵", name_en="Beef Noodles", price=120, is_available=True
         )
-        session = self.client.session
-        session['cart'] = {str(self.dish.pk): 1}
-        session.save()
+        Cart(self.user).add(self.dish.pk)
 
     def test_order_created_correctly(self):
         response = self.client.post(reverse('menu:checkout'), {
@@ -131,6 +163,8 @@ class CheckoutTest(TestCase):
         self.assertEqual(item.dish, self.dish)
         self.assertEqual(item.quantity, 1)
         self.assertEqual(item.unit_price, self.dish.price)
+        # 結帳後清空購物車
+        self.assertEqual(Cart(self.user).items(), {})
     
     def test_checkout_process(self):
         response = self.client.post(reverse('menu:checkout'), {
@@ -141,14 +175,411 @@ class CheckoutTest(TestCase):
         # You can check redirect or order created here if needed
 
     def test_checkout_with_empty_cart(self):
-        session = self.client.session
-        session['cart'] = {}
-        session.save()
-        
+        Cart(self.user).clear()
+
         response = self.client.post(reverse('menu:checkout'))
         self.assertRedirects(response, reverse('menu:cart'))
 
 
+@override_settings(CART_BACKEND='menu.cart.LocalCartBackend')
+class CartPricingTest(TestCase):
+    def setUp(self):
+        tagged_cache.clear()
+        LocalCartBackend.carts.clear()
+        self.user = User.objects.create_user(username="pricer", password="pass")
+        self.client.force_login(self.user)
+        self.dishes = [Dish.objects.create(name_zh=f"便當{i}", price=100 + i) for i in range(5)]
+
+    def test_snapshots_resolve_whole_cart_with_one_query(self):
+        from menu.pricing import price_cart
+        quantities = {dish.pk: 1 for dish in self.dishes}
+        with self.assertNumQueries(1):
+            priced = price_cart(quantities)
+        self.assertEqual(priced.total, 510)
+        with self.assertNumQueries(0):
+            self.assertEqual(price_cart(quantities).total, 510)
+
+    def test_price_change_invalidates_snapshot(self):
+        from menu.pricing import price_cart
+        price_cart({self.dishes[0].pk: 2})
+        self.dishes[0].price = 150
+        self.dishes[0].save()
+        self.assertEqual(price_cart({self.dishes[0].pk: 2}).total, 300)
+
+    def test_unavailable_and_deleted_dishes(self):
+        from menu.pricing import price_cart
+        self.dishes[0].is_available = False
+        self.dishes[0].save()
+        priced = price_cart({self.dishes[0].pk: 1, self.dishes[1].pk: 1, 9999: 1})
+        self.assertEqual([line['dish']['dish_id'] for line in priced.lines], [self.dishes[1].pk])
+        self.assertEqual([dish['dish_id'] for dish in priced.unavailable], [self.dishes[0].pk])
+        self.assertEqual(priced.missing, [9999])
+
+    def test_cart_page_and_checkout_agree(self):
+        cart = Cart(self.user)
+        cart.add(self.dishes[0].pk, 2)
+        cart.add(self.dishes[1].pk, 1)
+        self.dishes[2].is_available = False
+        self.dishes[2].save()
+        cart.add(self.dishes[2].pk, 1)
+
+        response = self.client.get(reverse('menu:cart'))
+        self.assertEqual(response.context['total_price'], 301)
+        self.assertContains(response, "已下架")
+
+        self.client.post(reverse('menu:checkout'))
+        self.assertEqual(Order.objects.get().total_price, response.context['total_price'])
+
+
+class TwoTierCacheTest(TestCase):
+    def setUp(self):
+        tagged_cache.clear()
+        self.dish = Dish.objects.create(name_zh="魯肉飯", name_en="Braised Pork Rice", price=50)
+
+    def test_menu_list_served_from_l1_without_redis(self):
+        from unittest.mock import MagicMock, patch
+        self.client.get(reverse('menu:dish_list'))
+        l2 = MagicMock()
+        with patch('common.cache.cache', l2), patch('common.cache.async_cache') as async_l2, \
+                self.assertNumQueries(0):
+            response = self.client.get(reverse('menu:dish_list'))
+        self.assertContains(response, "Braised Pork Rice")
+        self.assertEqual(l2.method_calls, [])
+        self.assertEqual(async_l2.return_value.method_calls, [])
+
+    def test_local_write_is_visible_immediately(self):
+        self.client.get(reverse('menu:dish_list'))
+        self.dish.name_en = "Stewed Pork Rice"
+        self.dish.save()
+        self.assertContains(self.client.get(reverse('menu:dish_list')), "Stewed Pork Rice")
+
+    def test_other_worker_invalidation_after_version_ttl(self):
+        from unittest.mock import patch
+        with patch('common.cache.L1_VERSION_TTL', 0):
+            tagged_cache._local_versions.clear()  # 丟掉 setUp 建立菜品時以預設 TTL 記下的版本
+            self.client.get(reverse('menu:dish_list'))
+            # 模擬其他 worker：只改資料庫並 bump Redis 上的標籤版本，不經過本行程 L1
+            Dish.objects.filter(pk=self.dish.pk).update(name_en="Stewed Pork Rice")
+            cache.incr(tagged_cache._version_key(MENU_TAG))
+            self.assertContains(self.client.get(reverse('menu:dish_list')), "Stewed Pork Rice")
+
+    def test_invalidate_tags_uses_one_redis_pipeline(self):
+        from unittest.mock import MagicMock, patch
+        backend = MagicMock()
+        backend.client.make_key.side_effect = lambda key: f':1:{key}'
+        pipeline = backend.client.get_client.return_value.pipeline.return_value
+        pipeline.execute.return_value = [8, 1]  # 第二個版本 key 已被淘汰，INCR 從 1 開始
+        with patch('common.cache._is_django_redis', return_value=True), \
+                patch('common.cache.caches', {'default': backend}), \
+                patch('common.cache._new_version', return_value=1700000000000):
+            tagged_cache._bump(['order:1', 'order:2'])
+
+        self.assertEqual(
+            [call.args for call in pipeline.incr.call_args_list],
+            [(':1:tag_version:order:1',), (':1:tag_version:order:2',)],
+        )
+        pipeline.execute.assert_called_once()
+        backend.set_many.assert_called_once_with({'tag_version:order:2': 1700000000000}, tagged_cache.VERSION_TIMEOUT)
+        self.assertEqual(tagged_cache._local_versions.get('order:2'), 1700000000000)
+
+    def test_local_lru_evicts_oldest_and_expires(self):
+        lru = tagged_cache.LocalLRU(max_entries=2)
+        lru.set('a', 1, 60)
+        lru.set('b', 2, 60)
+        lru.get('a')
+        lru.set('c', 3, 60)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual((lru.get('a'), lru.get('c')), (1, 3))
+        lru.set('d', 4, 0)
+        self.assertIsNone(lru.get('d'))
+
+
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        tagged_cache.clear()
+        self.dish = Dish.objects.create(name_zh="魯肉飯", name_en="Braised Pork Rice", price=50)
+
+    def test_read_views_are_async(self):
+        from menu.views import DishDetailView, DishListView
+        self.assertTrue(DishListView.view_is_async)
+        self.assertTrue(DishDetailView.view_is_async)
+
+    async def test_async_client(self):
+        response = await self.async_client.get(reverse('menu:dish_list'))
+        self.assertContains(response, "Braised Pork Rice")
+        response = await self.async_client.get(reverse('menu:dish_detail', args=[self.dish.pk]))
+        self.assertContains(response, "Braised Pork Rice")
+        response = await self.async_client.get(reverse('menu:dish_detail', args=[9999]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual((await self.async_client.get('/health/')).status_code, 200)
+
+
+class AnonymousPageCacheTest(TestCase):
+    def setUp(self):
+        tagged_cache.clear()
+        self.dish = Dish.objects.create(name_zh="魯肉飯", name_en="Braised Pork Rice", price=50)
+
+    def _csrf_token(self, html):
+        import re
+        return re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', html).group(1)
+
+    def test_anonymous_page_served_without_db_or_redis(self):
+        from unittest.mock import MagicMock, patch
+        self.client.get(reverse('menu:dish_list'))
+        l2 = MagicMock()
+        with patch('common.cache.cache', l2), patch('common.cache.async_cache') as async_l2, \
+                self.assertNumQueries(0):
+            response = self.client.get(reverse('menu:dish_list'))
+        self.assertContains(response, "Braised Pork Rice")
+        self.assertEqual(l2.method_calls, [])
+        self.assertEqual(async_l2.return_value.method_calls, [])
+
+    def test_csrf_token_is_per_request(self):
+        from common.page_cache import CSRF_PLACEHOLDER
+        first = Client(enforce_csrf_checks=True)
+        second = Client(enforce_csrf_checks=True)
+        first_page = first.get(reverse('menu:dish_list'))
+        second_page = second.get(reverse('menu:dish_list'))
+        self.assertNotContains(second_page, CSRF_PLACEHOLDER)
+        self.assertIn('csrftoken', second.cookies)
+        # 快取頁面上的 token 必須對應該請求自己的 CSRF cookie
+        response = second.post(reverse('set_language'), {
+            'language': 'en', 'next': '/', 'csrfmiddlewaretoken': self._csrf_token(second_page.content.decode()),
+        })
+        self.assertEqual(response.status_code, 302)
+        response = second.post(reverse('set_language'), {
+            'language': 'en', 'next': '/', 'csrfmiddlewaretoken': 'x' * 64,
+        })
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(first_page.status_code, 200)
+
+    def test_page_invalidated_when_dish_changes(self):
+        self.client.get(reverse('menu:dish_list'))
+        self.dish.name_en = "Stewed Pork Rice"
+        self.dish.save()
+        self.assertContains(self.client.get(reverse('menu:dish_list')), "Stewed Pork Rice")
+
+    def test_languages_cached_separately(self):
+        self.client.get(reverse('menu:dish_list'))
+        response = self.client.get(reverse('menu:dish_list'), HTTP_ACCEPT_LANGUAGE='zh-hant')
+        self.assertContains(response, "魯肉飯")
+
+    def test_authenticated_users_get_their_own_actions(self):
+        self.client.get(reverse('menu:dish_list'))
+        staff = User.objects.create_user(username="staff", password="pw", email="staff@example.com", role=User.Role.STAFF)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('menu:dish_list'))
+        self.assertContains(response, reverse('menu:dish_edit', args=[self.dish.pk]))
+        self.assertNotContains(response, f"{reverse('login')}?next={reverse('menu:add_to_cart', args=[self.dish.pk])}")
+
+    def test_cached_page_served_precompressed(self):
+        import gzip
+        from unittest.mock import patch
+        from common import page_cache
+        with patch('common.page_cache.precompress', wraps=page_cache.precompress) as precompress:
+            self.client.get(reverse('menu:dish_list'))
+            first = Client()
+            first.get(reverse('menu:dish_list'))
+            response = first.get(reverse('menu:dish_list'), HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+            self.assertEqual(precompress.call_count, 1)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        html = gzip.decompress(response.content).decode()
+        self.assertIn("Braised Pork Rice", html)
+        # 解壓後的 token 仍是該請求自己的，可通過 CSRF 檢查
+        token = self._csrf_token(html)
+        first_csrf = Client(enforce_csrf_checks=True)
+        first_csrf.cookies = first.cookies
+        response = first_csrf.post(reverse('set_language'), {'language': 'en', 'next': '/', 'csrfmiddlewaretoken': token})
+        self.assertEqual(response.status_code, 302)
+
+    def test_compression_negotiation_changes_etag(self):
+        plain = self.client.get(reverse('menu:dish_list'))
+        compressed = self.client.get(reverse('menu:dish_list'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotEqual(plain['ETag'], compressed['ETag'])
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        tagged_cache.clear()
+        self.dish = Dish.objects.create(name_zh="魯肉飯", name_en="Braised Pork Rice", price=50)
+
+    def test_dish_list_returns_304_without_queries(self):
+        response = self.client.get(reverse('menu:dish_list'))
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('menu:dish_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_dish_list_etag_changes_with_catalog(self):
+        etag = self.client.get(reverse('menu:dish_list'))['ETag']
+        self.dish.price = 60
+        self.dish.save()
+        response = self.client.get(reverse('menu:dish_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_dish_list_if_modified_since(self):
+        last_modified = self.client.get(reverse('menu:dish_list'))['Last-Modified']
+        response = self.client.get(reverse('menu:dish_list'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_dish_detail_304_and_invalidation(self):
+        url = reverse('menu:dish_detail', args=[self.dish.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.dish.name_en = "Stewed Pork Rice"
+        self.dish.save()
+        self.assertContains(self.client.get(url, HTTP_IF_NONE_MATCH=etag), "Stewed Pork Rice")
+
+    def test_etag_differs_per_user(self):
+        anonymous_etag = self.client.get(reverse('menu:dish_list'))['ETag']
+        user = User.objects.create_user(username="eater", password="pw", email="eater@example.com")
+        self.client.force_login(user)
+        response = self.client.get(reverse('menu:dish_list'), HTTP_IF_NONE_MATCH=anonymous_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_updated_at_tracks_partial_saves(self):
+        before = self.dish.updated_at
+        self.dish.price = 70
+        self.dish.save(update_fields=['price'])
+        self.assertGreater(Dish.objects.get(pk=self.dish.pk).updated_at, before)
+
+
+class MenuApiTest(TestCase):
+    def setUp(self):
+        tagged_cache.clear()
+        self.dish = Dish.objects.create(name_zh="魯肉飯", name_en="Braised Pork Rice", price=50)
+
+    def test_menu_list_json(self):
+        response = self.client.get(reverse('menu_api:menu_list'))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        dish = response.json()['dishes'][0]
+        self.assertEqual(dish['id'], self.dish.pk)
+        self.assertEqual(dish['name']['zh'], "魯肉飯")
+        self.assertEqual(dish['price'], '50.00')
+        self.assertEqual(dish['rating'], {'average': None, 'count': 0})
+
+    def test_payload_built_once_per_catalog_version(self):
+        from unittest.mock import patch
+        from menu import api
+        with patch('menu.api.encode_payload', wraps=api.encode_payload) as encode:
+            self.client.get(reverse('menu_api:menu_list'))
+            with self.assertNumQueries(0):
+                self.client.get(reverse('menu_api:menu_list'))
+            self.assertEqual(encode.call_count, 1)
+            self.dish.price = 60
+            self.dish.save()
+            self.assertEqual(self.client.get(reverse('menu_api:menu_list')).json()['dishes'][0]['price'], '60.00')
+            self.assertEqual(encode.call_count, 2)
+
+    def test_gzip_served_when_accepted(self):
+        import gzip
+        import json
+        response = self.client.get(reverse('menu_api:menu_list'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.content))['dishes'][0]['id'], self.dish.pk)
+        plain = self.client.get(reverse('menu_api:menu_list'), HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertNotEqual(plain['ETag'], response['ETag'])
+
+    def test_detail_and_304(self):
+        url = reverse('menu_api:menu_detail', args=[self.dish.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['name']['en'], "Braised Pork Rice")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(reverse('menu_api:menu_detail', args=[9999])).status_code, 404)
+
+
+    async def test_missing_dish_version_keys_expire(self):
+        from asgiref.sync import sync_to_async
+        self.assertEqual((await self.async_client.get(reverse('menu_api:menu_detail', args=[424242]))).status_code, 404)
+        self.assertEqual((await self.async_client.get(reverse('menu:dish_detail', args=[434343]))).status_code, 404)
+        # 不存在的 pk 也會建立版本 key，必須帶 TTL，不能無限累積
+        for pk in (424242, 434343):
+            key = cache.make_key(tagged_cache._version_key(dish_tag(pk)))
+            expires = await sync_to_async(cache._expire_info.get)(key)
+            self.assertIsNotNone(expires)
+            self.assertLessEqual(expires - time.time(), tagged_cache.VERSION_TIMEOUT)
+
+class GetOrComputeTest(TestCase):
+    def setUp(self):
+        tagged_cache.clear()
+        self.calls = 0
+
+    def _compute(self, value='fresh', delay=0):
+        def compute():
+            import time
+            self.calls += 1
+            time.sleep(delay)
+            return value
+        return compute
+
+    def _real_key(self, key, tags):
+        return tagged_cache.tagged_key(key, tags)
+
+    def test_computes_once_until_invalidated(self):
+        for _ in range(3):
+            self.assertEqual(tagged_cache.get_or_compute('k', [MENU_TAG], self._compute(), 60), 'fresh')
+        self.assertEqual(self.calls, 1)
+        tagged_cache.invalidate_tags(MENU_TAG)
+        tagged_cache.get_or_compute('k', [MENU_TAG], self._compute(), 60)
+        self.assertEqual(self.calls, 2)
+
+    def test_concurrent_misses_compute_once(self):
+        import threading
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                tagged_cache.get_or_compute('hot', [MENU_TAG], self._compute(delay=0.2), 60)
+            ))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['fresh'] * 8)
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_served_while_another_request_recomputes(self):
+        import time
+        tagged_cache.get_or_compute('k', [MENU_TAG], self._compute('old'), 60)
+        real_key = self._real_key('k', [MENU_TAG])
+        envelope = cache.get(real_key)
+        envelope['expires_at'] = time.time() - 1
+        cache.set(real_key, envelope, 60)
+
+        cache.add(f'{real_key}|lock', 1, 30)  # 另一個請求正在重算
+        self.assertEqual(tagged_cache.get_or_compute('k', [MENU_TAG], self._compute('new'), 60), 'old')
+        self.assertEqual(self.calls, 1)
+
+        cache.delete(f'{real_key}|lock')
+        self.assertEqual(tagged_cache.get_or_compute('k', [MENU_TAG], self._compute('new'), 60), 'new')
+
+    def test_cold_miss_waits_then_computes(self):
+        from unittest.mock import patch
+        real_key = self._real_key('k', [MENU_TAG])
+        cache.add(f'{real_key}|lock', 1, 30)
+        with patch('common.cache.LOCK_WAIT', 0.1):
+            self.assertEqual(tagged_cache.get_or_compute('k', [MENU_TAG], self._compute(), 60), 'fresh')
+        self.assertEqual(self.calls, 1)
+
+    def test_failed_compute_releases_lock(self):
+        def boom():
+            raise RuntimeError('db down')
+        with self.assertRaises(RuntimeError):
+            tagged_cache.get_or_compute('k', [MENU_TAG], boom, 60)
+        self.assertIsNone(cache.get(f'{self._real_key("k", [MENU_TAG])}|lock'))
+        self.assertEqual(tagged_cache.get_or_compute('k', [MENU_TAG], self._compute(), 60), 'fresh')
+
+
 class DishCRUDTest(TestCase):
     def setUp(self):
         self.client = Client()
@@ -192,7 +623,7 @@ class DishCacheTest(TestCase):
         self.dish = Dish.objects.create(name_zh="測試菜", name_en="Test Dish", price=100)
 
     def test_dish_list_cache_miss_and_hit(self):
-        cache.clear()
+        tagged_cache.clear()
 
         # 第一次請求：快取未命中
         response1 = self.client.get(reverse('menu:dish_list'))
@@ -211,7 +642,7 @@ class DishCacheTest(TestCase):
         order_item = OrderItem.objects.create(order=order, dish=self.dish, quantity=1, unit_price=100)
         DishReview.objects.create(order_item=order_item, rating=5, comment='讚', user=user)
 
-        cache.clear()
+        tagged_cache.clear()
         response = self.client.get(reverse('menu:dish_detail', args=[self.dish.pk]))
         self.assertContains(response, '讚')  # 未命中
 
@@ -222,27 +653,178 @@ class DishCacheTest(TestCase):
 
 class DishCacheInvalidationTest(TestCase):
     def setUp(self):
+        tagged_cache.clear()
         self.staff_user = User.objects.create_user(username='staff', password='pass', role=User.Role.STAFF)
         self.client.force_login(self.staff_user)
 
     def test_dish_create_clears_cache(self):
-        cache.set('dish_list_all_available', ['dummy'])
+        self.client.get(reverse('menu:dish_list'))
+        self.assertIsNotNone(tagged_cache.get('dish_list_all', [MENU_TAG]))
         self.client.post(reverse('menu:dish_add'), {
             'name_zh': '快取測試',
             'name_en': 'Cache Test',
             'price': 100,
             'is_available': True
         })
-        self.assertIsNone(cache.get('dish_list_all_available'))
+        self.assertIsNone(tagged_cache.get('dish_list_all', [MENU_TAG]))
+        self.assertContains(self.client.get(reverse('menu:dish_list')), 'Cache Test')
 
     def test_dish_update_clears_cache(self):
         dish = Dish.objects.create(name_zh='原始', name_en='Original', price=50)
-        cache.set(f'dish_info_{dish.pk}', 'dummy')
+        tags = [dish_tag(dish.pk)]
+        tagged_cache.set(f'dish_reviews_{dish.pk}', ['dummy'], tags, 60)
         self.client.post(reverse('menu:dish_edit', args=[dish.pk]), {
             'name_zh': '更新後',
             'name_en': 'Updated',
             'price': 60,
             'is_available': True
         })
-        self.assertIsNone(cache.get(f'dish_info_{dish.pk}'))
+        self.assertIsNone(tagged_cache.get(f'dish_reviews_{dish.pk}', tags))
+
+    def test_search_cache_cleared_on_delete(self):
+        dish = Dish.objects.create(name_zh='蘿蔔糕', name_en='Turnip Cake', price=30)
+        self.assertContains(self.client.get(reverse('menu:dish_list'), {'q': 'Turnip'}), 'Turnip Cake')
+        self.client.post(reverse('menu:dish_delete', args=[dish.pk]))
+        self.assertNotContains(self.client.get(reverse('menu:dish_list'), {'q': 'Turnip'}), 'Turnip Cake')
+
+    def test_review_invalidates_dish_reviews(self):
+        order = Order.objects.create(consumer=self.staff_user, total_price=50)
+        dish = Dish.objects.create(name_zh='湯', name_en='Soup', price=50)
+        item = OrderItem.objects.create(order=order, dish=dish, quantity=1, unit_price=50)
+        self.client.get(reverse('menu:dish_detail', args=[dish.pk]))
+
+        from reviews.models import DishReview
+        DishReview.objects.create(user=self.staff_user, order_item=item, rating=5, comment='好喝')
+        self.assertContains(self.client.get(reverse('menu:dish_detail', args=[dish.pk])), '好喝')
+
+
+class DishRatingStatsTest(TestCase):
+    def setUp(self):
+        tagged_cache.clear()
+        self.user = User.objects.create_user(username='rater', password='pass')
+        self.dish = Dish.objects.create(name_zh='排骨飯', name_en='Pork Chop Rice', price=90)
+        order = Order.objects.create(consumer=self.user, total_price=90, state=Order.State.FINISHED)
+        self.item = OrderItem.objects.create(order=order, dish=self.dish, quantity=1, unit_price=90)
 
+    def _stats(self):
+        return Dish.objects.select_related('rating_stats').get(pk=self.dish.pk).rating_stats
+
+    def test_review_create_update_delete_maintains_stats(self):
+        from reviews.models import DishReview
+        review = DishReview.objects.create(user=self.user, order_item=self.item, rating=4)
+        stats = self._stats()
+        self.assertEqual((stats.rating_count, stats.rating_sum, stats.stars_4), (1, 4, 1))
+
+        DishReview.objects.update_or_create(
+            user=self.user, order_item=self.item, defaults={'rating': 2}
+        )
+        stats = self._stats()
+        self.assertEqual((stats.rating_count, stats.rating_sum), (1, 2))
+        self.assertEqual((stats.stars_4, stats.stars_2), (0, 1))
+
+        review.delete()
+        stats = self._stats()
+        self.assertEqual((stats.rating_count, stats.rating_sum, stats.stars_2), (0, 0, 0))
+        self.assertIsNone(stats.average)
+
+    def test_review_moving_to_another_dish_moves_stats(self):
+        from reviews.models import DishReview
+        other = Dish.objects.create(name_zh='雞腿飯', name_en='Chicken Leg Rice', price=95)
+        order = Order.objects.create(consumer=self.user, total_price=95, state=Order.State.FINISHED)
+        other_item = OrderItem.objects.create(order=order, dish=other, quantity=1, unit_price=95)
+        review = DishReview.objects.create(user=self.user, order_item=self.item, rating=4)
+        old_version = tagged_cache.get_tag_versions([dish_tag(self.dish.pk)])
+
+        review.order_item = other_item
+        review.save()
+        self.assertEqual(self._stats().rating_count, 0)
+        self.assertEqual(other.rating_stats.rating_sum, 4)
+        self.assertNotEqual(tagged_cache.get_tag_versions([dish_tag(self.dish.pk)]), old_version)
+
+        # 訂單項目本身改成另一道菜
+        other_item.dish = self.dish
+        other_item.save()
+        stats = self._stats()
+        self.assertEqual((stats.rating_count, stats.stars_4), (1, 1))
+        other.rating_stats.refresh_from_db()
+        self.assertEqual(other.rating_stats.rating_count, 0)
+
+    def test_stats_roll_back_with_callers_transaction(self):
+        from unittest.mock import patch
+        from django.db import transaction
+        from reviews.models import DishReview
+        with patch.object(DishRatingStats, 'apply_delta', side_effect=RuntimeError), transaction.atomic():
+            with self.assertRaises(RuntimeError):
+                DishReview.objects.create(user=self.user, order_item=self.item, rating=4)
+            # 統計失敗時整個交易標記為 rollback，呼叫端攔下例外也不會只留下評論
+            self.assertTrue(transaction.get_rollback())
+        self.assertFalse(DishReview.objects.exists())
+
+    def test_rebuild_rating_stats_command(self):
+        from django.core.management import call_command
+        from reviews.models import DishReview
+        DishReview.objects.create(user=self.user, order_item=self.item, rating=5)
+        DishRatingStats.objects.all().delete()
+
+        call_command('rebuild_rating_stats', stdout=StringIO())
+        stats = self._stats()
+        self.assertEqual((stats.rating_count, stats.rating_sum, stats.stars_5), (1, 5, 1))
+        self.assertEqual(self.dish.average_rating(), 5.0)
+
+    def test_dish_list_rating_queries_do_not_grow_with_dishes(self):
+        from reviews.models import DishReview
+        DishReview.objects.create(user=self.user, order_item=self.item, rating=3)
+
+        with CaptureQueriesContext(connection) as single:
+            response = self.client.get(reverse('menu:dish_list'))
+        self.assertContains(response, '3.0 / 5')
+
+        for i in range(5):
+            Dish.objects.create(name_zh=f'菜{i}', name_en=f'Dish {i}', price=10)
+        tagged_cache.clear()
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(reverse('menu:dish_list'))
+        self.assertEqual(len(single), len(many))
+
+
+class DishSearchTest(TestCase):
+    def setUp(self):
+        tagged_cache.clear()
+        self.braised = Dish.objects.create(name_zh='滷肉飯', name_en='Braised Pork Rice', price=50)
+        self.curry = Dish.objects.create(
+            name_zh='咖哩飯', name_en='Curry Rice', description_en='Mild pork curry', price=100
+        )
+        self.soup = Dish.objects.create(name_zh='貢丸湯', name_en='Meatball Soup', price=30)
+
+    def test_tokenize_splits_cjk_into_bigrams(self):
+        from menu.utils import tokenize
+        self.assertEqual(tokenize('滷肉飯 Rice'), ['滷', '肉', '飯', '滷肉', '肉飯', 'rice'])
+        self.assertEqual(tokenize('肉飯', for_query=True), ['肉飯'])
+
+    def test_search_chinese_substring(self):
+        from menu.search import search_dish_ids
+        self.assertEqual(search_dish_ids('肉飯'), [self.braised.pk])
+        self.assertEqual(set(search_dish_ids('飯')), {self.braised.pk, self.curry.pk})
+
+    def test_search_ranks_name_matches_first(self):
+        from menu.search import search_dish_ids
+        # curry 的名稱含 rice，braised 的名稱含 pork；pork 也出現在 curry 的描述
+        self.assertEqual(search_dish_ids('pork'), [self.braised.pk, self.curry.pk])
+
+    def test_search_prefix_and_price_filter(self):
+        from menu.search import search_dish_ids
+        self.assertEqual(search_dish_ids('Curr'), [self.curry.pk])
+        cheap = Dish.objects.filter(price__lte=60)
+        self.assertEqual(search_dish_ids('rice', cheap), [self.braised.pk])
+
+    def test_search_index_follows_dish_updates(self):
+        response = self.client.get(reverse('menu:dish_list'), {'q': '貢丸'})
+        self.assertContains(response, 'Meatball Soup')
+
+        self.soup.name_zh = '魚丸湯'
+        self.soup.name_en = 'Fishball Soup'
+        self.soup.save()
+        response = self.client.get(reverse('menu:dish_list'), {'q': '貢丸'})
+        self.assertNotContains(response, 'Fishball Soup')
+        response = self.client.get(reverse('menu:dish_list'), {'q': '魚丸'})
+        self.assertContains(response, 'Fishball Soup')
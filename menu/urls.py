@@ -14,6 +14,8 @@ urlpatterns = [
     path('cart/add/<int:pk>/', views.add_to_cart, name='add_to_cart'),
     path('cart/remove/<int:pk>/', views.remove_from_cart, name='remove_from_cart'),
     path('cart/', views.cart_view, name='cart'),
+    path('cart/api/add/<int:pk>/', views.cart_add_api, name='cart_add_api'),
+    path('cart/api/remove/<int:pk>/', views.cart_remove_api, name='cart_remove_api'),
     
     # 添加結帳路徑
     path('checkout/', views.checkout, name='checkout'),
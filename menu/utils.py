@@ -1,3 +1,4 @@
+import re
 from datetime import datetime, timedelta
 
 def get_pickup_times():
@@ -11,3 +12,33 @@ def get_pickup_times():
         slot_time += timedelta(minutes=15)
 
     return pickup_times
+
+
+# === 搜尋用斷詞 ===
+
+# 中日韓文字沒有空白分詞，以單字 + 相鄰二字（bigram）建立索引
+_CJK_RUN = re.compile(r'[㐀-䶿一-鿿豈-﫿]+')
+_WORD = re.compile(r'[^\W_]+')
+
+
+def tokenize(text, for_query=False):
+    """
+    將文字切成搜尋 token：英數字以單字為單位（小寫），中文切成單字與 bigram
+    查詢時中文只取 bigram（單一字元才取單字），避免單字命中過多結果
+    """
+    tokens = []
+    text = (text or '').lower()
+    for run in _CJK_RUN.findall(text):
+        bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+        if for_query:
+            tokens.extend(bigrams or [run])
+        else:
+            tokens.extend(run)
+            tokens.extend(bigrams)
+    tokens.extend(_WORD.findall(_CJK_RUN.sub(' ', text)))
+    return tokens
+
+
+def build_search_document(*texts):
+    """組出存在 Dish.search_document 的 token 字串，供全文檢索索引使用"""
+    return ' '.join(token for text in texts for token in tokenize(text))
@@ -1,7 +1,10 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Order, OrderItem
+from .models import Order, OrderItem, DailySales, HourlySales, DishDailySales
 
 admin.site.register(Order)
 admin.site.register(OrderItem)
+admin.site.register(DailySales)
+admin.site.register(HourlySales)
+admin.site.register(DishDailySales)
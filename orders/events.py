@@ -0,0 +1,294 @@
+# orders/events.py
+"""
+訂單事件佇列
+
+結帳等請求只負責寫入訂單，commit 後發佈一筆事件（Redis Stream XADD），
+其餘副作用（訂單歷史快取失效、品項快取預熱）交給 `manage.py run_kitchen_worker` 批次處理（orders/kitchen.py），
+廚房看板與顧客頁面的即時推播直接讀同一個 stream（orders/live.py）。
+測試環境可改用 LocalQueueBackend（settings.ORDER_EVENTS_BACKEND）。
+"""
+import asyncio
+import json
+import logging
+import re
+import socket
+import threading
+import time
+import weakref
+from collections import deque
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+ORDER_CREATED = 'order_created'
+ORDER_CLAIMED = 'order_claimed'
+ORDER_COMPLETED = 'order_completed'
+ORDER_READY = 'order_ready'
+ORDER_CANCELLED = 'order_cancelled'
+
+# {事件類型: [handler(events)]}，handler 一次收到同類型的一批事件
+_handlers = {}
+
+
+def event_handler(event_type):
+    """註冊批次事件處理函式"""
+    def decorator(fn):
+        _handlers.setdefault(event_type, []).append(fn)
+        return fn
+    return decorator
+
+
+def _parse_fields(fields):
+    """Stream entry 的 fields 轉回事件 dict；空的或格式錯誤時回傳 None"""
+    try:
+        event = json.loads(fields[b'data'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return event if isinstance(event, dict) else None
+
+
+class RedisStreamBackend:
+    """Redis Stream + consumer group，worker 處理完才 XACK，處理失敗或當機的未確認事件會再被認領處理"""
+    stream = 'cloudnative_final:order_events'
+    group = 'kitchen'
+    maxlen = 100000
+    claim_idle_ms = 60000
+    reclaim_interval = 30  # 秒
+    # 推播連線共用的 asyncio client；redis.asyncio 的連線綁定建立它的 event loop，因此每個 loop 各自一個
+    _async_clients = weakref.WeakKeyDictionary()
+
+    def __init__(self, consumer=None):
+        from django_redis import get_redis_connection
+        self.redis = get_redis_connection('default')
+        self.consumer = consumer or socket.gethostname()
+        self._pending_checked = False
+        self._reclaim_cursor = '0-0'
+        self._next_reclaim = 0.0
+
+    def publish(self, event):
+        self.publish_many([event])
+
+    def publish_many(self, events):
+        # 批次狀態變更的事件放進同一個 pipeline，一次網路往返
+        pipeline = self.redis.pipeline(transaction=False)
+        for event in events:
+            pipeline.xadd(self.stream, {'data': json.dumps(event)}, maxlen=self.maxlen, approximate=True)
+        pipeline.execute()
+
+    def _ensure_group(self):
+        from redis.exceptions import ResponseError
+        try:
+            self.redis.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def read(self, count, block_ms):
+        """
+        回傳 [(message_id, event)]；啟動後先補處理自己尚未 ack 的事件，
+        之後每 reclaim_interval 秒以 XAUTOCLAIM 認領閒置超過 claim_idle_ms 的未確認事件
+        （處理失敗沒有 ack 的批次、或已經停止的 consumer 留下的事件）
+        """
+        if not self._pending_checked:
+            self._ensure_group()
+        while not self._pending_checked:
+            pending = self._xreadgroup('0', count, None)
+            if not pending:
+                self._pending_checked = True
+                break
+            # 整批都是無法解析的事件時已被 ack，繼續讀下一批
+            messages = self._decode(pending)
+            if messages:
+                return messages
+        if time.monotonic() >= self._next_reclaim:
+            messages = self._reclaim(count)
+            if messages:
+                return messages
+        return self._decode(self._xreadgroup('>', count, block_ms))
+
+    def _xreadgroup(self, stream_id, count, block_ms):
+        response = self.redis.xreadgroup(
+            self.group, self.consumer, {self.stream: stream_id}, count=count, block=block_ms,
+        )
+        return response[0][1] if response else []
+
+    def _reclaim(self, count):
+        response = self.redis.xautoclaim(
+            self.stream, self.group, self.consumer, self.claim_idle_ms,
+            start_id=self._reclaim_cursor, count=count,
+        )
+        self._reclaim_cursor, messages = response[0], response[1]
+        # 還沒掃完整個 pending 清單時下一輪繼續認領，掃完才等下一個週期
+        if self._reclaim_cursor in (b'0-0', '0-0'):
+            self._reclaim_cursor = '0-0'
+            self._next_reclaim = time.monotonic() + self.reclaim_interval
+        return self._decode(messages)
+
+    def _decode(self, messages):
+        """
+        解析事件；已被 XTRIM 刪除（fields 為空，Redis 6.2 的 XAUTOCLAIM / 讀 pending 時會出現）
+        或內容無法解析的事件直接 ack 掉，否則每次讀 pending 都會再拿到它，worker 永遠卡住
+        """
+        events, invalid = [], []
+        for message_id, fields in messages:
+            event = _parse_fields(fields)
+            if event is None:
+                invalid.append(message_id)
+            else:
+                events.append((message_id, event))
+        if invalid:
+            logger.warning(f"Skipping {len(invalid)} unreadable order events: {invalid}")
+            self.ack(invalid)
+        return events
+
+    def ack(self, message_ids):
+        if message_ids:
+            self.redis.xack(self.stream, self.group, *message_ids)
+
+    # === 即時推播（orders/live.py）：不經 consumer group，每條連線各自 XREAD ===
+    event_id_re = re.compile(r'\d+-\d+')
+
+    def is_event_id(self, value):
+        return bool(self.event_id_re.fullmatch(value))
+
+    async def alatest_id(self):
+        redis = self._get_async_redis()
+        entries = await redis.xrevrange(self.stream, count=1)
+        return entries[0][0].decode() if entries else '0-0'
+
+    async def alisten(self, last_id, block_ms):
+        redis = self._get_async_redis()
+        response = await redis.xread({self.stream: last_id}, block=block_ms)
+        messages = response[0][1] if response else []
+        events = [(message_id.decode(), _parse_fields(fields)) for message_id, fields in messages]
+        return [(event_id, event) for event_id, event in events if event is not None]
+
+    def _get_async_redis(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            import redis.asyncio
+            client = self._async_clients[loop] = redis.asyncio.from_url(settings.CACHES['default']['LOCATION'])
+        return client
+
+
+class LocalQueueBackend:
+    """
+    行程內佇列，給測試與單機開發使用
+    佇列存在 instance 上；get_backend 讓同一行程的發佈端、worker 與推播連線共用同一個 instance
+    """
+    shared = True
+    maxlen = RedisStreamBackend.maxlen
+    # 推播只需要最近的事件；斷線太久的連線從保留的最舊一筆開始補
+    history_size = 1000
+
+    def __init__(self, consumer=None):
+        self.queue = deque(maxlen=self.maxlen)
+        self.history = deque(maxlen=self.history_size)
+        # 事件 id 為發佈順序（從 1 開始），history 只保留最後 history_size 筆
+        self.last_id = 0
+        self._lock = threading.Lock()
+
+    def publish(self, event):
+        self.publish_many([event])
+
+    def publish_many(self, events):
+        with self._lock:
+            self.queue.extend(events)
+            self.history.extend(events)
+            self.last_id += len(events)
+
+    def read(self, count, block_ms):
+        events = []
+        while self.queue and len(events) < count:
+            events.append((None, self.queue.popleft()))
+        return events
+
+    def ack(self, message_ids):
+        pass
+
+    def is_event_id(self, value):
+        return value.isascii() and value.isdigit()
+
+    async def alatest_id(self):
+        return str(self.last_id)
+
+    async def alisten(self, last_id, block_ms):
+        with self._lock:
+            first_id = self.last_id - len(self.history) + 1
+            start = max(int(last_id) + 1, first_id)
+            events = [
+                (str(event_id), self.history[event_id - first_id])
+                for event_id in range(start, self.last_id + 1)
+            ]
+        if not events:
+            await asyncio.sleep(block_ms / 1000)
+        return events
+
+
+# 設定了 shared 的 backend（行程內佇列）每個行程只建立一個
+_shared_backends = {}
+
+
+@receiver(setting_changed)
+def _reset_shared_backends(setting, **kwargs):
+    if setting == 'ORDER_EVENTS_BACKEND':
+        _shared_backends.clear()
+
+
+def get_backend(consumer=None):
+    path = settings.ORDER_EVENTS_BACKEND
+    backend_class = import_string(path)
+    if not getattr(backend_class, 'shared', False):
+        return backend_class(consumer)
+    if path not in _shared_backends:
+        _shared_backends[path] = backend_class(consumer)
+    return _shared_backends[path]
+
+
+def _serialize_event(event_type, order):
+    return {
+        'type': event_type,
+        'order_id': order.order_id,
+        'consumer_id': order.consumer_id,
+        'state': order.state,
+        'state_display': order.get_state_display(),
+        'total_price': str(order.total_price),
+        'datetime': timezone.localtime(order.datetime).strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def publish_order_events(event_type, orders):
+    """交易 commit 後才發佈，worker 讀到事件時訂單一定已經寫入；同一批訂單一次發佈"""
+    events = [_serialize_event(event_type, order) for order in orders]
+    if not events:
+        return
+
+    def _publish():
+        try:
+            get_backend().publish_many(events)
+        except Exception as e:
+            # 佇列故障不影響結帳，副作用會在快取 TTL 到期後自然補上
+            logger.error(f"Publish order event failed: {e}")
+
+    transaction.on_commit(_publish)
+
+
+def publish_order_event(event_type, order):
+    publish_order_events(event_type, [order])
+
+
+def dispatch(events):
+    """依事件類型分組後交給各 handler 批次處理"""
+    by_type = {}
+    for event in events:
+        by_type.setdefault(event['type'], []).append(event)
+    for event_type, batch in by_type.items():
+        for handler in _handlers.get(event_type, []):
+            handler(batch)
@@ -0,0 +1,32 @@
+# orders/exports.py
+"""訂單匯出的資料列來源，網頁下載（orders.views.export_orders）與 manage.py export_orders 共用"""
+from common.export import CHUNK_SIZE, iterate_values
+from .models import Order, OrderItem
+
+ORDER_ITEM_HEADER = [
+    '訂單編號', '下單時間', '顧客帳號', '訂單狀態', '取餐時間',
+    '菜品', '數量', '單價', '小計', '訂單總額',
+]
+
+
+def order_item_rows(start=None, end=None, chunk_size=CHUNK_SIZE):
+    """
+    每個訂單品項一列；以 values_list 逐批讀取（PostgreSQL 為 server-side cursor，見 common.export.iterate_values），
+    不建立 model instance、也不快取整個 QuerySet
+    """
+    items = OrderItem.objects.all()
+    if start:
+        items = items.filter(order__datetime__gte=start)
+    if end:
+        items = items.filter(order__datetime__lt=end)
+
+    rows = iterate_values(items, (
+        'order__order_id', 'order__datetime', 'order__consumer__username', 'order__state',
+        'order__pickup_time', 'dish__name_zh', 'quantity', 'unit_price', 'order__total_price',
+    ), ('order_id', 'item_id'), chunk_size)
+    state_labels = dict(Order.State.choices)
+    for order_id, created, username, state, pickup_time, dish, quantity, unit_price, total in rows:
+        yield [
+            order_id, created, username, state_labels.get(state, state), pickup_time,
+            dish, quantity, unit_price, quantity * unit_price, total,
+        ]
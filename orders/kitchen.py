@@ -0,0 +1,40 @@
+# orders/kitchen.py
+"""
+kitchen worker 的事件處理函式（由 `manage.py run_kitchen_worker` 批次呼叫）
+
+結帳請求只寫入訂單並發佈 order_created；顧客訂單歷史失效與品項快取預熱都在這裡批次處理。
+看板不需要另外處理：staff_order_list 不快取，SSE 推播直接讀事件 stream（orders/live.py）。
+銷售彙總只在訂單完成時累加，留在 transition_orders 的交易內：事件佇列是至少一次投遞，
+交給 worker 重試時可能重複累加。
+"""
+import logging
+
+from common import cache as tagged_cache
+from common.cache import invalidate_tags, order_tag, user_orders_tag
+from .events import ORDER_CREATED, event_handler
+from .models import OrderItem
+from .services import serialize_order_item
+
+logger = logging.getLogger(__name__)
+
+
+@event_handler(ORDER_CREATED)
+def invalidate_order_history(events):
+    """整批新訂單的顧客訂單歷史一次失效（一次 Redis 往返），取代結帳請求內的同步失效"""
+    invalidate_tags(*{user_orders_tag(event['consumer_id']) for event in events})
+
+
+@event_handler(ORDER_CREATED)
+def warm_order_item_cache(events):
+    """一次查詢整批新訂單的品項，預先寫入訂單詳情頁快取"""
+    order_ids = {event['order_id'] for event in events}
+    items_by_order = {order_id: [] for order_id in order_ids}
+    items = OrderItem.objects.filter(order_id__in=order_ids).select_related('dish')
+    for item in items:
+        items_by_order[item.order_id].append(serialize_order_item(item))
+
+    for order_id, items_data in items_by_order.items():
+        tagged_cache.set(
+            f'order_items_{order_id}', items_data, [order_tag(order_id)], tagged_cache.ORDER_TIMEOUT
+        )
+    logger.info(f"Warmed item cache for {len(order_ids)} orders")
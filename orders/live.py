@@ -0,0 +1,67 @@
+# orders/live.py
+"""
+訂單即時推播（Server-Sent Events）
+
+每條連線直接從訂單事件 stream（orders/events.py）讀取新事件並推給瀏覽器，
+取代廚房看板整頁重新整理與顧客輪詢 order_status_api。
+需以 ASGI（CloudNative_final/asgi.py）執行，連線等待期間不佔用 worker。
+串流開始前會先歸還資料庫連線：一條 SSE 最長開 MAX_STREAM_SECONDS 秒，期間都不查資料庫，
+若一直握著連線，幾十個看板 / 顧客頁面就會用光連線池或 max_connections。
+"""
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.http import StreamingHttpResponse
+
+from .events import get_backend
+
+KEEPALIVE_MS = 15000
+# 連線最長存活時間；到期後瀏覽器 EventSource 會帶 Last-Event-ID 自動重連
+MAX_STREAM_SECONDS = 300
+
+
+def format_event(event_id, event):
+    return f"id: {event_id}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def event_stream(accept, last_id=None):
+    """產生 SSE 字串；accept(event) 決定這條連線能看到哪些事件"""
+    backend = get_backend()
+    # Last-Event-ID 由瀏覽器送來，格式不對時 XREAD 會直接出錯，改從最新事件開始
+    if not last_id or not backend.is_event_id(last_id):
+        last_id = await backend.alatest_id()
+    # 讓瀏覽器斷線後 3 秒重連
+    yield 'retry: 3000\n\n'
+
+    deadline = time.monotonic() + MAX_STREAM_SECONDS
+    while time.monotonic() < deadline:
+        events = await backend.alisten(last_id, KEEPALIVE_MS)
+        if not events:
+            yield ': keepalive\n\n'
+            continue
+        for event_id, event in events:
+            last_id = event_id
+            if accept(event):
+                yield format_event(event_id, event)
+
+
+def release_connections():
+    """關閉（使用連線池時為歸還）這條執行緒上的資料庫連線；交易中的連線留給交易自行結束"""
+    for connection in connections.all(initialized_only=True):
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+async def sse_response(request, accept):
+    # 驗證身分（request.auser()）時開的連線在串流期間用不到
+    await sync_to_async(release_connections)()
+    response = StreamingHttpResponse(
+        event_stream(accept, request.headers.get('Last-Event-ID')),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # 避免 nginx 等反向代理緩衝事件
+    response['X-Accel-Buffering'] = 'no'
+    return response
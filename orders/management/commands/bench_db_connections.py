@@ -0,0 +1,90 @@
+# orders/management/commands/bench_db_connections.py
+"""
+量測每個請求的資料庫連線成本
+
+模擬請求生命週期（request_started / request_finished 時 Django 會呼叫 close_if_unusable_or_obsolete），
+比較「每個請求新建連線」（原本沒有設定 CONN_MAX_AGE 的行為）與目前 DATABASES 設定
+（持續連線 / 連線池 / pgbouncer）下，每個請求花在連線與一次簡單查詢的時間。
+PostgreSQL 上另以 pg_backend_pid() 計算實際建立了幾條後端連線。
+"""
+import copy
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.db.utils import load_backend
+
+
+def _make_wrapper(settings_dict, alias):
+    return load_backend(settings_dict['ENGINE']).DatabaseWrapper(settings_dict, alias)
+
+
+def _per_request_settings(settings_dict):
+    settings_dict = copy.deepcopy(settings_dict)
+    settings_dict['CONN_MAX_AGE'] = 0
+    settings_dict['CONN_HEALTH_CHECKS'] = False
+    settings_dict['OPTIONS'].pop('pool', None)
+    return settings_dict
+
+
+class Command(BaseCommand):
+    help = '比較每個請求新建資料庫連線與目前連線設定（持續連線 / 連線池 / pgbouncer）的每請求成本'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='每種情境模擬的請求數')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        current = copy.deepcopy(connections[alias].settings_dict)
+        scenarios = [
+            ('每請求新建連線（CONN_MAX_AGE=0）', _per_request_settings(current)),
+            (f'目前設定（{self._describe(current)}）', current),
+        ]
+
+        self.stdout.write(f"{'情境':<40}{'平均 ms':>10}{'p95 ms':>10}{'新建連線':>10}")
+        for label, settings_dict in scenarios:
+            timings, opened = self._run(_make_wrapper(settings_dict, alias), options['requests'])
+            p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+            self.stdout.write(
+                f'{label:<40}{statistics.mean(timings) * 1000:>10.2f}{p95 * 1000:>10.2f}{opened:>10}'
+            )
+
+    def _describe(self, settings_dict):
+        if settings_dict.get('DISABLE_SERVER_SIDE_CURSORS'):
+            mode = 'pgbouncer'
+        elif settings_dict['OPTIONS'].get('pool'):
+            mode = '連線池'
+        else:
+            mode = f"CONN_MAX_AGE={settings_dict['CONN_MAX_AGE']}"
+        return mode
+
+    def _run(self, wrapper, requests):
+        connects = []
+
+        def count_connect(sender, connection, **kwargs):
+            if connection is wrapper:
+                connects.append(1)
+
+        connection_created.connect(count_connect)
+        postgres = wrapper.vendor == 'postgresql'
+        backend_pids = set()
+        timings = []
+        try:
+            for _ in range(requests):
+                started = time.perf_counter()
+                wrapper.close_if_unusable_or_obsolete()  # request_started
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT pg_backend_pid()' if postgres else 'SELECT 1')
+                    backend_pids.add(cursor.fetchone()[0])
+                wrapper.close_if_unusable_or_obsolete()  # request_finished
+                timings.append(time.perf_counter() - started)
+        finally:
+            connection_created.disconnect(count_connect)
+            wrapper.close()
+            if hasattr(wrapper, 'close_pool'):
+                wrapper.close_pool()
+        # 使用連線池時 connect() 只是向池借用，PostgreSQL 上以後端 PID 計算實際連線數
+        return timings, len(backend_pids) if postgres else len(connects)
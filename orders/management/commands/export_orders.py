@@ -0,0 +1,51 @@
+# orders/management/commands/export_orders.py
+from datetime import date, datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from common.export import CHUNK_SIZE, stream_export
+from orders.exports import ORDER_ITEM_HEADER, order_item_rows
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'日期格式錯誤（需為 YYYY-MM-DD）：{value}')
+
+
+class Command(BaseCommand):
+    help = '串流匯出訂單明細（CSV / XLSX），記憶體用量與筆數無關'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='起始日期 YYYY-MM-DD（含）')
+        parser.add_argument('--end', help='結束日期 YYYY-MM-DD（含）')
+        parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv')
+        parser.add_argument('--output', '-o', help='輸出檔案路徑（CSV 預設輸出到 stdout）')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        start = end = None
+        if options['start']:
+            start = timezone.make_aware(datetime.combine(_parse_date(options['start']), time.min))
+        if options['end']:
+            end = timezone.make_aware(
+                datetime.combine(_parse_date(options['end']) + timedelta(days=1), time.min)
+            )
+        fmt = options['format']
+        if fmt == 'xlsx' and not options['output']:
+            raise CommandError('XLSX 匯出需指定 --output')
+
+        rows = order_item_rows(start, end, chunk_size=options['chunk_size'])
+        chunks = stream_export(ORDER_ITEM_HEADER, rows, fmt)
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        mode, encoding = ('wb', None) if fmt == 'xlsx' else ('w', 'utf-8')
+        with open(options['output'], mode, encoding=encoding, newline=None if encoding is None else '') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f'已匯出至 {options["output"]}'))
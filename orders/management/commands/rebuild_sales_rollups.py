@@ -0,0 +1,58 @@
+# orders/management/commands/rebuild_sales_rollups.py
+from datetime import date, datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from orders.models import DailySales, DishDailySales, HourlySales, Order
+from orders.rollups import record_completed_orders
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'日期格式錯誤（需為 YYYY-MM-DD）：{value}')
+
+
+class Command(BaseCommand):
+    help = '從已完成訂單重建銷售彙總表（DailySales / HourlySales / DishDailySales）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='起始日期 YYYY-MM-DD（預設為最早的訂單）')
+        parser.add_argument('--end', help='結束日期 YYYY-MM-DD（含，預設為今天）')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        orders = Order.objects.filter(state=Order.State.FINISHED).order_by('order_id')
+        rollups = [DailySales.objects.all(), HourlySales.objects.all(), DishDailySales.objects.all()]
+
+        if options['start']:
+            start = _parse_date(options['start'])
+            orders = orders.filter(datetime__gte=timezone.make_aware(datetime.combine(start, time.min)))
+            rollups = [qs.filter(date__gte=start) for qs in rollups]
+        if options['end']:
+            end = _parse_date(options['end'])
+            orders = orders.filter(
+                datetime__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+            )
+            rollups = [qs.filter(date__lte=end) for qs in rollups]
+
+        count = 0
+        with transaction.atomic():
+            for qs in rollups:
+                qs.delete()
+
+            chunk = []
+            for order in orders.only('order_id', 'datetime', 'total_price').iterator(options['chunk_size']):
+                chunk.append(order)
+                if len(chunk) >= options['chunk_size']:
+                    record_completed_orders(chunk)
+                    count += len(chunk)
+                    chunk = []
+            if chunk:
+                record_completed_orders(chunk)
+                count += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f'已重建 {count} 筆完成訂單的銷售彙總'))
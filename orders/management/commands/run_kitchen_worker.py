@@ -0,0 +1,43 @@
+# orders/management/commands/run_kitchen_worker.py
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from orders.events import dispatch, get_backend
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = '消費訂單事件佇列，批次處理結帳後的副作用（訂單歷史快取失效、品項快取預熱）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='每批最多處理幾筆事件')
+        parser.add_argument('--block', type=int, default=5000, help='沒有事件時等待的毫秒數')
+        parser.add_argument('--consumer', default=None, help='consumer 名稱（預設為主機名稱）')
+        parser.add_argument('--once', action='store_true', help='處理完目前的事件就結束')
+
+    def handle(self, *args, **options):
+        backend = get_backend(options['consumer'])
+        self.stdout.write(self.style.SUCCESS('🍳 kitchen worker 啟動'))
+
+        while True:
+            events = backend.read(options['batch_size'], options['block'])
+            if not events:
+                if options['once']:
+                    break
+                continue
+
+            # 長時間執行的行程需自行回收失效的資料庫連線
+            close_old_connections()
+            try:
+                dispatch([event for _, event in events])
+            except Exception:
+                # 不 ack，閒置一段時間後會被重新認領（RedisStreamBackend.read）
+                logger.exception('Kitchen worker failed to process batch')
+                time.sleep(1)
+                continue
+            backend.ack([message_id for message_id, _ in events])
+            self.stdout.write(f'處理 {len(events)} 筆事件')
@@ -0,0 +1,60 @@
+# Generated by Django 5.2 on 2026-10-18 08:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0003_dish_search_document'),
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='日期')),
+                ('order_count', models.PositiveIntegerField(default=0, verbose_name='完成訂單數')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='營收')),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='pickup_time',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='取餐時間'),
+        ),
+        migrations.CreateModel(
+            name='HourlySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('hour', models.PositiveSmallIntegerField(verbose_name='時段（0-23）')),
+                ('order_count', models.PositiveIntegerField(default=0, verbose_name='完成訂單數')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='營收')),
+            ],
+            options={
+                'ordering': ['date', 'hour'],
+                'unique_together': {('date', 'hour')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DishDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='售出數量')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='營收')),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='menu.dish')),
+            ],
+            options={
+                'ordering': ['date', 'dish'],
+                'unique_together': {('date', 'dish')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 09:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_unfinished_queue_idx',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='認領時間'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='claimed_by',
+            field=models.CharField(blank=True, default='', max_length=32, verbose_name='製作站'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='state',
+            field=models.CharField(choices=[('finished', '已完成'), ('unfinished', '未完成'), ('preparing', '製作中')], default='unfinished', max_length=10, verbose_name='訂單狀態'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('state__in', ['unfinished', 'preparing'])), fields=['datetime', 'order_id'], name='order_open_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 09:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_order_kitchen_claims'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_open_queue_idx',
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='state',
+            field=models.CharField(choices=[('finished', '已完成'), ('unfinished', '未完成'), ('preparing', '製作中'), ('ready', '可取餐'), ('cancelled', '已取消')], default='unfinished', max_length=10, verbose_name='訂單狀態'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('state__in', ['unfinished', 'preparing', 'ready'])), fields=['datetime', 'order_id'], name='order_open_queue_idx'),
+        ),
+    ]
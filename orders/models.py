@@ -17,6 +17,12 @@ class Order(models.Model):
     class State(models.TextChoices):
         FINISHED    = 'finished',   '已完成'
         UNFINISHED  = 'unfinished', '未完成'
+        PREPARING   = 'preparing',  '製作中'
+        READY       = 'ready',      '可取餐'
+        CANCELLED   = 'cancelled',  '已取消'
+
+    # 廚房看板上顯示、還可以完成的狀態
+    OPEN_STATES = (State.UNFINISHED, State.PREPARING, State.READY)
 
     state       = models.CharField(
                       '訂單狀態',
@@ -30,8 +36,24 @@ class Order(models.Model):
                       validators=[MinValueValidator(0)]
                   )
     pickup_time = models.DateTimeField('取餐時間', null=True, blank=True)
+    # 廚房製作站認領（orders.services.claim_orders）
+    claimed_by  = models.CharField('製作站', max_length=32, blank=True, default='')
+    claimed_at  = models.DateTimeField('認領時間', null=True, blank=True)
     class Meta:
         ordering = ['-datetime']
+        # keyset 分頁：訂單歷史 (consumer, datetime, order_id)、報表 / 彙總重建 (state, datetime, order_id)
+        # 廚房看板與製作站認領只看未完成 / 製作中 / 可取餐的訂單，partial index 只含這一小部分，
+        # 完成與取消的訂單不會讓它變大
+        # 匯出與日期區間查詢不限狀態，以 datetime 為開頭
+        indexes = [
+            models.Index(fields=['consumer', 'datetime', 'order_id'], name='order_consumer_keyset_idx'),
+            models.Index(fields=['state', 'datetime', 'order_id'], name='order_state_keyset_idx'),
+            models.Index(
+                fields=['datetime', 'order_id'], name='order_open_queue_idx',
+                condition=models.Q(state__in=['unfinished', 'preparing', 'ready']),
+            ),
+            models.Index(fields=['datetime'], name='order_datetime_idx'),
+        ]
         constraints = [
             models.CheckConstraint(
                 check=models.Q(total_price__gte=0),
@@ -85,3 +107,48 @@ class OrderItem(models.Model):
         return f"訂單 #{self.order.order_id} 的品項 {self.dish.name_zh} x{self.quantity}"
 
 
+
+
+# === 銷售彙總（由 orders/rollups.py 在訂單完成時遞增維護） ===
+class DailySales(models.Model):
+    date        = models.DateField('日期', unique=True)
+    order_count = models.PositiveIntegerField('完成訂單數', default=0)
+    revenue     = models.DecimalField('營收', max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.date} 營收 NT${self.revenue} ({self.order_count} 筆)"
+
+
+class HourlySales(models.Model):
+    date        = models.DateField('日期')
+    hour        = models.PositiveSmallIntegerField('時段（0-23）')
+    order_count = models.PositiveIntegerField('完成訂單數', default=0)
+    revenue     = models.DecimalField('營收', max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['date', 'hour']
+        unique_together = ('date', 'hour')
+
+    def __str__(self):
+        return f"{self.date} {self.hour:02d}時 營收 NT${self.revenue}"
+
+
+class DishDailySales(models.Model):
+    date     = models.DateField('日期')
+    dish     = models.ForeignKey(
+                   Dish,
+                   on_delete=models.CASCADE,
+                   related_name='daily_sales'
+               )
+    quantity = models.PositiveIntegerField('售出數量', default=0)
+    revenue  = models.DecimalField('營收', max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['date', 'dish']
+        unique_together = ('date', 'dish')
+
+    def __str__(self):
+        return f"{self.date} 菜品 #{self.dish_id} x{self.quantity}"
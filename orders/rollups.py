@@ -0,0 +1,64 @@
+# orders/rollups.py
+"""
+銷售彙總維護
+
+訂單完成時（與狀態更新在同一交易內）把金額與數量累加到
+DailySales / HourlySales / DishDailySales，報表只需讀取天數等級的資料量。
+日期與時段以訂單建立時間（當地時區）計算。
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DailySales, DishDailySales, HourlySales, OrderItem
+
+
+def _increment(model, lookup, deltas):
+    """UPDATE ... SET x = x + n；沒有資料列時建立，並處理同時建立的競爭"""
+    values = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**lookup).update(**values):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        model.objects.filter(**lookup).update(**values)
+
+
+def _summarize(orders):
+    daily = defaultdict(lambda: {'order_count': 0, 'revenue': Decimal('0')})
+    hourly = defaultdict(lambda: {'order_count': 0, 'revenue': Decimal('0')})
+    by_dish = defaultdict(lambda: {'quantity': 0, 'revenue': Decimal('0')})
+
+    order_dates = {}
+    for order in orders:
+        local = timezone.localtime(order.datetime)
+        order_dates[order.order_id] = local.date()
+        for bucket in (daily[local.date()], hourly[(local.date(), local.hour)]):
+            bucket['order_count'] += 1
+            bucket['revenue'] += order.total_price
+
+    items = OrderItem.objects.filter(order_id__in=order_dates).values_list(
+        'order_id', 'dish_id', 'quantity', 'unit_price'
+    )
+    for order_id, dish_id, quantity, unit_price in items:
+        bucket = by_dish[(order_dates[order_id], dish_id)]
+        bucket['quantity'] += quantity
+        bucket['revenue'] += quantity * unit_price
+
+    return daily, hourly, by_dish
+
+
+@transaction.atomic
+def record_completed_orders(orders):
+    """把剛完成的訂單累加進彙總表；呼叫端需確保每筆訂單只記錄一次"""
+    daily, hourly, by_dish = _summarize(orders)
+    for date, deltas in daily.items():
+        _increment(DailySales, {'date': date}, deltas)
+    for (date, hour), deltas in hourly.items():
+        _increment(HourlySales, {'date': date, 'hour': hour}, deltas)
+    for (date, dish_id), deltas in by_dish.items():
+        _increment(DishDailySales, {'date': date, 'dish_id': dish_id}, deltas)
@@ -0,0 +1,207 @@
+# orders/services.py
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from menu.pricing import price_cart
+from common.cache import order_tag, user_orders_tag, invalidate_tags
+from .events import (
+    ORDER_CANCELLED, ORDER_CLAIMED, ORDER_COMPLETED, ORDER_CREATED, ORDER_READY,
+    publish_order_event, publish_order_events,
+)
+from .models import Order, OrderItem
+from .rollups import record_completed_orders
+
+
+# 冪等鍵保存時間：涵蓋使用者連點、瀏覽器重送與壓測工具的重試
+IDEMPOTENCY_TIMEOUT = 60 * 10
+IDEMPOTENCY_WAIT = 3
+_PENDING = 'pending'
+
+# 製作站一次最多認領的訂單數；認領超過 CLAIM_TIMEOUT 秒仍未完成（製作站當機、離線）會退回佇列
+MAX_CLAIM = 20
+CLAIM_TIMEOUT = 60 * 15
+
+
+class CheckoutError(Exception):
+    """購物車無法結帳（例如空的或菜品都已不存在）"""
+
+
+class CheckoutInProgress(CheckoutError):
+    """同一個冪等鍵的結帳仍在處理中"""
+
+
+@transaction.atomic
+def create_order(user, cart, pickup_time=None):
+    """
+    將購物車 {dish_id: 數量} 轉成 Order + OrderItem
+
+    計價與購物車頁面共用 menu.pricing.price_cart（菜品快照，最多一次查詢），
+    之後只有建立 Order（總價已先算好）與 bulk_create 所有 OrderItem，與購物車品項數無關。
+    已刪除或下架的菜品不會成立訂單；單價在此刻複製到 OrderItem，之後菜品改價不影響已成立的訂單。
+    """
+    # 成立訂單以 Redis 上的最新快照為準，不沿用行程內 L1 可能延遲數秒的版本
+    priced = price_cart(cart, local=False)
+    if not priced:
+        raise CheckoutError("購物車是空的，無法結帳。")
+
+    order = Order.objects.create(
+        consumer=user,
+        state=Order.State.UNFINISHED,
+        total_price=priced.total,
+        pickup_time=pickup_time,
+    )
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order, dish_id=line['dish']['dish_id'],
+            quantity=line['quantity'], unit_price=line['dish']['price'],
+        )
+        for line in priced.lines
+    ])
+    # 其餘副作用交給 kitchen worker（orders/kitchen.py）
+    publish_order_event(ORDER_CREATED, order)
+    return order
+
+
+def _invalidate_orders(orders):
+    # queryset.update() 不會觸發 post_save，需自行讓快取失效
+    tags = {tag for order in orders for tag in (order_tag(order.order_id), user_orders_tag(order.consumer_id))}
+    invalidate_tags(*tags)
+
+
+@transaction.atomic
+def claim_orders(station, count):
+    """
+    製作站認領最舊的 count 筆待製作訂單（含認領逾時的訂單），回傳認領到的訂單
+
+    SELECT ... FOR UPDATE SKIP LOCKED：其他製作站正在認領的資料列直接跳過而不是等待鎖，
+    多個製作站同時認領時各自拿到不同的訂單，彼此不排隊；再以條件式 UPDATE 轉為製作中。
+    """
+    now = timezone.now()
+    claimable = (
+        Q(state=Order.State.UNFINISHED)
+        | Q(state=Order.State.PREPARING, claimed_at__lt=now - timedelta(seconds=CLAIM_TIMEOUT))
+    )
+    orders = list(
+        Order.objects.filter(claimable)
+        .order_by('datetime', 'order_id')
+        .select_for_update(skip_locked=True)[:min(count, MAX_CLAIM)]
+    )
+    if not orders:
+        return []
+
+    Order.objects.filter(claimable, pk__in=[order.pk for order in orders]).update(
+        state=Order.State.PREPARING, claimed_by=station, claimed_at=now
+    )
+    for order in orders:
+        order.state, order.claimed_by, order.claimed_at = Order.State.PREPARING, station, now
+    publish_order_events(ORDER_CLAIMED, orders)
+    _invalidate_orders(orders)
+    return orders
+
+
+# 批次狀態變更：目標狀態 → (允許的來源狀態, 事件類型)
+TRANSITIONS = {
+    Order.State.FINISHED: (Order.OPEN_STATES, ORDER_COMPLETED),
+    Order.State.READY: ((Order.State.UNFINISHED, Order.State.PREPARING), ORDER_READY),
+    Order.State.CANCELLED: (Order.OPEN_STATES, ORDER_CANCELLED),
+}
+
+
+@transaction.atomic
+def transition_orders(order_ids, state, station=None):
+    """
+    批次變更訂單狀態；回傳真的由這次呼叫變更的訂單
+
+    先依主鍵順序鎖住仍可變更的資料列（多個製作站同時批次操作也不會死結），再以一個條件式 UPDATE 改狀態。
+    狀態已不允許這個變更的訂單會略過（例如已完成的訂單不能取消、銷售彙總不會重複累加）；
+    指定 station 時也略過被其他製作站認領的訂單。快取失效與事件發佈各只需一次 Redis 往返。
+    """
+    sources, event_type = TRANSITIONS[state]
+    orders = Order.objects.filter(pk__in=order_ids, state__in=sources)
+    if station is not None:
+        orders = orders.filter(Q(state=Order.State.UNFINISHED) | Q(claimed_by=station))
+    orders = list(
+        orders.order_by('order_id')
+        .select_for_update()
+        .only('order_id', 'consumer_id', 'datetime', 'state', 'total_price')
+    )
+    if not orders:
+        return []
+
+    Order.objects.filter(pk__in=[order.pk for order in orders], state__in=sources).update(state=state)
+    for order in orders:
+        order.state = state
+    if state == Order.State.FINISHED:
+        record_completed_orders(orders)
+    publish_order_events(event_type, orders)
+    _invalidate_orders(orders)
+    return orders
+
+
+def complete_orders(order_ids, station=None):
+    """批次完成訂單（見 transition_orders）"""
+    return transition_orders(order_ids, Order.State.FINISHED, station)
+
+
+def complete_order(order):
+    """完成單筆訂單；回傳是否真的由這次呼叫完成"""
+    if not complete_orders([order.pk]):
+        return False
+    order.state = Order.State.FINISHED
+    return True
+
+
+def serialize_order_item(item):
+    """訂單詳情頁與快取使用的品項資料（item 需已 select_related('dish')）"""
+    return {
+        'quantity': item.quantity,
+        'unit_price': float(item.unit_price),
+        'dish_name_zh': item.dish.name_zh,
+        'dish_name_en': item.dish.name_en,
+        'dish_image_url': item.dish.image_url,
+        'subtotal': float(item.quantity * item.unit_price)
+    }
+
+
+def _idempotency_cache_key(user, key):
+    return f'checkout_idempotency:{user.pk}:{key}'
+
+
+def create_order_once(user, cart, pickup_time=None, idempotency_key=None):
+    """
+    以冪等鍵包住 create_order，回傳 (order, created)
+
+    第一個請求以 cache.add（Redis SET NX）搶下鍵並建立訂單，完成後把 order_id 寫回；
+    重送的請求直接取回同一筆訂單，不再重跑寫入流程。
+    """
+    if not idempotency_key:
+        return create_order(user, cart, pickup_time), True
+
+    cache_key = _idempotency_cache_key(user, idempotency_key)
+    if cache.add(cache_key, _PENDING, IDEMPOTENCY_TIMEOUT):
+        try:
+            order = create_order(user, cart, pickup_time)
+        except Exception:
+            cache.delete(cache_key)
+            raise
+        cache.set(cache_key, order.order_id, IDEMPOTENCY_TIMEOUT)
+        return order, True
+
+    # 先到的請求還在寫入時，短暫等待它的結果
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    order_id = cache.get(cache_key)
+    while order_id == _PENDING and time.monotonic() < deadline:
+        time.sleep(0.1)
+        order_id = cache.get(cache_key)
+
+    if order_id is None:
+        # 先到的請求失敗並釋放了鍵，重新嘗試
+        return create_order_once(user, cart, pickup_time, idempotency_key)
+    if order_id == _PENDING:
+        raise CheckoutInProgress("訂單處理中，請稍後查看訂單紀錄。")
+    return Order.objects.get(order_id=order_id, consumer=user), False
@@ -0,0 +1,20 @@
+# orders/signals.py
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from common.cache import order_tag, user_orders_tag, invalidate_tags
+from .models import Order, OrderItem
+
+
+@receiver([post_save, post_delete], sender=Order)
+def invalidate_order_cache(sender, instance, created=False, **kwargs):
+    # 新訂單底下還沒有快取；訂單歷史的失效由 kitchen worker 處理 order_created 事件時批次進行（orders/kitchen.py），
+    # 結帳請求不必等這次 Redis 往返
+    if created:
+        return
+    invalidate_tags(order_tag(instance.order_id), user_orders_tag(instance.consumer_id))
+
+
+@receiver([post_save, post_delete], sender=OrderItem)
+def invalidate_order_item_cache(sender, instance, **kwargs):
+    invalidate_tags(order_tag(instance.order_id))
@@ -1,4 +1,4 @@
-from django.test import TestCase, Client, override_settings
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.utils import timezone
@@ -10,19 +10,32 @@ from unittest.mock import patch
 from django.http import JsonResponse
 from orders.order_tags import multiply
 from decimal import Decimal
+from menu.cart import Cart, LocalCartBackend
+from common import cache as tagged_cache
 
 User = get_user_model()
+
+
+def fresh_event_backend():
+    """丟掉行程內共用的 LocalQueueBackend，每個測試從空佇列開始"""
+    from orders import events
+    events._shared_backends.clear()
+    return events.get_backend()
+
+
 @override_settings(
     CACHES={
         'default': {
             'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
         }
     },
-    SESSION_ENGINE='django.contrib.sessions.backends.db'
+    SESSION_ENGINE='django.contrib.sessions.backends.db',
+    CART_BACKEND='menu.cart.LocalCartBackend'
 )
 
 class OrderTestCoverage(TestCase):
     def setUp(self):
+        LocalCartBackend.carts.clear()
         self.client = Client()
         self.customer = User.objects.create_user(username='customer', email='customer@example.com', password='pass')
         # self.client.force_login(self.customer)
@@ -39,18 +52,12 @@ class OrderTestCoverage(TestCase):
 
     def test_checkout_empty_cart(self):
         self.login_customer()
-        session = self.client.session
-        session['cart'] = {}
-        session.save()
-
         response = self.client.post(reverse('orders:checkout'), {'pickup_time': '立即取餐'}, follow=True)
         self.assertContains(response, "購物車是空的，無法結帳。")
 
     def test_checkout_invalid_pickup_time(self):
         self.login_customer()
-        session = self.client.session
-        session['cart'] = {str(self.dish.dish_id): 1}
-        session.save()
+        Cart(self.customer).add(self.dish.dish_id, 1)
 
         response = self.client.post(reverse('orders:checkout'), {'pickup_time': '錯的格式'}, follow=True)
         self.assertContains(response, "取餐時間格式錯誤")
@@ -96,9 +103,7 @@ class OrderTestCoverage(TestCase):
 
     def test_checkout_success(self):
         self.login_customer()
-        session = self.client.session
-        session['cart'] = {str(self.dish.dish_id): 2}
-        session.save()
+        Cart(self.customer).add(self.dish.dish_id, 2)
 
         response = self.client.post(reverse('orders:checkout'), {'pickup_time': '立即取餐'}, follow=True)
         self.assertContains(response, "結帳成功！")
@@ -187,9 +192,7 @@ class OrderTestCoverage(TestCase):
     def test_checkout_with_invalid_pickup_time_format(self):
         """測試結帳時傳入錯誤的取餐時間格式"""
         self.login_customer()
-        session = self.client.session
-        session['cart'] = {str(self.dish.dish_id): 1}
-        session.save()
+        Cart(self.customer).add(self.dish.dish_id, 1)
 
         response = self.client.post(reverse('orders:checkout'), {'pickup_time': '25:61'}, follow=True)
         self.assertContains(response, "取餐時間格式錯誤")
@@ -197,10 +200,6 @@ class OrderTestCoverage(TestCase):
     def test_checkout_with_immediate_pickup_and_cart_empty(self):
         """測試結帳時立即取餐，但購物車為空的狀況"""
         self.login_customer()
-        session = self.client.session
-        session['cart'] = {}
-        session.save()
-
         response = self.client.post(reverse('orders:checkout'), {'pickup_time': '立即取餐'}, follow=True)
         self.assertContains(response, "購物車是空的，無法結帳。")
 
@@ -212,6 +211,978 @@ class OrderTestCoverage(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, f"#{order.order_id}")
 
+class CheckoutServiceTest(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='buyer', email='buyer@example.com', password='pass')
+        self.dishes = [
+            Dish.objects.create(name_zh=f'便當{i}', name_en=f'Bento {i}', price=50 + i)
+            for i in range(20)
+        ]
+
+    def _cart(self, size):
+        return {str(dish.dish_id): 2 for dish in self.dishes[:size]}
+
+    def test_create_order_prices_items(self):
+        from orders.services import create_order
+        order = create_order(self.customer, self._cart(3))
+        self.assertEqual(order.total_price, Decimal('306.00'))
+        self.assertEqual(order.items.count(), 3)
+        self.assertEqual(
+            sorted(order.items.values_list('unit_price', flat=True)),
+            [Decimal('50.00'), Decimal('51.00'), Decimal('52.00')]
+        )
+
+    def test_create_order_skips_missing_dishes(self):
+        from orders.services import CheckoutError, create_order
+        order = create_order(self.customer, {str(self.dishes[0].dish_id): 1, '99999': 1})
+        self.assertEqual(order.items.count(), 1)
+        with self.assertRaises(CheckoutError):
+            create_order(self.customer, {'99999': 1})
+
+    def test_checkout_query_count_is_constant(self):
+        """基準：結帳查詢數不隨購物車品項數成長（菜品快照未命中時多一次查詢）"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from orders.services import create_order
+
+        counts = {}
+        for size in (1, 5, 20):
+            with CaptureQueriesContext(connection) as ctx:
+                create_order(self.customer, self._cart(size))
+            counts[size] = len([q for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']])
+        self.assertEqual(counts, {1: 3, 5: 3, 20: 3})
+
+        # 快照全部命中：只剩建立 Order 與 bulk_create
+        with CaptureQueriesContext(connection) as ctx:
+            create_order(self.customer, self._cart(20))
+        self.assertEqual(len([q for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]), 2)
+
+    def test_create_order_skips_unavailable_dishes(self):
+        from orders.services import create_order
+        self.dishes[1].is_available = False
+        self.dishes[1].save()
+        order = create_order(self.customer, self._cart(3))
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(order.total_price, Decimal('204.00'))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    SESSION_ENGINE='django.contrib.sessions.backends.db',
+    CART_BACKEND='menu.cart.LocalCartBackend'
+)
+class CheckoutIdempotencyTest(TestCase):
+    def setUp(self):
+        tagged_cache.clear()
+        LocalCartBackend.carts.clear()
+        self.customer = User.objects.create_user(username='clicker', email='clicker@example.com', password='pass')
+        self.client.force_login(self.customer)
+        self.dish = Dish.objects.create(name_zh='雞排', name_en='Fried Chicken', price=70)
+        Cart(self.customer).add(self.dish.dish_id, 1)
+
+    def test_double_submit_creates_one_order(self):
+        data = {'pickup_time': '立即取餐', 'idempotency_key': 'abc123'}
+        first = self.client.post(reverse('orders:checkout'), data)
+        second = self.client.post(reverse('orders:checkout'), data)
+
+        self.assertEqual(Order.objects.count(), 1)
+        order = Order.objects.get()
+        self.assertRedirects(first, reverse('orders:confirmation', args=[order.pk]))
+        self.assertRedirects(second, reverse('orders:confirmation', args=[order.pk]))
+
+    def test_header_key_and_distinct_keys(self):
+        self.client.post(reverse('orders:checkout'), {'pickup_time': '立即取餐'}, HTTP_IDEMPOTENCY_KEY='k1')
+        Cart(self.customer).add(self.dish.dish_id, 1)
+        self.client.post(reverse('orders:checkout'), {'pickup_time': '立即取餐'}, HTTP_IDEMPOTENCY_KEY='k2')
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_failed_checkout_releases_key(self):
+        from orders.services import CheckoutError, create_order_once
+        with self.assertRaises(CheckoutError):
+            create_order_once(self.customer, {'99999': 1}, idempotency_key='retry')
+        order, created = create_order_once(self.customer, {str(self.dish.dish_id): 1}, idempotency_key='retry')
+        self.assertTrue(created)
+
+    def test_cart_page_renders_key(self):
+        response = self.client.get(reverse('menu:cart'))
+        self.assertContains(response, 'name="idempotency_key"')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ORDER_EVENTS_BACKEND='orders.events.LocalQueueBackend'
+)
+class KitchenWorkerTest(TestCase):
+    def setUp(self):
+        tagged_cache.clear()
+        self.events = fresh_event_backend()
+        self.customer = User.objects.create_user(username='eater', email='eater@example.com', password='pass')
+        self.dish = Dish.objects.create(name_zh='水餃', name_en='Dumplings', price=60)
+
+    def test_checkout_publishes_event_after_commit(self):
+        from orders.services import create_order
+        with self.captureOnCommitCallbacks(execute=True):
+            order = create_order(self.customer, {str(self.dish.dish_id): 3})
+            self.assertEqual(len(self.events.queue), 0)
+        self.assertEqual(len(self.events.queue), 1)
+        event = self.events.queue[0]
+        self.assertEqual(event['type'], 'order_created')
+        self.assertEqual(event['order_id'], order.order_id)
+        self.assertEqual(event['consumer_id'], self.customer.id)
+        self.assertEqual(event['total_price'], '180.00')
+
+    def test_checkout_leaves_history_invalidation_to_worker(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from common.cache import user_orders_tag
+        from orders.services import create_order
+        tag = user_orders_tag(self.customer.id)
+        version = tagged_cache.get_tag_versions([tag])
+        with patch('orders.signals.invalidate_tags') as invalidate, self.captureOnCommitCallbacks(execute=True):
+            create_order(self.customer, {str(self.dish.dish_id): 1})
+        invalidate.assert_not_called()
+        self.assertEqual(tagged_cache.get_tag_versions([tag]), version)
+
+        call_command('run_kitchen_worker', once=True, stdout=StringIO())
+        self.assertNotEqual(tagged_cache.get_tag_versions([tag]), version)
+
+    def test_worker_warms_order_item_cache(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from common import cache as tagged_cache
+        from common.cache import order_tag
+        from orders.services import create_order
+        with self.captureOnCommitCallbacks(execute=True):
+            order = create_order(self.customer, {str(self.dish.dish_id): 3})
+
+        call_command('run_kitchen_worker', once=True, stdout=StringIO())
+        items = tagged_cache.get(f'order_items_{order.order_id}', [order_tag(order.order_id)])
+        self.assertEqual(items[0]['dish_name_zh'], '水餃')
+        self.assertEqual(items[0]['quantity'], 3)
+
+
+class RedisStreamBackendTest(TestCase):
+    def _backend(self):
+        from unittest.mock import MagicMock
+        from orders.events import RedisStreamBackend
+        with patch('django_redis.get_redis_connection', return_value=MagicMock()):
+            return RedisStreamBackend('worker-1')
+
+    def _entry(self, message_id, order_id):
+        import json
+        return (message_id, {b'data': json.dumps({'order_id': order_id}).encode()})
+
+    def test_read_periodically_reclaims_idle_pending_events(self):
+        backend = self._backend()
+        redis = backend.redis
+        redis.xreadgroup.return_value = []
+        redis.xautoclaim.return_value = [b'0-0', [self._entry(b'1-0', 7), (b'2-0', None)], []]
+
+        # 啟動時自己沒有未確認事件，接著認領其他 consumer 閒置的事件；已刪除的直接 ack
+        self.assertEqual(backend.read(10, 100), [(b'1-0', {'order_id': 7})])
+        redis.xack.assert_called_once_with(backend.stream, backend.group, b'2-0')
+        self.assertEqual(redis.xautoclaim.call_args.kwargs['start_id'], '0-0')
+
+        # 週期內不再認領，改讀新事件
+        redis.xreadgroup.return_value = [[backend.stream, [self._entry(b'3-0', 8)]]]
+        self.assertEqual(backend.read(10, 100), [(b'3-0', {'order_id': 8})])
+        self.assertEqual(redis.xautoclaim.call_count, 1)
+        self.assertEqual(redis.xreadgroup.call_args.args[2], {backend.stream: '>'})
+
+        with patch('orders.events.time.monotonic', return_value=backend._next_reclaim):
+            backend.read(10, 100)
+        self.assertEqual(redis.xautoclaim.call_count, 2)
+
+    def test_unreadable_entries_are_acked_and_skipped(self):
+        backend = self._backend()
+        redis = backend.redis
+        batches = [
+            [[backend.stream, [(b'1-0', None), (b'2-0', {}), (b'3-0', {b'data': b'{oops'})]]],
+            [[backend.stream, [(b'4-0', {b'data': b'[1]'}), self._entry(b'5-0', 9)]]],
+        ]
+        redis.xreadgroup.side_effect = lambda *args, **kwargs: batches.pop(0) if batches else []
+        redis.xautoclaim.return_value = [b'0-0', [], []]
+
+        with self.assertLogs('orders.events', 'WARNING'):
+            # 第一批 pending 全部無法解析：ack 後繼續讀下一批，不會卡在同一批
+            self.assertEqual(backend.read(10, 100), [(b'5-0', {'order_id': 9})])
+        self.assertEqual(
+            [call.args[2:] for call in redis.xack.call_args_list],
+            [(b'1-0', b'2-0', b'3-0'), (b'4-0',)],
+        )
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'redis://localhost:6379/0',
+    }})
+    def test_async_client_is_per_event_loop(self):
+        import asyncio
+        backend = self._backend()
+
+        async def client():
+            return backend._get_async_redis()
+
+        with patch('redis.asyncio.from_url', side_effect=lambda url: object()):
+            first, second = asyncio.run(client()), asyncio.run(client())
+            loop = asyncio.new_event_loop()
+            try:
+                same = loop.run_until_complete(client()) is loop.run_until_complete(client())
+            finally:
+                loop.close()
+        self.assertIsNot(first, second)
+        self.assertTrue(same)
+
+    def test_reclaim_continues_from_cursor_until_pending_list_is_scanned(self):
+        backend = self._backend()
+        backend._pending_checked = True
+        redis = backend.redis
+        redis.xreadgroup.return_value = []
+        redis.xautoclaim.return_value = [b'5-0', [self._entry(b'4-0', 1)], []]
+        backend.read(1, 100)
+        redis.xautoclaim.return_value = [b'0-0', [], []]
+        backend.read(1, 100)
+        self.assertEqual(redis.xautoclaim.call_args.kwargs['start_id'], b'5-0')
+
+
+@override_settings(ORDER_EVENTS_BACKEND='orders.events.LocalQueueBackend')
+class KitchenQueueTest(TestCase):
+    def setUp(self):
+        tagged_cache.clear()
+        self.events = fresh_event_backend()
+        self.customer = User.objects.create_user(username='hungry', email='hungry@example.com', password='pass')
+        self.staff = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass', role=User.Role.STAFF
+        )
+        self.dish = Dish.objects.create(name_zh='牛肉麵', name_en='Beef Noodles', price=120)
+        self.orders = []
+        for minutes_ago in (30, 20, 10):
+            order = Order.objects.create(consumer=self.customer, total_price=120)
+            Order.objects.filter(pk=order.pk).update(datetime=timezone.now() - timedelta(minutes=minutes_ago))
+            OrderItem.objects.create(order=order, dish=self.dish, quantity=1, unit_price=120)
+            self.orders.append(order.pk)
+
+    def test_stations_claim_oldest_orders_without_overlap(self):
+        from orders.services import claim_orders
+        first = [order.pk for order in claim_orders('A', 2)]
+        second = [order.pk for order in claim_orders('B', 2)]
+        self.assertEqual(first, self.orders[:2])
+        self.assertEqual(second, self.orders[2:])
+        self.assertEqual(claim_orders('C', 2), [])
+
+        order = Order.objects.get(pk=first[0])
+        self.assertEqual((order.state, order.claimed_by), (Order.State.PREPARING, 'A'))
+
+    def test_expired_claim_returns_to_queue(self):
+        from orders.services import CLAIM_TIMEOUT, claim_orders
+        claim_orders('A', 1)
+        Order.objects.filter(pk=self.orders[0]).update(
+            claimed_at=timezone.now() - timedelta(seconds=CLAIM_TIMEOUT + 1)
+        )
+        self.assertEqual([order.pk for order in claim_orders('B', 1)], [self.orders[0]])
+        self.assertEqual(Order.objects.get(pk=self.orders[0]).claimed_by, 'B')
+
+    def test_complete_skips_other_stations_and_counts_rollups_once(self):
+        from orders.models import DailySales
+        from orders.services import claim_orders, complete_orders
+        claim_orders('A', 1)
+        claim_orders('B', 1)
+        completed = complete_orders(self.orders, station='A')
+        # A 自己認領的與尚未認領的可以完成，B 認領的略過
+        self.assertEqual([order.pk for order in completed], [self.orders[0], self.orders[2]])
+        self.assertEqual(Order.objects.get(pk=self.orders[1]).state, Order.State.PREPARING)
+        self.assertEqual(complete_orders(self.orders, station='A'), [])
+        self.assertEqual(DailySales.objects.get().order_count, 2)
+
+    def test_complete_uses_one_update_for_the_batch(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from orders.services import complete_orders
+        with CaptureQueriesContext(connection) as queries:
+            complete_orders(self.orders)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "orders_order"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Order.objects.filter(state=Order.State.FINISHED).count(), 3)
+
+    def test_claim_publishes_events_and_invalidates_status(self):
+        from orders.services import claim_orders
+        self.client.force_login(self.customer)
+        url = reverse('orders:order_status_api', args=[self.orders[0]])
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            claim_orders('A', 1)
+        self.assertEqual(self.events.history[-1]['type'], 'order_claimed')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['state'], Order.State.PREPARING)
+
+    def test_kitchen_api(self):
+        self.client.force_login(self.customer)
+        self.assertEqual(self.client.post(reverse('orders:kitchen_claim'), {'station': 'A'}).status_code, 403)
+
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.post(reverse('orders:kitchen_claim')).status_code, 400)
+        response = self.client.post(reverse('orders:kitchen_claim'), {'station': 'A', 'count': 2})
+        tickets = response.json()['orders']
+        self.assertEqual([ticket['order_id'] for ticket in tickets], self.orders[:2])
+        self.assertEqual(tickets[0]['items'], [{'dish': '牛肉麵', 'quantity': 1}])
+
+        response = self.client.post(reverse('orders:kitchen_complete'), {
+            'station': 'B', 'order_id': self.orders,
+        })
+        self.assertEqual(response.json(), {'completed': [self.orders[2]], 'skipped': self.orders[:2]})
+
+    def test_mark_order_complete_missing_order(self):
+        url = reverse('orders:mark_order_complete', args=[self.orders[0]])
+        self.assertEqual(self.client.post(url).status_code, 403)
+        self.client.force_login(self.customer)
+        self.assertEqual(self.client.post(url).status_code, 403)
+        self.assertEqual(Order.objects.get(pk=self.orders[0]).state, Order.State.UNFINISHED)
+
+        self.client.force_login(self.staff)
+        response = self.client.post(reverse('orders:mark_order_complete', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(reverse('orders:mark_order_complete', args=[self.orders[0]]))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.get(pk=self.orders[0]).state, Order.State.FINISHED)
+
+
+@override_settings(ORDER_EVENTS_BACKEND='orders.events.LocalQueueBackend')
+class BulkOrderTransitionTest(TestCase):
+    def setUp(self):
+        tagged_cache.clear()
+        self.events = fresh_event_backend()
+        self.customer = User.objects.create_user(username='waiter', email='waiter@example.com', password='pass')
+        self.staff = User.objects.create_user(
+            username='counter', email='counter@example.com', password='pass', role=User.Role.STAFF
+        )
+        self.orders = [Order.objects.create(consumer=self.customer, total_price=50).pk for _ in range(3)]
+        self.url = reverse('orders:bulk_order_transition')
+
+    def _state(self, order_id):
+        return Order.objects.get(pk=order_id).state
+
+    def test_single_update_and_one_event_batch(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from orders.services import transition_orders
+        with patch.object(self.events, 'publish_many', wraps=self.events.publish_many) as publish:
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                changed = transition_orders(self.orders, Order.State.READY)
+        self.assertEqual(len(changed), 3)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "orders_order"')]
+        self.assertEqual(len(updates), 1)
+        publish.assert_called_once()
+        self.assertEqual([event['type'] for event in self.events.history], ['order_ready'] * 3)
+
+    def test_disallowed_transitions_are_skipped(self):
+        from orders.models import DailySales
+        from orders.services import transition_orders
+        transition_orders(self.orders[:1], Order.State.FINISHED)
+        # 已完成的訂單不能取消、也不能回到可取餐；銷售彙總只計一次
+        self.assertEqual(transition_orders(self.orders[:1], Order.State.CANCELLED), [])
+        self.assertEqual(transition_orders(self.orders[:1], Order.State.READY), [])
+        self.assertEqual(transition_orders(self.orders[:1], Order.State.FINISHED), [])
+        self.assertEqual(DailySales.objects.get().order_count, 1)
+
+        transition_orders(self.orders[1:2], Order.State.READY)
+        self.assertEqual(len(transition_orders(self.orders[1:2], Order.State.CANCELLED)), 1)
+        self.assertEqual(self._state(self.orders[1]), Order.State.CANCELLED)
+        self.assertEqual(DailySales.objects.get().order_count, 1)
+
+    def test_bulk_endpoint_returns_json_for_in_place_update(self):
+        self.client.force_login(self.customer)
+        self.assertEqual(self.client.post(self.url, {'state': 'ready', 'order_id': self.orders}).status_code, 403)
+
+        self.client.force_login(self.staff)
+        self.assertContains(self.client.get(reverse('orders:staff_order_list')), self.url)
+        self.assertEqual(self.client.post(self.url, {'state': 'eaten', 'order_id': self.orders}).status_code, 400)
+        self.assertEqual(self.client.post(self.url, {'state': 'ready', 'order_id': 'x'}).status_code, 400)
+
+        self.client.post(self.url, {'state': 'finished', 'order_id': self.orders[:1]})
+        response = self.client.post(self.url, {'state': 'cancelled', 'order_id': self.orders})
+        self.assertEqual(response.json(), {
+            'state': 'cancelled', 'state_display': '已取消',
+            'changed': self.orders[1:], 'skipped': self.orders[:1],
+        })
+
+        # 完成與取消的訂單離開看板
+        board = self.client.get(reverse('orders:staff_order_list'), {'format': 'json'})
+        self.assertEqual(board.json()['results'], [])
+
+    def test_customer_status_reflects_bulk_change(self):
+        from orders.services import transition_orders
+        self.client.force_login(self.customer)
+        status_url = reverse('orders:order_status_api', args=[self.orders[0]])
+        etag = self.client.get(status_url)['ETag']
+        transition_orders(self.orders, Order.State.READY)
+        response = self.client.get(status_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['state_display'], '可取餐')
+
+
+@override_settings(ORDER_EVENTS_BACKEND='orders.events.LocalQueueBackend')
+class OrderLiveEventsTest(TestCase):
+    def setUp(self):
+        self.events = fresh_event_backend()
+        self.customer = User.objects.create_user(username='watcher', email='watcher@example.com', password='pass')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='pass')
+        self.staff = User.objects.create_user(
+            username='cook', email='cook@example.com', password='pass', role=User.Role.STAFF
+        )
+
+    def _publish(self, consumer, total):
+        self.events.publish({'type': 'order_created', 'order_id': total, 'consumer_id': consumer.pk})
+
+    async def _first_events(self, url):
+        response = await self.async_client.get(url, headers={'Last-Event-ID': '0'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = []
+        async for chunk in response.streaming_content:
+            chunks.append(chunk.decode())
+            if 'keepalive' in chunks[-1]:
+                break
+        return ''.join(chunks)
+
+    async def test_customer_stream_only_sees_own_orders(self):
+        from asgiref.sync import sync_to_async
+        await self.async_client.aforce_login(self.customer)
+        await sync_to_async(self._publish)(self.customer, 1)
+        await sync_to_async(self._publish)(self.other, 2)
+        with patch('orders.live.KEEPALIVE_MS', 10):
+            body = await self._first_events(reverse('orders:order_events'))
+        self.assertIn('event: order_created', body)
+        self.assertIn('"order_id": 1', body)
+        self.assertNotIn('"order_id": 2', body)
+
+    async def test_local_history_is_bounded_and_per_instance(self):
+        from orders.events import LocalQueueBackend
+        with patch.object(LocalQueueBackend, 'history_size', 2):
+            backend = LocalQueueBackend()
+        backend.publish_many([{'n': n} for n in range(1, 6)])
+        self.assertEqual(await backend.alatest_id(), '5')
+        # 只保留最後 2 筆，落後太多的連線從保留的最舊一筆補起
+        self.assertEqual(await backend.alisten('0', 10), [('4', {'n': 4}), ('5', {'n': 5})])
+        self.assertEqual(await backend.alisten('4', 10), [('5', {'n': 5})])
+        self.assertEqual(len(LocalQueueBackend().history), 0)
+
+    async def test_malformed_last_event_id_starts_from_latest(self):
+        from asgiref.sync import sync_to_async
+        await self.async_client.aforce_login(self.customer)
+        await sync_to_async(self._publish)(self.customer, 1)
+        with patch('orders.live.KEEPALIVE_MS', 10):
+            response = await self.async_client.get(
+                reverse('orders:order_events'), headers={'Last-Event-ID': '1-0; DROP'}
+            )
+            body = ''
+            async for chunk in response.streaming_content:
+                body += chunk.decode()
+                if 'keepalive' in body:
+                    break
+        # 不拋錯，從最新事件之後開始推播
+        self.assertNotIn('"order_id": 1', body)
+
+    def test_redis_backend_accepts_only_stream_ids(self):
+        from unittest.mock import MagicMock
+        from orders.events import RedisStreamBackend
+        with patch('django_redis.get_redis_connection', return_value=MagicMock()):
+            backend = RedisStreamBackend()
+        self.assertTrue(backend.is_event_id('1700000000000-0'))
+        for value in ('0', '$', '1-0\n', '1-x', ''):
+            self.assertFalse(backend.is_event_id(value))
+
+    async def test_staff_stream_requires_staff(self):
+        await self.async_client.aforce_login(self.customer)
+        response = await self.async_client.get(reverse('orders:staff_order_events'))
+        self.assertEqual(response.status_code, 403)
+
+    async def test_staff_stream_sees_all_orders(self):
+        from asgiref.sync import sync_to_async
+        await self.async_client.aforce_login(self.staff)
+        await sync_to_async(self._publish)(self.customer, 1)
+        await sync_to_async(self._publish)(self.other, 2)
+        with patch('orders.live.KEEPALIVE_MS', 10):
+            body = await self._first_events(reverse('orders:staff_order_events'))
+        self.assertIn('"order_id": 1', body)
+        self.assertIn('"order_id": 2', body)
+
+
+@override_settings(ORDER_EVENTS_BACKEND='orders.events.LocalQueueBackend')
+class OrderLiveConnectionTest(TransactionTestCase):
+    async def test_stream_does_not_hold_db_connection(self):
+        from asgiref.sync import sync_to_async
+        from django.db import connections
+
+        def open_connections():
+            return [c.alias for c in connections.all(initialized_only=True) if c.connection is not None]
+
+        staff = await User.objects.acreate_user(
+            username='cook', email='cook@example.com', password='pass', role=User.Role.STAFF
+        )
+        await self.async_client.aforce_login(staff)
+        # SQLite 記憶體資料庫的 close() 不會真的斷線，改以紀錄 close() 呼叫模擬歸還連線
+        sqlite_wrapper = type(connections['default'])
+        closed = []
+        with patch.object(sqlite_wrapper, 'close', autospec=True, side_effect=lambda c: closed.append(c.alias)), \
+                patch('orders.live.KEEPALIVE_MS', 10):
+            response = await self.async_client.get(reverse('orders:staff_order_events'))
+            # 串流開始送出前（驗證身分時查過資料庫）連線已經歸還
+            self.assertIn('default', closed)
+            self.assertLessEqual(set(await sync_to_async(open_connections)()), set(closed))
+            async for chunk in response.streaming_content:
+                if b'keepalive' in chunk:
+                    break
+
+
+class SalesRollupTest(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='diner', email='diner@example.com', password='pass')
+        self.dish = Dish.objects.create(name_zh='炒麵', name_en='Fried Noodles', price=70)
+        self.staff = User.objects.create_user(
+            username='manager', email='manager@example.com', password='pass', role=User.Role.STAFF
+        )
+        self.client.force_login(self.staff)
+
+    def _order(self, qty=2):
+        order = Order.objects.create(consumer=self.customer, total_price=70 * qty)
+        OrderItem.objects.create(order=order, dish=self.dish, quantity=qty, unit_price=70)
+        return order
+
+    def test_complete_order_updates_rollups_once(self):
+        from orders.models import DailySales, DishDailySales, HourlySales
+        from orders.services import complete_order
+        order = self._order()
+        self.assertTrue(complete_order(order))
+        self.assertFalse(complete_order(order))
+        self._order(qty=1)  # 未完成的訂單不計入
+
+        today = timezone.localtime(order.datetime).date()
+        daily = DailySales.objects.get(date=today)
+        self.assertEqual((daily.order_count, daily.revenue), (1, Decimal('140.00')))
+        dish = DishDailySales.objects.get(date=today, dish=self.dish)
+        self.assertEqual((dish.quantity, dish.revenue), (2, Decimal('140.00')))
+        self.assertEqual(HourlySales.objects.get(date=today).order_count, 1)
+
+    def test_rebuild_sales_rollups_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from orders.models import DailySales
+        for qty in (1, 3):
+            order = self._order(qty)
+            order.state = Order.State.FINISHED
+            order.save()
+
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        daily = DailySales.objects.get()
+        self.assertEqual((daily.order_count, daily.revenue), (2, Decimal('280.00')))
+
+    def test_report_reads_rollups_with_constant_queries(self):
+        from orders.services import complete_order
+        for qty in (1, 2, 3):
+            complete_order(self._order(qty))
+        today = timezone.localdate()
+
+        # 登入者（staff 驗證）之外，彙總、每日、熱銷菜品、時段、顧客帳單各一次
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('orders:generate_monthly_report'), {
+                'start': today.replace(day=1).isoformat(), 'end': today.isoformat()
+            })
+        self.assertEqual(response.context['total'], Decimal('420.00'))
+        self.assertEqual(response.context['order_count'], 3)
+        self.assertContains(response, 'diner')
+        self.assertContains(response, '炒麵')
+
+    def test_report_requires_staff(self):
+        self.client.force_login(self.customer)
+        self.assertEqual(self.client.get(reverse('orders:generate_monthly_report')).status_code, 403)
+
+    def test_report_month_parameter(self):
+        response = self.client.get(reverse('orders:generate_monthly_report'), {'month': '2025-02'})
+        self.assertEqual(response.context['start'].isoformat(), '2025-02-01')
+        self.assertEqual(response.context['end'].isoformat(), '2025-02-28')
+
+
+class OrderExportTest(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='diner', email='diner@example.com', password='pass')
+        self.staff = User.objects.create_user(
+            username='chef', email='chef@example.com', password='pass', role=User.Role.STAFF
+        )
+        self.dish = Dish.objects.create(name_zh='炒麵', name_en='Fried Noodles', price=70)
+        for qty in (1, 2):
+            order = Order.objects.create(consumer=self.customer, total_price=70 * qty)
+            OrderItem.objects.create(order=order, dish=self.dish, quantity=qty, unit_price=70)
+
+    def test_export_requires_staff(self):
+        self.client.force_login(self.customer)
+        response = self.client.get(reverse('orders:export_orders'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_export_csv_streams_rows(self):
+        import csv
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('orders:export_orders'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="orders.csv"', response['Content-Disposition'])
+
+        body = b''.join(response.streaming_content).decode('utf-8-sig')
+        rows = list(csv.reader(body.splitlines()))
+        self.assertEqual(rows[0][0], '訂單編號')
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[2][3], '未完成')
+        self.assertEqual(rows[2][5:9], ['炒麵', '2', '70.00', '140.00'])
+
+    def test_export_date_range_and_bad_date(self):
+        self.client.force_login(self.staff)
+        tomorrow = (timezone.localdate() + timedelta(days=1)).isoformat()
+        response = self.client.get(reverse('orders:export_orders'), {'start': tomorrow})
+        body = b''.join(response.streaming_content).decode('utf-8-sig')
+        self.assertEqual(len(body.splitlines()), 1)
+
+        response = self.client.get(reverse('orders:export_orders'), {'start': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_xlsx_is_valid_workbook(self):
+        import io
+        import zipfile
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('orders:export_orders'), {'format': 'xlsx'})
+        workbook = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(workbook.testzip())
+        sheet = workbook.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), 3)
+        self.assertIn('炒麵', sheet)
+
+    def test_export_under_asgi_streams_chunk_by_chunk(self):
+        import asyncio
+        from django.test import AsyncRequestFactory
+        from common.export import export_response
+        pulled = []
+
+        def rows():
+            for i in range(3):
+                pulled.append(i)
+                yield [i]
+
+        request = AsyncRequestFactory().get('/')
+        with patch('common.export.ROWS_PER_FLUSH', 1):
+            response = export_response(request, 'rows', ['n'], rows())
+            self.assertTrue(response.is_async)
+
+            async def first_chunks():
+                iterator = aiter(response)
+                return [await anext(iterator), await anext(iterator)]
+
+            chunks = asyncio.run(first_chunks())
+        # 送出第二塊時只產生了第一列，其餘資料列尚未讀取
+        self.assertEqual(chunks[1], b'0\r\n')
+        self.assertEqual(pulled, [0])
+
+    async def test_export_view_under_async_client(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('orders:export_orders'))
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode('utf-8-sig')
+        self.assertEqual(len(body.splitlines()), 3)
+
+    def test_export_orders_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('export_orders', '--chunk-size', '1', stdout=out)
+        lines = out.getvalue().lstrip('\ufeff').splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn('diner', lines[1])
+
+    def test_export_without_server_side_cursors_uses_keyset_batches(self):
+        # pgbouncer（transaction pooling）模式下不能用具名 cursor，改以 keyset 分批，輸出應完全相同
+        from django.db import connection
+        from orders.exports import order_item_rows
+        expected = list(order_item_rows(chunk_size=1))
+        with patch.dict(connection.settings_dict, {'DISABLE_SERVER_SIDE_CURSORS': True}):
+            rows = list(order_item_rows(chunk_size=1))
+        self.assertEqual(rows, expected)
+        self.assertEqual(len(rows), 2)
+
+    def test_bench_db_connections_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('bench_db_connections', '--requests', '5', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn('CONN_MAX_AGE=0', lines[1])
+
+
+class OrderKeysetPaginationTest(TestCase):
+    def setUp(self):
+        tagged_cache.clear()
+        self.customer = User.objects.create_user(username='diner', email='diner@example.com', password='pass')
+        self.staff = User.objects.create_user(
+            username='chef', email='chef@example.com', password='pass', role=User.Role.STAFF
+        )
+        self.orders = [Order.objects.create(consumer=self.customer, total_price=10) for _ in range(5)]
+        # 同一時間的訂單由 order_id 決定先後
+        Order.objects.filter(pk__in=[o.pk for o in self.orders[:3]]).update(datetime=self.orders[0].datetime)
+
+    def _walk(self, url):
+        ids, cursor = [], None
+        while True:
+            params = {'format': 'json', 'page_size': 2}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.client.get(url, params).json()
+            ids += [order['order_id'] for order in data['results']]
+            cursor = data['next_cursor']
+            if not cursor:
+                return ids
+
+    def test_order_history_pages(self):
+        self.client.force_login(self.customer)
+        expected = list(Order.objects.order_by('-datetime', '-order_id').values_list('order_id', flat=True))
+        self.assertEqual(self._walk(reverse('orders:order_history')), expected)
+        # 第二次走訪由快取回應，結果相同
+        self.assertEqual(self._walk(reverse('orders:order_history')), expected)
+
+    def test_order_history_html_next_link(self):
+        self.client.force_login(self.customer)
+        response = self.client.get(reverse('orders:order_history'), {'page_size': 2})
+        self.assertEqual(len(response.context['orders']), 2)
+        self.assertTrue(response.context['page_obj'].has_next)
+        self.assertContains(response, 'cursor=')
+
+    def test_staff_board_requires_staff(self):
+        url = reverse('orders:staff_order_list')
+        self.assertEqual(self.client.get(url, {'format': 'json'}).status_code, 403)
+        self.client.force_login(self.customer)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, {'format': 'json'}).status_code, 403)
+
+    def test_staff_board_pages_only_unfinished(self):
+        Order.objects.filter(pk=self.orders[-1].pk).update(state=Order.State.FINISHED)
+        self.client.force_login(self.staff)
+        ids = self._walk(reverse('orders:staff_order_list'))
+        self.assertEqual(len(ids), 4)
+        self.assertNotIn(self.orders[-1].pk, ids)
+
+
+class OrderStatusConditionalTest(TestCase):
+    def setUp(self):
+        tagged_cache.clear()
+        self.customer = User.objects.create_user(username='poller', email='poller@example.com', password='pass')
+        self.order = Order.objects.create(consumer=self.customer, total_price=10)
+        self.url = reverse('orders:order_status_api', args=[self.order.order_id])
+        self.client.force_login(self.customer)
+
+    def test_unchanged_order_returns_304(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_state_change_returns_new_body(self):
+        etag = self.client.get(self.url)['ETag']
+        self.order.state = Order.State.FINISHED
+        self.order.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['state'], Order.State.FINISHED)
+
+    async def test_async_views_under_async_client(self):
+        await self.async_client.aforce_login(self.customer)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.json()['order_id'], self.order.order_id)
+        response = await self.async_client.get(reverse('orders:order_history'), {'format': 'json'})
+        self.assertEqual([order['order_id'] for order in response.json()['results']], [self.order.order_id])
+
+    def test_other_user_does_not_share_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        other = User.objects.create_user(username='nosy', email='nosy@example.com', password='pass')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+
+class HotQueryIndexTest(TestCase):
+    """
+    熱門查詢必須走索引，不能整表掃描
+    PostgreSQL 在測試資料量下一定會選 Seq Scan，因此先關閉 enable_seqscan，只檢查「有沒有可用的索引」
+    """
+    def setUp(self):
+        self.customer = User.objects.create_user(username='planner', email='planner@example.com', password='pass')
+        self.now = timezone.now()
+
+    def assertIndexScan(self, queryset, table):
+        from django.db import connection, transaction
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+        # PostgreSQL：Seq Scan on <table>；SQLite：SCAN <table>（SEARCH ... USING INDEX 才是索引查詢）
+        self.assertNotRegex(plan, rf'(Seq Scan on|SCAN) {table}\b', plan)
+        self.assertRegex(plan, rf'(Index (Only )?Scan using \w+ on|Bitmap Heap Scan on|SEARCH) {table}\b', plan)
+
+    def _second_page(self, queryset):
+        from common.pagination import _keyset_queryset, encode_cursor
+        from orders.views import ORDER_PAGE_KEYS
+        cursor = encode_cursor([self.now, 100])
+        return _keyset_queryset(queryset, ORDER_PAGE_KEYS, cursor, descending=True)[:21]
+
+    def test_order_history_page(self):
+        self.assertIndexScan(self._second_page(Order.objects.filter(consumer=self.customer)), 'orders_order')
+
+    def test_staff_board_page(self):
+        orders = Order.objects.filter(state__in=Order.OPEN_STATES)
+        self.assertIndexScan(self._second_page(orders), 'orders_order')
+
+    def test_kitchen_claim_queue(self):
+        orders = Order.objects.filter(state=Order.State.UNFINISHED).order_by('datetime', 'order_id')[:5]
+        self.assertIndexScan(orders, 'orders_order')
+
+    def test_report_customers_by_date_range(self):
+        from django.db.models import Count
+        orders = (
+            Order.objects
+            .filter(state=Order.State.FINISHED, datetime__gte=self.now - timedelta(days=30), datetime__lt=self.now)
+            .order_by()
+            .values('consumer_id')
+            .annotate(order_count=Count('order_id'))
+        )
+        self.assertIndexScan(orders, 'orders_order')
+
+    def test_export_date_range(self):
+        items = OrderItem.objects.filter(order__datetime__gte=self.now - timedelta(days=30), order__datetime__lt=self.now)
+        items = items.values_list('order__order_id', 'quantity')
+        # 先以 datetime 範圍找訂單再以 order_id 取品項，而不是掃過所有品項再逐筆查訂單
+        self.assertIndexScan(items, 'orders_order')
+        self.assertIndexScan(items, 'orders_orderitem')
+
+    def test_dish_reviews_newest_first(self):
+        from reviews.models import DishReview
+        reviews = DishReview.objects.filter(order_item__dish_id=1).order_by('-created')
+        self.assertIndexScan(reviews, 'reviews_dishreview')
+        self.assertIndexScan(reviews, 'orders_orderitem')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(TransactionTestCase):
+    """
+    replica 是 settings 在測試時加上的第二個 alias：另一條連線接到同一個測試資料庫（TEST MIRROR），
+    以各 alias 自己的查詢紀錄確認讀取真的送到副本、寫入與固定讀主庫的請求沒有碰到副本
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        from common import db_router
+        from django.test import RequestFactory
+        tagged_cache.clear()
+        db_router._replica_checks.clear()
+        self.addCleanup(db_router._replica_checks.clear)
+        self.factory = RequestFactory()
+        self.customer = User.objects.create_user(username='reader', email='reader@example.com', password='pass')
+        self.order = Order.objects.create(consumer=self.customer, total_price=50)
+
+    def _request(self, method='get'):
+        from importlib import import_module
+        from django.conf import settings
+        request = getattr(self.factory, method)('/')
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        return request
+
+    def _queries(self, fn):
+        """執行 fn，回傳 (結果, {alias: [SQL]})"""
+        from contextlib import ExitStack
+        from django.db import connections
+        from django.test.utils import CaptureQueriesContext
+        with ExitStack() as stack:
+            captured = {
+                alias: stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in ('default', 'replica')
+            }
+            result = fn()
+        return result, {alias: [query['sql'] for query in queries] for alias, queries in captured.items()}
+
+    def _read_orders(self, request):
+        from common.db_router import read_from_replica
+        return self._queries(lambda: read_from_replica(lambda request: list(Order.objects.all()))(request))
+
+    def test_router_reads_app_models_from_replica_and_writes_to_primary(self):
+        from common.db_router import use_database
+
+        def work():
+            with use_database('replica'):
+                orders = list(Order.objects.all())
+                # 登入者等不在 DATABASE_REPLICA_APPS 的 model 仍讀主庫
+                users = list(User.objects.filter(pk=self.customer.pk))
+                Order.objects.create(consumer=self.customer, total_price=60)
+            return orders, users
+
+        (orders, users), queries = self._queries(work)
+        self.assertEqual([order.pk for order in orders], [self.order.pk])
+        self.assertEqual(users, [self.customer])
+        # 副本上只有那一次訂單讀取；使用者查詢與寫入都在主庫
+        self.assertEqual(len(queries['replica']), 1)
+        self.assertTrue(queries['replica'][0].startswith('SELECT') and 'orders_order' in queries['replica'][0])
+        self.assertTrue(any(sql.startswith('INSERT INTO "orders_order"') for sql in queries['default']))
+        self.assertEqual(Order.objects.all().db, 'default')
+
+    def test_decorated_view_reads_from_healthy_replica(self):
+        orders, queries = self._read_orders(self._request())
+        self.assertEqual([order.pk for order in orders], [self.order.pk])
+        self.assertEqual(len(queries['replica']), 1)
+        self.assertIn('orders_order', queries['replica'][0])
+
+    def test_lagging_or_unreachable_replica_falls_back_to_primary(self):
+        from django.db import OperationalError
+        with patch('common.db_router.replica_lag', return_value=60.0):
+            _, queries = self._read_orders(self._request())
+        self.assertEqual(queries['replica'], [])
+        self.assertEqual(len(queries['default']), 1)
+
+        from common import db_router
+        db_router._replica_checks.clear()
+        with patch('common.db_router.replica_lag', side_effect=OperationalError('down')) as lag:
+            self.assertEqual(self._read_orders(self._request())[1]['replica'], [])
+            self.assertEqual(self._read_orders(self._request())[1]['replica'], [])
+        # 檢查結果在 LAG_CHECK_INTERVAL 內沿用，不會每個請求都查一次
+        self.assertEqual(lag.call_count, 1)
+
+    def test_write_pins_session_to_primary(self):
+        from django.http import HttpResponse
+        from common.db_router import replica_pinning_middleware
+        request = self._request('post')
+        replica_pinning_middleware(lambda request: HttpResponse())(request)
+        orders, queries = self._read_orders(request)
+        self.assertEqual([order.pk for order in orders], [self.order.pk])
+        self.assertEqual(queries['replica'], [])
+        self.assertEqual(len(queries['default']), 1)
+
+    def test_order_history_reads_replica_until_checkout_pins_primary(self):
+        dish = Dish.objects.create(name_zh='滷肉飯', name_en='Braised Pork Rice', price=50)
+        self.client.force_login(self.customer)
+        url = reverse('orders:order_history')
+        # 第一次由快取重算，固定讀主庫；之後以快取的訂單 ID 讀副本
+        self.client.get(url, {'format': 'json'})
+        response, queries = self._queries(lambda: self.client.get(url, {'format': 'json'}))
+        self.assertEqual([order['order_id'] for order in response.json()['results']], [self.order.pk])
+        self.assertTrue(any('orders_order' in sql for sql in queries['replica']))
+
+        self.client.post(reverse('menu:cart_add_api', args=[dish.pk]))
+        response, queries = self._queries(lambda: self.client.get(url, {'format': 'json'}))
+        self.assertEqual([order['order_id'] for order in response.json()['results']], [self.order.pk])
+        self.assertEqual(queries['replica'], [])
+        self.assertTrue(any('orders_order' in sql for sql in queries['default']))
+
+    def test_cache_fill_reads_primary(self):
+        from common.db_router import use_database
+
+        def fill():
+            with use_database('replica'):
+                return tagged_cache.get_or_compute(
+                    'replica_probe', ['replica_probe'], lambda: [o.pk for o in Order.objects.all()], 60
+                )
+
+        orders, queries = self._queries(fill)
+        self.assertEqual(orders, [self.order.pk])
+        self.assertEqual(queries['replica'], [])
+
+
 class MultiplyFilterTests(TestCase):
     def test_multiply_integers(self):
         self.assertEqual(multiply(2, 3), Decimal('6'))
@@ -20,8 +20,22 @@ urlpatterns = [
     path('order/<int:order_id>/', views.order_detail, name='order_detail'),
 
     path('generate-monthly-report/', views.generate_monthly_report, name='generate_monthly_report'),
+    path('staff/export/', views.export_orders, name='export_orders'),
 
     path('staff/order/', views.staff_order_list, name='staff_order_list'),
     path('staff/order/<int:order_id>/complete/', views.mark_order_complete, name='mark_order_complete'),
+    # 看板勾選多筆訂單一次變更狀態（完成 / 可取餐 / 取消），回傳 JSON
+    path('staff/order/transition/', views.bulk_order_transition, name='bulk_order_transition'),
+
+    # 廚房製作站工作佇列（JSON）：認領最舊的待製作訂單、批次完成
+    path('staff/kitchen/claim/', views.kitchen_claim, name='kitchen_claim'),
+    path('staff/kitchen/complete/', views.kitchen_complete, name='kitchen_complete'),
+
+    # 訂單狀態 JSON（行動裝置輪詢，支援 ETag / 304）
+    path('api/<int:order_id>/status/', views.order_status_api, name='order_status_api'),
+
+    # 即時推播（Server-Sent Events）
+    path('staff/order/events/', views.staff_order_events, name='staff_order_events'),
+    path('events/', views.order_events, name='order_events'),
     
 ]
@@ -1,5 +1,7 @@
 # orders/views.py - 修復版本
-from django.shortcuts import redirect, get_object_or_404, render
+import logging
+from django.shortcuts import aget_object_or_404, redirect, get_object_or_404, render
+from django.template.response import TemplateResponse
 from django.views import View
 from django.views.generic import DetailView
 from django.urls import reverse
@@ -10,55 +12,254 @@ from django.utils.decorators import method_decorator
 from django.urls import reverse_lazy
 from django.views.decorators.http import require_POST
 from menu.models import Dish
-from .models import Order, OrderItem
+from .models import Order, OrderItem, DailySales, HourlySales, DishDailySales
+from .services import (
+    TRANSITIONS, CheckoutError, CheckoutInProgress, claim_orders, complete_orders, create_order_once,
+    serialize_order_item, transition_orders,
+)
 from django.views.decorators.cache import never_cache
 from django.utils.timezone import now
-from django.db.models import Sum
-from datetime import datetime
+from django.db.models import Count, Sum
+from datetime import date, datetime, time, timedelta
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from common.conditional import acondition, amake_etag, revalidate
+from common.db_router import read_from_replica
+from common.decorators import staff_required
+from common.export import export_response, parse_date_range
+from common.pagination import KeysetPage, apaginate_keyset, get_page_size, paginate_keyset
+from .exports import ORDER_ITEM_HEADER, order_item_rows
+
+logger = logging.getLogger(__name__)
+
+# 訂單列表的 keyset 排序鍵（新→舊），對應 Order.Meta 的複合索引
+ORDER_PAGE_KEYS = ('datetime', 'order_id')
+
+def _order_page_json(page):
+    return JsonResponse({
+        'results': [
+            {
+                'order_id': order.order_id,
+                'state': order.state,
+                'state_display': order.get_state_display(),
+                'datetime': timezone.localtime(order.datetime).strftime('%Y-%m-%d %H:%M:%S'),
+                'total_price': float(order.total_price),
+            }
+            for order in page
+        ],
+        'next_cursor': page.next_cursor,
+    })
 
+@staff_required
 @never_cache
 def staff_order_list(request):
-    orders = Order.objects.filter(state=Order.State.UNFINISHED).order_by('-datetime')
-    return render(request, 'orders/staff_order_list.html', {'orders': orders})
+    orders = Order.objects.filter(state__in=Order.OPEN_STATES)
+    page = paginate_keyset(
+        orders, ORDER_PAGE_KEYS, request.GET.get('cursor'), get_page_size(request)
+    )
+    if request.GET.get('format') == 'json':
+        return _order_page_json(page)
+    return render(request, 'orders/staff_order_list.html', {'orders': page, 'page_obj': page})
 
+@staff_required
 @require_POST
 def mark_order_complete(request, order_id):
-    order = get_object_or_404(Order, pk=order_id)
-    order.state = Order.State.FINISHED
-    order.save()
+    # 不先讀出整筆訂單；狀態更新（條件式 UPDATE）、銷售彙總、快取失效與事件發佈都在 complete_orders 內
+    if not complete_orders([order_id]) and not Order.objects.filter(pk=order_id).exists():
+        raise Http404
     return redirect(reverse_lazy('orders:staff_order_list'))
 
+def _order_ids(request):
+    """POST 的 order_id（可重複），去除重複並保留順序；格式錯誤時回傳 None"""
+    try:
+        return list(dict.fromkeys(int(value) for value in request.POST.getlist('order_id')))
+    except ValueError:
+        return None
+
+@staff_required
+@require_POST
+def bulk_order_transition(request):
+    """
+    POST state=finished|ready|cancelled&order_id=1&order_id=2：一次變更多筆訂單（單一 UPDATE）
+    回傳 JSON 讓看板就地更新；狀態不允許變更的訂單列在 skipped
+    """
+    state = request.POST.get('state')
+    if state not in TRANSITIONS:
+        return JsonResponse({'error': f"state 必須是 {' / '.join(TRANSITIONS)}"}, status=400)
+    order_ids = _order_ids(request)
+    if order_ids is None:
+        return JsonResponse({'error': 'order_id 必須是整數'}, status=400)
+    changed = {order.order_id for order in transition_orders(order_ids, state)}
+    return JsonResponse({
+        'state': state,
+        'state_display': Order.State(state).label,
+        'changed': [order_id for order_id in order_ids if order_id in changed],
+        'skipped': [order_id for order_id in order_ids if order_id not in changed],
+    })
+
+# === 廚房製作站工作佇列（JSON API） ===
+# 每台平板以 station 識別；各站認領到的訂單互不重疊，不會兩站做同一張單（見 orders.services.claim_orders）
+KITCHEN_CLAIM_DEFAULT = 5
+
+def _station(request):
+    return request.POST.get('station', '').strip()[:32]
+
+def _kitchen_tickets(orders):
+    """製作單：訂單與品項（一次查詢取回所有品項）"""
+    items = {}
+    rows = OrderItem.objects.filter(order_id__in=[order.order_id for order in orders]).values_list(
+        'order_id', 'dish__name_zh', 'quantity'
+    )
+    for order_id, dish, quantity in rows:
+        items.setdefault(order_id, []).append({'dish': dish, 'quantity': quantity})
+    return [
+        {
+            'order_id': order.order_id,
+            'datetime': timezone.localtime(order.datetime).strftime('%Y-%m-%d %H:%M:%S'),
+            'pickup_time': order.pickup_time and timezone.localtime(order.pickup_time).strftime('%H:%M'),
+            'items': items.get(order.order_id, []),
+        }
+        for order in orders
+    ]
+
+@staff_required
+@require_POST
+def kitchen_claim(request):
+    """POST station=&count=：認領最舊的 count 筆待製作訂單"""
+    station = _station(request)
+    try:
+        count = max(1, int(request.POST.get('count', KITCHEN_CLAIM_DEFAULT)))
+    except ValueError:
+        return JsonResponse({'error': 'count 必須是整數'}, status=400)
+    if not station:
+        return JsonResponse({'error': '缺少 station'}, status=400)
+    orders = claim_orders(station, count)
+    return JsonResponse({'station': station, 'orders': _kitchen_tickets(orders)})
+
+@staff_required
+@require_POST
+def kitchen_complete(request):
+    """POST station=&order_id=1&order_id=2：批次完成，已完成或被其他製作站認領的訂單列在 skipped"""
+    station = _station(request)
+    order_ids = _order_ids(request)
+    if order_ids is None:
+        return JsonResponse({'error': 'order_id 必須是整數'}, status=400)
+    if not station:
+        return JsonResponse({'error': '缺少 station'}, status=400)
+    completed = {order.order_id for order in complete_orders(order_ids, station)}
+    return JsonResponse({
+        'completed': [order_id for order_id in order_ids if order_id in completed],
+        'skipped': [order_id for order_id in order_ids if order_id not in completed],
+    })
+
+def _report_date_range(request):
+    """
+    報表日期區間（含頭尾）：?start=YYYY-MM-DD&end=YYYY-MM-DD、?month=YYYY-MM，預設為本月
+    回傳 (start, end, 標題)
+    """
+    today = timezone.localdate()
+    start_str = request.GET.get('start')
+    end_str = request.GET.get('end')
+    month_str = request.GET.get('month')
+    try:
+        if start_str or end_str:
+            start = date.fromisoformat(start_str) if start_str else today.replace(day=1)
+            end = date.fromisoformat(end_str) if end_str else today
+            if start > end:
+                raise ValueError('start > end')
+            return start, end, f"{start:%Y-%m-%d} ~ {end:%Y-%m-%d}"
+        if month_str:
+            start = datetime.strptime(month_str, '%Y-%m').date()
+        else:
+            start = today.replace(day=1)
+    except ValueError:
+        messages.error(request, "日期格式錯誤，已改為顯示本月報表。")
+        start = today.replace(day=1)
+
+    next_month = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start, next_month - timedelta(days=1), start.strftime('%Y年%m月')
+
+# 報表是較重的彙總查詢，有讀取副本時交給副本
+@staff_required
+@read_from_replica
 def generate_monthly_report(request):
-    now = timezone.now()
-    start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    if now.month == 12:
-        end = start.replace(year=now.year+1, month=1)
-    else:
-        end = start.replace(month=now.month+1)
-
-    orders = Order.objects.filter(
-        datetime__range=(start, end)
+    """從銷售彙總表產生報表，計算量與天數成正比，與訂單數無關"""
+    start, end, title = _report_date_range(request)
+
+    daily = DailySales.objects.filter(date__range=(start, end))
+    summary = daily.aggregate(total=Sum('revenue'), order_count=Sum('order_count'))
+
+    top_dishes = (
+        DishDailySales.objects
+        .filter(date__range=(start, end))
+        .values('dish_id', 'dish__name_zh', 'dish__name_en')
+        .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+        .order_by('-revenue')[:10]
+    )
+    hourly = (
+        HourlySales.objects
+        .filter(date__range=(start, end))
+        .values('hour')
+        .annotate(order_count=Sum('order_count'), revenue=Sum('revenue'))
+        .order_by('hour')
+    )
+
+    # 顧客帳單：由資料庫分組加總，不再逐筆載入訂單
+    range_start = timezone.make_aware(datetime.combine(start, time.min))
+    range_end = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+    customers = (
+        Order.objects
+        .filter(state=Order.State.FINISHED, datetime__gte=range_start, datetime__lt=range_end)
+        .order_by()
+        .values('consumer_id', 'consumer__username')
+        .annotate(order_count=Count('order_id'), total=Sum('total_price'))
+        .order_by('-total')
     )
 
-    total = sum(o.total_price for o in orders)
     return render(request, 'orders/monthly_report.html', {
-        'orders': orders,
-        'total': total,
-        'month': now.strftime('%Y年%m月')
+        'daily': daily,
+        'top_dishes': top_dishes,
+        'hourly': hourly,
+        'customers': customers,
+        'total': summary['total'] or 0,
+        'order_count': summary['order_count'] or 0,
+        'start': start,
+        'end': end,
+        'month': title
     })
 
 
-from django.core.cache import cache
+@staff_required
+def export_orders(request):
+    """串流匯出訂單明細：?start=&end=（含頭尾）&format=csv|xlsx"""
+    try:
+        start, end = parse_date_range(request)
+    except ValueError:
+        return HttpResponseBadRequest("日期格式錯誤（需為 YYYY-MM-DD）")
+    return export_response(
+        request, 'orders', ORDER_ITEM_HEADER, order_item_rows(start, end), request.GET.get('format', 'csv')
+    )
+
+
 from django.http import JsonResponse
+from django.core.exceptions import PermissionDenied
+from .live import sse_response
+from common import cache as tagged_cache
+from common.cache import order_tag, user_orders_tag, invalidate_tags
 
 from menu.models import Dish
+from menu.cart import Cart
 from .models import Order, OrderItem
 
 @method_decorator([login_required,never_cache], name='dispatch')
 class CheckoutView(View):
     def post(self, request):
-        cart = request.session.get('cart', {})
-        if not cart:
+        cart = Cart(request.user)
+        quantities = cart.items()
+        # 表單隱藏欄位或 Idempotency-Key header；重送時直接回傳已建立的訂單
+        idempotency_key = (
+            request.POST.get('idempotency_key') or request.headers.get('Idempotency-Key')
+        )
+        if not quantities and not idempotency_key:
             messages.error(request, "購物車是空的，無法結帳。")
             return redirect('menu:cart')
 
@@ -74,41 +275,22 @@ class CheckoutView(View):
         except Exception as e:
             messages.error(request, f"取餐時間格式錯誤：{e}")
             return redirect('menu:cart')
-        # 建立 Order
-        order = Order.objects.create(
-            consumer=request.user,
-            datetime=timezone.now(),
-            state=Order.State.UNFINISHED,
-            total_price=0,
-            pickup_time=pickup_time
-        )
-
-        total = 0
-        # 建立每筆 OrderItem
-        for dish_id, qty in cart.items():
-            dish = get_object_or_404(Dish, pk=dish_id)
-            subtotal = dish.price * qty
-            total += subtotal
-
-            OrderItem.objects.create(
-                order=order,
-                dish=dish,
-                quantity=qty,
-                unit_price=dish.price
-            )
+        try:
+            order, created = create_order_once(request.user, quantities, pickup_time, idempotency_key)
+        except CheckoutInProgress as e:
+            messages.info(request, str(e))
+            return redirect('orders:order_history')
+        except CheckoutError as e:
+            messages.error(request, str(e))
+            return redirect('menu:cart')
 
-        # 更新並儲存總價
-        order.total_price = total
-        order.save()
+        if not created:
+            return redirect(reverse('orders:confirmation', args=[order.pk]))
 
-        # 清空購物車
-        request.session['cart'] = {}
-        request.session.modified = True
-        
-        # 清除用戶的訂單歷史快取（因為新增了訂單）
-        cache.delete(f'user_orders_{request.user.id}')
+        # 清空購物車（訂單歷史快取由 orders.signals 自動失效）
+        cart.clear()
 
-        messages.success(request, f"結帳成功！訂單 #{order.order_id}，總金額 NT${total}。")
+        messages.success(request, f"結帳成功！訂單 #{order.order_id}，總金額 NT${order.total_price}。")
         return redirect(reverse('orders:confirmation', args=[order.pk]))
 
 @method_decorator(login_required, name='dispatch')
@@ -123,25 +305,15 @@ def order_detail(request, order_id):
     try:
         order = get_object_or_404(Order, order_id=order_id, consumer=request.user)
         cache_key = f'order_items_{order_id}'
-        items_data = cache.get(cache_key)
+        tags = [order_tag(order_id)]
+        items_data = tagged_cache.get(cache_key, tags)
 
         if items_data is None:
-            print(f"🔴 Cache MISS: 訂單項目 {order_id}")
+            logger.debug(f"Cache MISS: 訂單項目 {order_id}")
             order_items = order.items.select_related('dish').all()
+            items_data = [serialize_order_item(item) for item in order_items]
 
-            items_data = []
-            for item in order_items:
-                items_data.append({
-
-                    'quantity': item.quantity,
-                    'unit_price': float(item.unit_price),
-                    'dish_name_zh': item.dish.name_zh,
-                    'dish_name_en': item.dish.name_en,
-                    'dish_image_url': item.dish.image_url,
-                    'subtotal': float(item.quantity * item.unit_price)
-                })
-
-            cache.set(cache_key, items_data, 120)
+            tagged_cache.set(cache_key, items_data, tags, tagged_cache.ORDER_TIMEOUT)
 
         context = {
             'order': order,
@@ -150,53 +322,72 @@ def order_detail(request, order_id):
         return render(request, 'orders/order_detail.html', context)
 
     except Exception as e:
-        print(f"❌ 訂單詳情錯誤: {e}")
+        logger.exception(f"訂單詳情錯誤: {e}")
         messages.error(request, "載入訂單詳情時發生錯誤")
         return redirect('orders:order_history')
 
 
 # === 修復後的訂單歷史 ===
+# 訂單歷史與狀態 API 為 async view：以 ASGI 執行時等待 Redis / PostgreSQL 不佔用 worker
 @login_required
-def order_history(request):
-    """修復版本：更簡單的快取實作"""
+@read_from_replica
+async def order_history(request):
+    """keyset 分頁；每一頁的訂單 ID 與下一頁游標分別快取"""
+    user = await request.auser()
+    cursor = request.GET.get('cursor')
+    page_size = get_page_size(request)
     try:
-        cache_key = f'user_orders_{request.user.id}'
-        cached_orders = cache.get(cache_key)
-        
-        if cached_orders is None:
-            print(f"🔴 Cache MISS: 用戶 {request.user.id} 的訂單歷史")
-            # 直接使用 QuerySet，不要過度序列化
-            orders = Order.objects.filter(consumer=request.user).order_by('-datetime')
-            
-            # 簡單快取：只快取訂單 ID 列表
-            order_ids = list(orders.values_list('order_id', flat=True))
-            cache.set(cache_key, order_ids, 300)  # 快取 5 分鐘
-            
-            context = {'orders': orders}
-        else:
-            print(f"🟢 Cache HIT: 用戶 {request.user.id} 的訂單歷史")
+        cache_key = f'user_orders_{user.id}_{page_size}_{cursor or "first"}'
+        computed = {}
+
+        async def load_page():
+            logger.debug(f"Cache MISS: 用戶 {user.id} 的訂單歷史")
+            computed['page'] = await apaginate_keyset(
+                Order.objects.filter(consumer=user), ORDER_PAGE_KEYS, cursor, page_size
+            )
+            # 簡單快取：只快取這一頁的訂單 ID 與下一頁游標
+            return {
+                'order_ids': [order.order_id for order in computed['page']],
+                'next_cursor': computed['page'].next_cursor,
+            }
+
+        cached_page = await tagged_cache.aget_or_compute(
+            cache_key, [user_orders_tag(user.id)], load_page, tagged_cache.ORDER_TIMEOUT
+        )
+        page = computed.get('page')
+        if page is None:
+            logger.debug(f"Cache HIT: 用戶 {user.id} 的訂單歷史")
             # 根據快取的 ID 重新查詢（保持 Django ORM 的完整性）
             orders = Order.objects.filter(
-                order_id__in=cached_orders, 
-                consumer=request.user
-            ).order_by('-datetime')
-            context = {'orders': orders}
-        
-        return render(request, 'orders/order_history.html', context)
-        
+                order_id__in=cached_page['order_ids'],
+                consumer=user
+            ).order_by('-datetime', '-order_id')
+            page = KeysetPage([order async for order in orders], cached_page['next_cursor'])
+
     except Exception as e:
-        print(f"❌ 訂單歷史錯誤: {e}")
+        logger.exception(f"訂單歷史錯誤: {e}")
         # 發生錯誤時，直接查詢資料庫
-        orders = Order.objects.filter(consumer=request.user).order_by('-datetime')
-        return render(request, 'orders/order_history.html', {'orders': orders})
+        page = await apaginate_keyset(
+            Order.objects.filter(consumer=user), ORDER_PAGE_KEYS, cursor, page_size
+        )
+
+    if request.GET.get('format') == 'json':
+        return _order_page_json(page)
+    # TemplateResponse 由 handler 在執行緒中渲染（context processor 為同步程式碼）
+    return TemplateResponse(request, 'orders/order_history.html', {'orders': page, 'page_obj': page})
 
 # === 簡化版 API 端點 ===
+async def order_status_etag(request, order_id):
+    # 訂單狀態變更時 orders.signals 會 bump order 標籤；Order 沒有更新時間欄位，只提供 ETag
+    return await amake_etag(request, [order_tag(order_id)], csrf=False)
+
 @login_required
-def order_status_api(request, order_id):
+@revalidate
+@acondition(etag_func=order_status_etag)
+async def order_status_api(request, order_id):
     """簡化版本：基本的訂單狀態查詢"""
+    order = await aget_object_or_404(Order, order_id=order_id, consumer=await request.auser())
     try:
-        order = get_object_or_404(Order, order_id=order_id, consumer=request.user)
-        
         data = {
             'order_id': order.order_id,
             'state': order.state,
@@ -210,14 +401,28 @@ def order_status_api(request, order_id):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+# === 即時推播（SSE，需以 ASGI 執行，見 orders/live.py） ===
+async def staff_order_events(request):
+    """廚房看板：推送所有訂單的新增 / 認領 / 狀態變更事件"""
+    user = await request.auser()
+    if not user.is_authenticated or user.role != user.Role.STAFF:
+        raise PermissionDenied
+    return await sse_response(request, lambda event: True)
+
+@login_required
+async def order_events(request):
+    """顧客：只推送自己訂單的事件"""
+    user = await request.auser()
+    return await sse_response(request, lambda event: event['consumer_id'] == user.pk)
+
 # === 快取管理工具函數 ===
+# Order / OrderItem 寫入時 orders.signals 會自動呼叫，這裡保留給手動清除使用
 def clear_order_cache(order_id, user_id):
     """清除特定訂單的相關快取"""
-    cache.delete(f'order_items_{order_id}')
-    cache.delete(f'user_orders_{user_id}')
+    invalidate_tags(order_tag(order_id), user_orders_tag(user_id))
     print(f"🧹 已清除訂單 {order_id} 相關快取")
 
 def clear_user_order_cache(user_id):
     """清除特定用戶的所有訂單快取"""
-    cache.delete(f'user_orders_{user_id}')
+    invalidate_tags(user_orders_tag(user_id))
     print(f"🧹 已清除用戶 {user_id} 的訂單快取")
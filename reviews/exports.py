@@ -0,0 +1,18 @@
+# reviews/exports.py
+"""菜品評論匯出的資料列來源"""
+from common.export import CHUNK_SIZE, iterate_values
+from .models import DishReview
+
+DISH_REVIEW_HEADER = ['評論編號', '評論時間', '顧客帳號', '訂單編號', '菜品', '星等', '評論內容']
+
+
+def dish_review_rows(start=None, end=None, chunk_size=CHUNK_SIZE):
+    reviews = DishReview.objects.all()
+    if start:
+        reviews = reviews.filter(created__gte=start)
+    if end:
+        reviews = reviews.filter(created__lt=end)
+    return iterate_values(reviews, (
+        'review_id', 'created', 'user__username', 'order_item__order_id',
+        'order_item__dish__name_zh', 'rating', 'comment',
+    ), ('review_id',), chunk_size)
@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-18 08:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_keyset_indexes'),
+        ('reviews', '0002_dishreview'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dishreview',
+            index=models.Index(fields=['created', 'review_id'], name='dishreview_created_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dishreview',
+            index=models.Index(fields=['rating', 'created', 'review_id'], name='dishreview_rating_keyset_idx'),
+        ),
+    ]
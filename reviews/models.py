@@ -79,6 +79,11 @@ class DishReview(models.Model):
     class Meta:
         unique_together = ('user', 'order_item')  # 同一使用者對同一道菜只能評一次
         ordering = ['-created']
+        # 評論列表 keyset 分頁：時間排序 (created, review_id)、星等排序 (rating, created, review_id)
+        indexes = [
+            models.Index(fields=['created', 'review_id'], name='dishreview_created_keyset_idx'),
+            models.Index(fields=['rating', 'created', 'review_id'], name='dishreview_rating_keyset_idx'),
+        ]
         constraints = [
             models.CheckConstraint(
                 check=models.Q(rating__gte=0) & models.Q(rating__lte=5),
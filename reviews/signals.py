@@ -0,0 +1,91 @@
+# reviews/signals.py
+"""
+隨 DishReview 增刪改維護 DishRatingStats
+
+評分差值以 transaction.atomic(savepoint=False) 併入呼叫端的交易：不另開 savepoint，
+統計更新失敗時整個交易（包含評論本身）一起 rollback，呼叫端攔下例外也不會只留下評論。
+呼叫端沒有交易（autocommit）時，加減兩筆差值至少會在同一個交易內完成。
+"""
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from common.cache import MENU_TAG, dish_tag, invalidate_tags
+from menu.models import DishRatingStats
+from orders.models import OrderItem
+from .models import DishReview
+
+
+def _stored_rating(instance):
+    """資料庫中目前的 (dish_id, rating)；記憶體中的 instance 可能已過期"""
+    if not instance.pk:
+        return None
+    return (
+        DishReview.objects
+        .filter(pk=instance.pk)
+        .values_list('order_item__dish_id', 'rating')
+        .first()
+    )
+
+
+@receiver(pre_save, sender=DishReview)
+def remember_previous_rating(sender, instance, **kwargs):
+    """更新前記下舊的評分與菜品，post_save 時才能算出差值"""
+    instance._previous = _stored_rating(instance)
+
+
+@receiver(post_save, sender=DishReview)
+def update_rating_stats_on_save(sender, instance, created, **kwargs):
+    dish_id = instance.order_item.dish_id
+    previous = getattr(instance, '_previous', None)
+    # 評論改掛到另一道菜的訂單項目時，兩道菜的詳情頁都要更新
+    invalidate_tags(dish_tag(dish_id), *([dish_tag(previous[0])] if previous else []))
+    if previous == (dish_id, instance.rating):
+        return
+
+    with transaction.atomic(savepoint=False):
+        if previous:
+            DishRatingStats.apply_delta(previous[0], previous[1], -1)
+        DishRatingStats.apply_delta(dish_id, instance.rating, +1)
+    # 菜單列表上顯示平均評分
+    invalidate_tags(MENU_TAG)
+
+
+@receiver(pre_delete, sender=DishReview)
+def remember_deleted_rating(sender, instance, **kwargs):
+    instance._previous = _stored_rating(instance)
+
+
+@receiver(post_delete, sender=DishReview)
+def update_rating_stats_on_delete(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    if previous:
+        with transaction.atomic(savepoint=False):
+            DishRatingStats.apply_delta(previous[0], previous[1], -1)
+        invalidate_tags(MENU_TAG, dish_tag(previous[0]))
+
+
+@receiver(pre_save, sender=OrderItem)
+def remember_previous_dish(sender, instance, update_fields=None, **kwargs):
+    """訂單項目改成另一道菜時，掛在上面的評論要一起移到新菜品的統計"""
+    instance._previous_dish_id = None
+    if instance.pk and (update_fields is None or 'dish' in update_fields):
+        instance._previous_dish_id = (
+            OrderItem.objects.filter(pk=instance.pk).values_list('dish_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=OrderItem)
+def move_rating_stats_with_dish(sender, instance, created, **kwargs):
+    previous_dish_id = getattr(instance, '_previous_dish_id', None)
+    if previous_dish_id is None or previous_dish_id == instance.dish_id:
+        return
+    ratings = list(DishReview.objects.filter(order_item=instance).values_list('rating', flat=True))
+    if not ratings:
+        return
+
+    with transaction.atomic(savepoint=False):
+        for rating in ratings:
+            DishRatingStats.apply_delta(previous_dish_id, rating, -1)
+            DishRatingStats.apply_delta(instance.dish_id, rating, +1)
+    invalidate_tags(MENU_TAG, dish_tag(previous_dish_id), dish_tag(instance.dish_id))
@@ -1,9 +1,10 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, RequestFactory
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from menu.models import Dish
 from orders.models import Order, OrderItem
 from reviews.models import Review, DishReview
+from reviews.views import ReviewListView
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -199,3 +200,98 @@ class ReviewTests(TestCase):
         self.assertEqual(dish_review.rating, 5)
         self.assertEqual(dish_review.comment, 'Really tasty!')
         self.assertEqual(response.status_code, 302)  # 應該重定向
+
+
+class DishReviewExportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='diner', email='diner@example.com', password='pass')
+        self.staff = User.objects.create_user(username='chef', email='chef@example.com', password='pass', role=User.Role.STAFF)
+        dish = Dish.objects.create(name_zh='牛肉麵', price=150)
+        order = Order.objects.create(consumer=self.user, total_price=150)
+        self.order_id = order.order_id
+        item = OrderItem.objects.create(order=order, dish=dish, quantity=1, unit_price=150)
+        DishReview.objects.create(user=self.user, order_item=item, rating=5, comment='湯頭好喝, 會再來')
+
+    def test_export_requires_staff(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('reviews:export_dish_reviews'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_export_csv(self):
+        import csv
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('reviews:export_dish_reviews'))
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][2:], ['diner', str(self.order_id), '牛肉麵', '5', '湯頭好喝, 會再來'])
+
+
+class ReviewListPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='diner', email='diner@example.com', password='pass')
+        order = Order.objects.create(consumer=self.user, total_price=150 * 5)
+        for rating in range(5):
+            dish = Dish.objects.create(name_zh=f'牛肉麵{rating}', price=150)
+            item = OrderItem.objects.create(order=order, dish=dish, quantity=1, unit_price=150)
+            DishReview.objects.create(user=self.user, order_item=item, rating=rating % 3)
+
+    def _walk(self, **params):
+        """依 next_cursor 走完所有頁，回傳每頁的 review_id"""
+        pages, cursor = [], None
+        while True:
+            query = dict(params, format='json', page_size=2)
+            if cursor:
+                query['cursor'] = cursor
+            data = self.client.get(reverse('reviews:review_list'), query).json()
+            pages.append([review['review_id'] for review in data['results']])
+            cursor = data['next_cursor']
+            if not cursor:
+                return pages
+
+    def test_keyset_pages_cover_all_reviews_in_order(self):
+        pages = self._walk()
+        expected = list(DishReview.objects.order_by('-created', '-review_id').values_list('review_id', flat=True))
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_keyset_pages_with_rating_sort(self):
+        pages = self._walk(sort='rating_asc')
+        expected = list(
+            DishReview.objects.order_by('rating', 'created', 'review_id').values_list('review_id', flat=True)
+        )
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_page_query_does_not_use_offset(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        first = self.client.get(reverse('reviews:review_list'), {'format': 'json', 'page_size': 2}).json()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('reviews:review_list'), {'page_size': 2, 'cursor': first['next_cursor']})
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+
+    def test_html_has_next_link_and_ignores_bad_cursor(self):
+        response = self.client.get(reverse('reviews:review_list'), {'page_size': 2, 'cursor': '!!bad'})
+        self.assertEqual(len(response.context['reviews']), 2)
+        self.assertContains(response, 'cursor=')
+
+    def _count_queries(self, params):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('reviews:review_list'), params)
+        return len(queries)
+
+    def test_review_list_query_count_is_constant(self):
+        """評論列表只有一個查詢，與每頁筆數無關（不再逐列查 user / order_item / dish）"""
+        self.client.force_login(self.user)
+        for params in ({}, {'format': 'json', 'sort': 'rating_desc'}):
+            with self.subTest(params=params):
+                small = self._count_queries(dict(params, page_size=1))
+                full = self._count_queries(dict(params, page_size=5))
+                self.assertEqual(small, full)
+
+        with self.assertNumQueries(1):
+            view = ReviewListView(request=RequestFactory().get('/'))
+            reviews = list(view.get_queryset().order_by('-created'))
+            [(r.user.username, r.order_item.order_id, r.order_item.dish.name_zh) for r in reviews]
@@ -7,5 +7,6 @@ app_name = "reviews"
 urlpatterns = [
     path('order/<int:order_id>/review/', views.add_review, name='add_review'),
     path('order/<int:order_id>', views.add_dish_review, name='add_dish_review'),
-    path('reviews/', ReviewListView.as_view(), name='review_list')
+    path('reviews/', ReviewListView.as_view(), name='review_list'),
+    path('reviews/export/', views.export_dish_reviews, name='export_dish_reviews'),
 ]
@@ -22,24 +22,46 @@ def add_review(request, order_id):
     return render(request, 'reviews/add_review.html', {'form': form})'''
 
 from django.shortcuts import render, redirect, get_object_or_404
+from django.db import transaction
 from .forms import ReviewForm, DishReviewForm
 from .models import Review, DishReview
 from orders.models import Order, OrderItem
 from django.contrib.auth.decorators import login_required
 from django.forms import formset_factory
 from django.views.generic import ListView
-
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.utils.decorators import method_decorator
+from common.db_router import read_from_replica
+from common.decorators import staff_required
+from common.export import export_response, parse_date_range
+from common.pagination import DEFAULT_PAGE_SIZE, get_page_size, paginate_keyset
+from .exports import DISH_REVIEW_HEADER, dish_review_rows
+
+# 評論列表沒有快取也沒有 ETag，讀取可交給副本（common/db_router.py）
+@method_decorator(read_from_replica, name='get')
 class ReviewListView(ListView):
     model = DishReview
     template_name = 'reviews/review_list.html'  # 你的 html 檔名
     context_object_name = 'reviews'
+    paginate_by = DEFAULT_PAGE_SIZE
+
+    # 排序方式 → (keyset 排序鍵, 是否遞減)；最後一欄為主鍵，確保游標唯一
+    SORTS = {
+        'rating_desc': (('rating', 'created', 'review_id'), True),
+        'rating_asc': (('rating', 'created', 'review_id'), False),
+        'time_asc': (('created', 'review_id'), False),
+        'time_desc': (('created', 'review_id'), True),
+    }
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        # 一次 JOIN 取回列表要顯示的欄位，避免每列再查 user / order_item / dish
+        queryset = super().get_queryset().select_related('user', 'order_item__dish').only(
+            'review_id', 'rating', 'comment', 'created',
+            'user__username', 'order_item__order_id', 'order_item__dish__name_zh',
+        )
         dish = self.request.GET.get('dish')
         order_id = self.request.GET.get('order_id')
         rating = self.request.GET.get('rating')
-        sort = self.request.GET.get('sort')
 
         if dish:
             queryset = queryset.filter(order_item__dish__name_zh__icontains=dish)
@@ -50,19 +72,37 @@ class ReviewListView(ListView):
         if rating and rating.isdigit():
             queryset = queryset.filter(rating=int(rating))
 
-        if sort == 'rating_desc':
-            queryset = queryset.order_by('-rating')
-        elif sort == 'rating_asc':
-            queryset = queryset.order_by('rating')
-        elif sort == 'time_asc':
-            queryset = queryset.order_by('created')
-        elif sort == 'time_desc':
-            queryset = queryset.order_by('-created')
-        else:
-            queryset = queryset.order_by('-created')  # 預設時間新→舊
-
         return queryset
 
+    def get_paginate_by(self, queryset):
+        return get_page_size(self.request, self.paginate_by)
+
+    def paginate_queryset(self, queryset, page_size):
+        """以 keyset 分頁取代 ListView 預設的 OFFSET 分頁，預設時間新→舊"""
+        keys, descending = self.SORTS.get(self.request.GET.get('sort'), self.SORTS['time_desc'])
+        page = paginate_keyset(queryset, keys, self.request.GET.get('cursor'), page_size, descending)
+        return None, page, page.object_list, page.has_next
+
+    def render_to_response(self, context, **response_kwargs):
+        if self.request.GET.get('format') == 'json':
+            page = context['page_obj']
+            return JsonResponse({
+                'results': [
+                    {
+                        'review_id': review.review_id,
+                        'user': review.user.username,
+                        'order_id': review.order_item.order_id,
+                        'dish': review.order_item.dish.name_zh,
+                        'rating': review.rating,
+                        'comment': review.comment,
+                        'created': review.created.isoformat(),
+                    }
+                    for review in page
+                ],
+                'next_cursor': page.next_cursor,
+            })
+        return super().render_to_response(context, **response_kwargs)
+
 @login_required
 def add_review(request, order_id):
     order = get_object_or_404(Order, order_id=order_id)
@@ -104,15 +144,17 @@ def add_dish_review(request, order_id):
         formset = DishReviewFormSet(request.POST)
 
         if formset.is_valid():
-            for form, item in zip(formset, order_items):
-                DishReview.objects.update_or_create(
-                    user=request.user,
-                    order_item=item,
-                    defaults={
-                        'rating': form.cleaned_data['rating'],
-                        'comment': form.cleaned_data['comment']
-                    }
-                )
+            # 評論與 DishRatingStats 彙總（reviews.signals）在同一交易內寫入
+            with transaction.atomic():
+                for form, item in zip(formset, order_items):
+                    DishReview.objects.update_or_create(
+                        user=request.user,
+                        order_item=item,
+                        defaults={
+                            'rating': form.cleaned_data['rating'],
+                            'comment': form.cleaned_data['comment']
+                        }
+                    )
             return redirect('orders:order_detail', order_id=order.order_id)
 
     else:
@@ -133,6 +175,17 @@ def add_dish_review(request, order_id):
         'dish_forms': dish_forms,
         'formset': formset
     })
+
+@staff_required
+def export_dish_reviews(request):
+    """串流匯出菜品評論：?start=&end=（含頭尾）&format=csv|xlsx"""
+    try:
+        start, end = parse_date_range(request)
+    except ValueError:
+        return HttpResponseBadRequest("日期格式錯誤（需為 YYYY-MM-DD）")
+    return export_response(
+        request, 'dish_reviews', DISH_REVIEW_HEADER, dish_review_rows(start, end), request.GET.get('format', 'csv')
+    )
 '''
 from django.forms import modelform_factory, modelformset_factory
 from django.shortcuts import render, redirect, get_object_or_404